@@ -0,0 +1,80 @@
+"""
+    Column matching on wide schemas: per-column fuzz.partial_ratio scan vs the column index.
+
+    Run from the project root:
+        python -m Benchmark.column_matcher --widths 17 200 1000
+"""
+import argparse
+import random
+import statistics
+import time
+
+import pandas as pd
+from fuzzywuzzy import fuzz
+
+from Services.column_matcher import ColumnMatcher
+from intent_classifier.generate_data import COLUMNS
+
+WORDS = ["revenue", "score", "region", "segment", "channel", "tenure", "income", "spend", "visits",
+         "rating", "churn", "branch", "product", "status", "limit", "credit", "savings", "fees"]
+
+
+def wide_schema(width, seed=42):
+    # The bank columns first, then made up columns up to the requested width
+    rng = random.Random(seed)
+    columns = list(COLUMNS) + ["y"]
+    while len(columns) < width:
+        columns.append(f"{rng.choice(WORDS)}_{rng.choice(WORDS)}_{len(columns)}")
+    return columns[:max(width, len(COLUMNS) + 1)]
+
+
+def fuzz_match(user_question, df_columns, threshold=70):
+    # The matcher NLPServices.match_column used before the column index
+    matched_columns = []
+    for col in df_columns:
+        score = fuzz.partial_ratio(col.lower(), user_question.lower())
+        if score >= threshold:
+            matched_columns.append((col, score))
+    matched_columns.sort(key=lambda x: x[1], reverse=True)
+    return matched_columns[0] if matched_columns else None
+
+
+def per_query_us(func, queries):
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        func(query)
+        timings.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(timings), statistics.quantiles(timings, n=100)[98]
+
+
+def run(widths, query_count):
+    queries = list(pd.read_csv("./Data/intent_dataset.csv")["query"].head(query_count))
+    for width in widths:
+        columns = wide_schema(width)
+
+        start = time.perf_counter()
+        matcher = ColumnMatcher(columns)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        fuzz_p50, fuzz_p99 = per_query_us(lambda query: fuzz_match(query, columns), queries)
+        index_p50, index_p99 = per_query_us(lambda query: matcher.best_match(query), queries)
+        # The synthetic questions name their column literally, so that is the expected answer
+        expected = [next((column for column in columns if column in query.rstrip("?").split()), None)
+                    for query in queries]
+        fuzz_accuracy = sum((fuzz_match(query, columns) or (None,))[0] == column
+                            for query, column in zip(queries, expected)) / len(queries)
+        index_accuracy = sum((matcher.best_match(query) or (None,))[0] == column
+                             for query, column in zip(queries, expected)) / len(queries)
+
+        print(f"{len(columns)} columns (index built in {build_ms:.1f} ms), {len(queries)} queries")
+        print(f"  fuzz.partial_ratio scan  p50 {fuzz_p50:10.1f} us  p99 {fuzz_p99:10.1f} us  accuracy {fuzz_accuracy:.1%}")
+        print(f"  column index             p50 {index_p50:10.1f} us  p99 {index_p99:10.1f} us  accuracy {index_accuracy:.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--widths", type=int, nargs="+", default=[17, 200, 1000])
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    run(args.widths, args.queries)
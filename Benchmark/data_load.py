@@ -0,0 +1,66 @@
+"""
+    Cold vs warm load time of the data set through the columnar cache.
+
+    Run from the project root:
+        python -m Benchmark.data_load --csv bank.csv --repeat 5
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import pandas as pd
+
+from Services.data import DataService
+
+
+def time_call(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def run(file_path, csv_file_name, repeat):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        data_service = DataService(
+            file_path=file_path,
+            zip_file_name=None,
+            csv_file_name=csv_file_name,
+            cache_dir=cache_dir,
+        )
+        csv_full_path = os.path.join(file_path, csv_file_name)
+
+        def cold_load():
+            data_service.cache_service.invalidate(csv_full_path)
+            return data_service.load_dataset()
+
+        def warm_load():
+            return data_service.load_dataset()
+
+        def plain_read_csv():
+            return pd.read_csv(csv_full_path, delimiter=';')
+
+        results = {
+            "read_csv": time_call(plain_read_csv, repeat),
+            "cold (parse + write cache)": time_call(cold_load, repeat),
+            "warm (memory-mapped cache)": time_call(warm_load, repeat),
+        }
+
+    rows = len(data_service.load_dataset())
+    print(f"{csv_file_name}: {rows} rows, median of {repeat} runs")
+    for name, seconds in results.items():
+        print(f"  {name:<30} {seconds * 1000:10.2f} ms")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", default="./Data")
+    parser.add_argument("--csv", default="bank.csv")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.path, args.csv, args.repeat)
@@ -0,0 +1,69 @@
+"""
+    Import time of the startup modules, from `python -X importtime`, checked against a budget.
+
+    Every module is imported in a fresh interpreter. The report lists the total time,
+    the heaviest imports below it and any module of constants.LAZY_IMPORTS that was
+    pulled in. Exits with 1 when a budget is exceeded or a lazy module is imported.
+
+    Run from the project root:
+        python -m Benchmark.import_time --repeat 3
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+import constants
+
+
+def import_times(module):
+    """
+    Cumulative import time (us) of every module imported by `import module`.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def run(modules, repeat, top):
+    failed = False
+    for module, budget_ms in modules.items():
+        runs = [import_times(module) for _ in range(repeat)]
+        total_ms = statistics.median(times[module] for times in runs) / 1000
+        times = runs[0]
+
+        status = "ok" if total_ms <= budget_ms else "OVER BUDGET"
+        print(f"{module}: {total_ms:.1f} ms (budget {budget_ms} ms) {status}")
+        heaviest = sorted(((cumulative, name) for name, cumulative in times.items()
+                           if "." not in name and name != module), reverse=True)[:top]
+        for cumulative, name in heaviest:
+            print(f"    {name:<30} {cumulative / 1000:8.1f} ms")
+
+        eager = sorted({name.split(".")[0] for name in times} & set(constants.LAZY_IMPORTS))
+        if eager:
+            print(f"    imported eagerly: {', '.join(eager)}")
+        failed |= total_ms > budget_ms or bool(eager)
+    return not failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--module", action="append",
+                        help="Module to measure, defaults to constants.IMPORT_TIME_BUDGET_MS")
+    args = parser.parse_args()
+
+    modules = constants.IMPORT_TIME_BUDGET_MS
+    if args.module:
+        modules = {module: modules.get(module, max(modules.values())) for module in args.module}
+    sys.exit(0 if run(modules, args.repeat, args.top) else 1)
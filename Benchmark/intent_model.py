@@ -0,0 +1,65 @@
+"""
+    Per question latency of the intent classifier: scikit-learn vs the compiled NumPy model.
+
+    Run from the project root:
+        python -m Benchmark.intent_model --queries 2000
+"""
+import argparse
+import os
+import statistics
+import time
+import warnings
+
+import pandas as pd
+
+import constants
+from intent_classifier.compiled_model import load_compiled_model
+
+
+def latencies(classifier, vectorizer, queries):
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        classifier.predict(vectorizer.transform([query]))
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        "p50": statistics.median(timings),
+        "p99": timings[int(len(timings) * 0.99) - 1],
+    }
+
+
+def run(query_count):
+    queries = pd.read_csv("./Data/intent_dataset.csv")["query"].head(query_count).tolist()
+
+    start = time.perf_counter()
+    compiled = load_compiled_model(os.path.join(constants.MODELS_DIR, constants.INTENT_COMPILED_MODEL_NAME))
+    compiled_load = time.perf_counter() - start
+
+    start = time.perf_counter()
+    # Pickles from an older scikit-learn warn on every load
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        import joblib
+        sklearn_model = (
+            joblib.load(os.path.join(constants.MODELS_DIR, constants.INTENT_MODEL_NAME)),
+            joblib.load(os.path.join(constants.MODELS_DIR, constants.INTENT_VECTORIZER_NAME)),
+        )
+    sklearn_load = time.perf_counter() - start
+
+    results = {
+        "scikit-learn": dict(load=sklearn_load, **latencies(*sklearn_model, queries)),
+        "compiled": dict(load=compiled_load, **latencies(*compiled, queries)),
+    }
+    print(f"{len(queries)} questions, one at a time")
+    for name, result in results.items():
+        print(f"  {name:<14} load {result['load'] * 1000:8.1f} ms"
+              f"   p50 {result['p50'] * 1e6:8.1f} us   p99 {result['p99'] * 1e6:8.1f} us")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+    run(args.queries)
@@ -0,0 +1,95 @@
+"""
+    Load generator for server.py: throughput and tail latency under concurrent clients.
+
+    Every client keeps one HTTP/1.1 connection open and sends questions back to back
+    until the duration is over.
+
+    Start the server, then run from the project root:
+        python -m Benchmark.load_generator --clients 32 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from collections import Counter
+
+QUERIES = [
+    "what is the average balance",
+    "total balance of married clients",
+    "how many clients are unemployed",
+    "average age by job",
+    "count of clients by marital",
+    "what is the average duration of management",
+    "sum of balance where age > 60",
+    "show clients with job = retired",
+]
+
+
+async def client(host, port, queries, offset, deadline, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    position = offset
+    try:
+        while time.perf_counter() < deadline:
+            body = json.dumps({"query": queries[position % len(queries)]}).encode()
+            position += 1
+            request = (
+                f"POST /query HTTP/1.1\r\nHost: {host}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+            ).encode() + body
+
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1")
+            length = 0
+            for line in head.split("\r\n")[1:]:
+                name, _, value = line.partition(":")
+                if name.strip().lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            statuses[int(head.split(" ", 2)[1])] += 1
+            if "connection: close" in head.lower():
+                break
+    finally:
+        writer.close()
+
+
+async def run(host, port, clients, duration, queries=None):
+    queries = queries or QUERIES
+    latencies = []
+    statuses = Counter()
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*[
+        client(host, port, queries, offset, deadline, latencies, statuses)
+        for offset in range(clients)
+    ])
+    elapsed = time.perf_counter() - start
+
+    report = {
+        "requests": len(latencies),
+        "throughput": len(latencies) / elapsed,
+        "statuses": dict(statuses),
+    }
+    if len(latencies) >= 2:
+        cuts = statistics.quantiles(latencies, n=100)
+        report.update(p50=cuts[49], p95=cuts[94], p99=cuts[98])
+
+    print(f"{clients} clients for {elapsed:.1f} s: {report['requests']} requests, "
+          f"{report['throughput']:.1f} req/s, statuses {report['statuses']}")
+    if "p50" in report:
+        print(f"  p50 {report['p50'] * 1000:8.2f} ms   p95 {report['p95'] * 1000:8.2f} ms"
+              f"   p99 {report['p99'] * 1000:8.2f} ms")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.host, args.port, args.clients, args.duration))
@@ -0,0 +1,279 @@
+"""
+    Benchmark suite of the query pipeline over data set sizes and query mixes.
+
+    For every data set size the stages are timed in a fresh process, so the peak
+    memory of one size is not hidden by the one before:
+        load_cold / load_warm   DataService with an empty / filled columnar cache
+        index_stats             StatisticsIndex.build
+        index_filter            FilterIndex.build
+        parse                   NLPServices.parse_query, per question
+        execute                 IntentExecutorServices.execute, per question
+        plot / savefig          VisualizationServices, per chart question
+
+    Sizes other than the bank.csv row count are synthetic bank data sets: every column
+    is resampled from bank.csv with a fixed seed and written once to Data/.cache/bench/.
+    The query mixes are constants.QUERIES and a sample of Data/intent_dataset.csv.
+
+    Results are compared with the baseline in Benchmark/baselines/; a stage whose p50 is
+    over LATENCY_TOLERANCE times its baseline (or whose p95 is over TAIL_LATENCY_TOLERANCE
+    times its baseline), by more than LATENCY_SLACK_MS, or a peak memory above
+    MEMORY_TOLERANCE times its baseline, fails the run with exit code 1.
+
+    Run from the project root:
+        python -m Benchmark.suite                                  # the gate: every size up to 10M rows
+        python -m Benchmark.suite --save-baseline
+        python -m Benchmark.suite --sizes 4521                     # a quick check, no 10M data set
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+import constants
+
+SOURCE_PATH = "./Data"
+SOURCE_CSV = "bank.csv"
+BENCH_DATA_DIR = "./Data/.cache/bench"
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+# The default run is the gate, it covers the 10M rows scale
+DEFAULT_SIZES = [4521, 1_000_000, 10_000_000]
+INTENT_SAMPLE = 200
+CHART_QUERIES = ["what is the average age", "show values of marital", "average balance by job"]
+# Rows written at a time to a synthetic data set
+WRITE_CHUNK = 1_000_000
+
+LATENCY_TOLERANCE = 1.25
+# The tail of a stage is noisier than its median
+TAIL_LATENCY_TOLERANCE = 1.5
+# Differences below this are timer noise, whatever the ratio
+LATENCY_SLACK_MS = 2.0
+MEMORY_TOLERANCE = 1.15
+
+
+def synthetic_bank_csv(rows, seed=42):
+    """
+    Path of a bank data set of `rows` rows, written on first use.
+
+    Every column is resampled on its own from bank.csv: the values and their
+    frequencies are those of the bank data, the row count is the one asked for.
+    """
+    source = os.path.join(SOURCE_PATH, SOURCE_CSV)
+    bank = pd.read_csv(source, delimiter=";")
+    if rows == len(bank):
+        return SOURCE_PATH, SOURCE_CSV
+
+    name = f"bank_{rows}_{seed}.csv"
+    path = os.path.join(BENCH_DATA_DIR, name)
+    if not os.path.exists(path):
+        os.makedirs(BENCH_DATA_DIR, exist_ok=True)
+        rng = np.random.default_rng(seed)
+        temp_path = f"{path}.tmp"
+        for start in range(0, rows, WRITE_CHUNK):
+            size = min(WRITE_CHUNK, rows - start)
+            chunk = pd.DataFrame({
+                column: bank[column].to_numpy()[rng.integers(len(bank), size=size)]
+                for column in bank.columns
+            })
+            # Same layout as bank.csv: ';' separated, text quoted
+            chunk.to_csv(temp_path, sep=";", index=False, header=start == 0, mode="w" if start == 0 else "a",
+                         quoting=csv.QUOTE_NONNUMERIC)
+        os.replace(temp_path, path)
+    return BENCH_DATA_DIR, name
+
+
+def query_mixes(intent_sample=INTENT_SAMPLE, seed=42):
+    intent_queries = pd.read_csv(os.path.join(SOURCE_PATH, "intent_dataset.csv"))["query"]
+    return {
+        "constants": list(constants.QUERIES),
+        "intent_dataset": intent_queries.sample(min(intent_sample, len(intent_queries)),
+                                                random_state=seed).tolist(),
+    }
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    summary = {"count": len(timings), "p50_ms": statistics.median(timings) * 1000}
+    if len(timings) >= 2:
+        cuts = statistics.quantiles(timings, n=100, method="inclusive")
+        summary.update(p95_ms=cuts[94] * 1000, p99_ms=cuts[98] * 1000)
+    return summary
+
+
+def timed(timings, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    timings.append(time.perf_counter() - start)
+    return result
+
+
+def run_size(file_path, csv_file_name, mixes, repeat):
+    """
+    Time every stage on one data set, in the calling (fresh) process.
+    """
+    from Services.charts_services import VisualizationServices
+    from Services.data import DataService
+    from Services.filter_services import FilterIndex
+    from Services.nlp_services import IntentExecutorServices, NLPServices
+    from Services.stats_services import StatisticsIndex
+
+    # The result of a repeat is dropped before the next one, the peak memory is that of one copy
+    stages = {"load_cold": [], "load_warm": []}
+    for _ in range(repeat):
+        dataframe = None
+        # An empty cache every time, a cold load never reads what the one before wrote
+        with tempfile.TemporaryDirectory() as cache_dir:
+            data_service = DataService(file_path=file_path, zip_file_name=None, csv_file_name=csv_file_name,
+                                       cache_dir=cache_dir)
+            dataframe = timed(stages["load_cold"], data_service.load_dataset)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        data_service = DataService(file_path=file_path, zip_file_name=None, csv_file_name=csv_file_name,
+                                   cache_dir=cache_dir)
+        dataframe = None
+        data_service.load_dataset()
+        for _ in range(repeat):
+            dataframe = None
+            dataframe = timed(stages["load_warm"], data_service.load_dataset)
+
+    stages["index_stats"], stages["index_filter"] = [], []
+    for _ in range(repeat):
+        stats_index = filter_index = None
+        stats_index = timed(stages["index_stats"], StatisticsIndex().build, dataframe)
+        filter_index = timed(stages["index_filter"], FilterIndex().build, dataframe)
+
+    # Parsing never reads the stopwords
+    nlp_services = NLPServices(constants.INTENT_KEYWORDS, stop_words=set())
+    value_domains = filter_index.domains()
+    errors = 0
+    for mix, queries in mixes.items():
+        parse_timings, execute_timings = [], []
+        for _ in range(repeat):
+            for query in queries:
+                parsed_intent = timed(parse_timings, nlp_services.parse_query, query, dataframe.columns,
+                                      constants.COLUMN_MATCH_THRESHOLD, value_domains)
+                executor = IntentExecutorServices(dataframe, parsed_intent, stats_index=stats_index,
+                                                  filter_index=filter_index)
+                start = time.perf_counter()
+                try:
+                    executor.execute()
+                except (ValueError, KeyError, TypeError):
+                    errors += 1
+                execute_timings.append(time.perf_counter() - start)
+        stages[f"parse[{mix}]"] = parse_timings
+        stages[f"execute[{mix}]"] = execute_timings
+
+    stages["plot"], stages["savefig"] = [], []
+    for query in CHART_QUERIES:
+        parsed_intent = nlp_services.parse_query(query, dataframe.columns, constants.COLUMN_MATCH_THRESHOLD,
+                                                 value_domains)
+        visualizer = VisualizationServices(dataframe, parsed_intent, stats_index=stats_index, save=False)
+        try:
+            fig, _ = timed(stages["plot"], visualizer.execute)
+        except (ValueError, KeyError, TypeError):
+            continue
+        if fig is not None:
+            timed(stages["savefig"], fig.savefig, io.BytesIO(), format="png", bbox_inches="tight")
+
+    return {
+        "rows": len(dataframe),
+        "dataframe_mb": dataframe.memory_usage(deep=True).sum() / 2 ** 20,
+        # ru_maxrss is in KB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "errors": errors,
+        "stages": {stage: summarize(timings) for stage, timings in stages.items() if timings},
+    }
+
+
+def run(sizes, repeat, intent_sample):
+    mixes = query_mixes(intent_sample)
+    results = {}
+    for rows in sizes:
+        file_path, csv_file_name = synthetic_bank_csv(rows)
+        # A fresh process per size, its peak memory is its own
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            results[str(rows)] = executor.submit(run_size, file_path, csv_file_name, mixes, repeat).result()
+        print_result(rows, results[str(rows)])
+    return {
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "cpus": os.cpu_count()},
+        "repeat": repeat,
+        "intent_sample": intent_sample,
+        "results": results,
+    }
+
+
+def print_result(rows, result):
+    print(f"{rows} rows: {result['dataframe_mb']:.1f} MB in memory, peak RSS {result['peak_rss_mb']:.0f} MB, "
+          f"{result['errors']} unanswered questions")
+    for stage, summary in result["stages"].items():
+        tail = f"   p95 {summary['p95_ms']:10.3f} ms   p99 {summary['p99_ms']:10.3f} ms" if "p95_ms" in summary else ""
+        print(f"  {stage:<24} n={summary['count']:<5} p50 {summary['p50_ms']:10.3f} ms{tail}")
+
+
+def compare(report, baseline):
+    """
+    Regressions of the report against the baseline, sizes and stages missing on either side are skipped.
+
+    Returns:
+        list: One message per regression.
+    """
+    regressions = []
+    for rows, result in report["results"].items():
+        expected = baseline["results"].get(rows)
+        if expected is None:
+            continue
+        for stage, summary in result["stages"].items():
+            reference = expected["stages"].get(stage)
+            if reference is None:
+                continue
+            for percentile, tolerance in (("p50_ms", LATENCY_TOLERANCE), ("p95_ms", TAIL_LATENCY_TOLERANCE)):
+                if percentile not in summary or percentile not in reference:
+                    # A single sample has no p95
+                    continue
+                limit = max(reference[percentile] * tolerance, reference[percentile] + LATENCY_SLACK_MS)
+                if summary[percentile] > limit:
+                    regressions.append(f"{rows} rows, {stage}: {percentile[:3]} {summary[percentile]:.3f} ms, "
+                                       f"baseline {reference[percentile]:.3f} ms")
+        if result["peak_rss_mb"] > expected["peak_rss_mb"] * MEMORY_TOLERANCE:
+            regressions.append(f"{rows} rows: peak RSS {result['peak_rss_mb']:.0f} MB, "
+                               f"baseline {expected['peak_rss_mb']:.0f} MB")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--intent-sample", type=int, default=INTENT_SAMPLE)
+    parser.add_argument("--baseline", default=os.path.join(BASELINE_DIR, "suite.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline")
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.repeat, args.intent_sample)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(report, baseline_file, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            regressions = compare(report, json.load(baseline_file))
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression against {args.baseline}")
+    else:
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create one")
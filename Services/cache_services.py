@@ -0,0 +1,205 @@
+"""
+    Columnar on-disk cache for the data sets.
+
+    The first load of a source file parses it once and writes every column as its
+    own `.npy` file (text and category columns are stored as integer codes plus
+    their categories).
+    Later loads memory-map those files instead of parsing the CSV again.
+    The cache is thrown away as soon as the source file fingerprint changes.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+MANIFEST_FILE_NAME = "manifest.json"
+CACHE_FORMAT_VERSION = 2
+
+
+def file_fingerprint(source_path, verify_hash=False):
+    """
+    Build the fingerprint used to decide if something derived from a file is still valid.
+
+    Args:
+        source_path (str): Path of the source file (CSV or archive).
+        verify_hash (bool): Also hash the content of the file.
+
+    Returns:
+        dict: Size and modification time of the file, plus its sha1 when
+            `verify_hash` is enabled.
+    """
+    stat = os.stat(source_path)
+    fingerprint = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+    if verify_hash:
+        sha1 = hashlib.sha1()
+        with open(source_path, "rb") as source_file:
+            for block in iter(lambda: source_file.read(1024 * 1024), b""):
+                sha1.update(block)
+        fingerprint["sha1"] = sha1.hexdigest()
+    return fingerprint
+
+
+def dataset_fingerprint(source_path, key=None, verify_hash=False):
+    # Short string identifying one version of a data set, stored in DataFrame.attrs
+    fingerprint = file_fingerprint(source_path, verify_hash)
+    parts = [os.path.abspath(source_path), key or ""] + [str(fingerprint[name]) for name in sorted(fingerprint)]
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+
+class ColumnarCacheService:
+    def __init__(self, cache_dir, verify_hash=False):
+        self.cache_dir = cache_dir
+        self.verify_hash = verify_hash
+
+    def fingerprint(self, source_path):
+        return file_fingerprint(source_path, self.verify_hash)
+
+    def entry_dir(self, source_path, key=None):
+        # One directory per source file (and optional key such as an archive member)
+        source_id = os.path.abspath(source_path) + (f"::{key}" if key else "")
+        digest = hashlib.sha1(source_id.encode("utf-8")).hexdigest()[:12]
+        name = os.path.basename(key or source_path)
+        return os.path.join(self.cache_dir, f"{name}.{digest}")
+
+    def load(self, source_path, key=None, columns=None):
+        """
+        Load a cached data set, memory-mapping the numeric columns.
+
+        Args:
+            columns (list): Columns to read, None for all of them. The others are never opened.
+
+        Returns:
+            DataFrame or None: None when there is no valid cache entry.
+        """
+        entry = self._read_manifest(source_path, key, columns)
+        if entry is None:
+            return None
+        entry_dir, manifest_columns = entry
+        arrays = {column["name"]: self._open_array(entry_dir, column) for column in manifest_columns}
+        return self._build_frame(manifest_columns, arrays, slice(None))
+
+    def iter_chunks(self, source_path, chunksize, key=None, columns=None):
+        """
+        Slice a cached data set into chunks of rows, each one read from the memory-mapped arrays.
+        Text columns are decoded one chunk at a time, never as a whole column.
+
+        Returns:
+            generator or None: DataFrames of at most chunksize rows, None when there is no valid cache entry.
+        """
+        entry = self._read_manifest(source_path, key, columns)
+        if entry is None:
+            return None
+        entry_dir, manifest_columns = entry
+        arrays = {column["name"]: self._open_array(entry_dir, column) for column in manifest_columns}
+        rows = len(next(iter(arrays.values()))) if arrays else 0
+
+        def chunks():
+            for start in range(0, rows, chunksize):
+                chunk = self._build_frame(manifest_columns, arrays, slice(start, start + chunksize))
+                # Row labels of the whole data set, as a chunk of read_csv has
+                chunk.index = pd.RangeIndex(start, start + len(chunk))
+                yield chunk
+
+        return chunks()
+
+    def _read_manifest(self, source_path, key=None, columns=None):
+        # (entry dir, manifest of the asked columns) of a valid entry, or None
+        entry_dir = self.entry_dir(source_path, key)
+        manifest_path = os.path.join(entry_dir, MANIFEST_FILE_NAME)
+        if not os.path.isfile(manifest_path):
+            return None
+
+        with open(manifest_path, "r", encoding="utf-8") as manifest_file:
+            manifest = json.load(manifest_file)
+
+        if manifest.get("version") != CACHE_FORMAT_VERSION or \
+                manifest.get("fingerprint") != self.fingerprint(source_path):
+            # Source changed since the cache was written
+            self.invalidate(source_path, key)
+            return None
+
+        manifest_columns = manifest["columns"]
+        if columns is not None:
+            wanted = set(columns)
+            manifest_columns = [column for column in manifest_columns if column["name"] in wanted]
+        return entry_dir, manifest_columns
+
+    @staticmethod
+    def _open_array(entry_dir, column):
+        return np.load(os.path.join(entry_dir, column["file"]), mmap_mode="r")
+
+    @staticmethod
+    def _build_frame(manifest_columns, arrays, rows):
+        columns = {}
+        for column in manifest_columns:
+            values = arrays[column["name"]][rows]
+            if column["kind"] == "categorical":
+                columns[column["name"]] = pd.Categorical.from_codes(values, categories=column["categories"])
+            elif column["kind"] == "coded":
+                # The trailing None is picked up by the -1 code of missing values
+                lookup = np.array(column["categories"] + [None], dtype=object)
+                columns[column["name"]] = pd.Series(lookup.take(values), dtype=column["dtype"])
+            else:
+                columns[column["name"]] = values
+
+        # copy=False keeps the memory-mapped buffers instead of copying them into RAM
+        return pd.DataFrame(columns, copy=False)
+
+    def store(self, source_path, dataframe, key=None):
+        """
+        Write the data set to the cache. Returns False when a column can not be cached.
+        """
+        entry_dir = self.entry_dir(source_path, key)
+        tmp_dir = f"{entry_dir}.tmp{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        try:
+            manifest_columns = []
+            for position, name in enumerate(dataframe.columns):
+                series = dataframe[name]
+                file_name = f"{position}.npy"
+                column = {"name": name, "file": file_name, "dtype": str(series.dtype)}
+
+                if isinstance(series.dtype, pd.CategoricalDtype):
+                    # Category codes are already compact, store them as they are
+                    column["kind"] = "categorical"
+                    column["categories"] = [str(category) for category in series.cat.categories]
+                    values = series.cat.codes.to_numpy()
+                elif pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_any_dtype(series):
+                    column["kind"] = "array"
+                    values = series.to_numpy()
+                else:
+                    # Text columns are stored as codes, -1 marks a missing value
+                    codes, categories = pd.factorize(series, sort=True)
+                    column["kind"] = "coded"
+                    column["categories"] = [str(category) for category in categories]
+                    values = codes.astype(np.int32)
+
+                np.save(os.path.join(tmp_dir, file_name), values, allow_pickle=False)
+                manifest_columns.append(column)
+
+            manifest = {
+                "version": CACHE_FORMAT_VERSION,
+                "fingerprint": self.fingerprint(source_path),
+                "columns": manifest_columns,
+            }
+            with open(os.path.join(tmp_dir, MANIFEST_FILE_NAME), "w", encoding="utf-8") as manifest_file:
+                json.dump(manifest, manifest_file)
+        except (ValueError, TypeError):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return False
+
+        # Swap the new entry in place of the old one
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+        return True
+
+    def invalidate(self, source_path, key=None):
+        shutil.rmtree(self.entry_dir(source_path, key), ignore_errors=True)
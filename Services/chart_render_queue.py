@@ -0,0 +1,187 @@
+"""
+    Background chart rendering with a content addressed chart cache.
+
+    A chart is named after a hash of what it shows (action, column, group by, filters
+    and the fingerprint of the data set), so the same question on the same data reuses
+    the PNG already in the chart directory (outputs/charts/) instead of drawing it
+    again. New charts are drawn and saved by a render thread, the answer is returned
+    without waiting for them. Figures are plain matplotlib Figure objects saved with the Agg renderer, no
+    pyplot state or GUI backend is involved. Once the directory grows past its byte
+    budget the least recently used charts are removed.
+"""
+import hashlib
+import os
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import constants
+from Services.metrics_services import metrics
+
+
+def chart_key(parsed_intent, fingerprint):
+    filters = parsed_intent.get("filters")
+    content = repr((
+        parsed_intent.get("action"),
+        parsed_intent.get("column"),
+        parsed_intent.get("group_by"),
+        str(filters) if filters is not None else None,
+        parsed_intent.get("limit"),
+        fingerprint,
+    ))
+    return hashlib.sha256(content.encode()).hexdigest()[:24]
+
+
+# Names written by chart_file_name, eviction never touches any other file
+CHART_FILE_PATTERN = re.compile(r"_[0-9a-f]{24}\.png$")
+
+
+def chart_file_name(parsed_intent, key):
+    # Readable prefix, the hash is what makes the name unique
+    parts = [parsed_intent.get("action"), parsed_intent.get("column")]
+    if parsed_intent.get("group_by"):
+        parts += ["by", parsed_intent["group_by"]]
+    prefix = re.sub(r"[^\w.-]+", "_", "_".join(str(part) for part in parts if part))
+    return f"{prefix}_{key}.png"
+
+
+class ChartJob:
+    def __init__(self, key, path, future):
+        self.key = key
+        self.path = path
+        self.future = future
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        """
+        Wait for the chart.
+
+        Returns:
+            str: Path of the PNG, None when the question has no chart.
+
+        Raises:
+            Exception: Whatever drawing or saving the chart raised.
+        """
+        return self.future.result(timeout)
+
+
+class ChartRenderQueue:
+    def __init__(self, output_dir=None, max_bytes=None, workers=None):
+        self.output_dir = output_dir or constants.CHART_OUTPUT_DIR
+        self.max_bytes = max_bytes or constants.CHART_OUTPUT_MAX_BYTES
+        # One render thread by default, Agg figures are not shared between threads
+        self.executor = ThreadPoolExecutor(max_workers=workers or constants.CHART_RENDER_WORKERS,
+                                           thread_name_prefix="chart")
+        self._lock = threading.Lock()
+        # Charts being drawn, a second request for one waits for the same job
+        self._pending = {}
+        # Questions whose intent has nothing to plot
+        self._no_chart = set()
+        self.rendered = 0
+        self.reused = 0
+        self.evicted = 0
+
+    def submit(self, parsed_intent, fingerprint, draw):
+        """
+        Get the chart of a question, drawing it in the background when it is not saved yet.
+
+        Args:
+            parsed_intent (dict): Parsed intent of the question.
+            fingerprint (str): Fingerprint of the data set the chart is drawn from.
+            draw (callable): Returns a matplotlib Figure, or None when there is nothing
+                to plot. Only called on the render thread, and only for a new chart.
+
+        Returns:
+            ChartJob: Job whose result() is the path of the PNG.
+        """
+        key = chart_key(parsed_intent, fingerprint)
+        path = os.path.join(self.output_dir, chart_file_name(parsed_intent, key))
+        with self._lock:
+            job = self._pending.get(key)
+            if job is not None:
+                return job
+            if key in self._no_chart or os.path.exists(path):
+                future = Future()
+                if key in self._no_chart:
+                    future.set_result(None)
+                else:
+                    self.reused += 1
+                    # Recently used charts are the last to be evicted
+                    os.utime(path)
+                    future.set_result(path)
+                return ChartJob(key, path, future)
+
+            job = ChartJob(key, path, self.executor.submit(self._render, key, path, draw))
+            self._pending[key] = job
+        # Outside the lock: a job already done runs the callback right here
+        job.future.add_done_callback(lambda _: self._finish(key))
+        return job
+
+    def _finish(self, key):
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def _render(self, key, path, draw):
+        # An exception of draw() or savefig() is raised by ChartJob.result(), the next
+        # submit of the same chart tries again
+        with metrics.span("plot"):
+            fig = draw()
+        if fig is None:
+            with self._lock:
+                self._no_chart.add(key)
+            return None
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        # Written next to its final name, a reader never sees half a PNG
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with metrics.span("savefig"):
+                fig.savefig(temp_path, format="png", bbox_inches="tight")
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        with self._lock:
+            self.rendered += 1
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used charts until the directory fits in max_bytes.
+        Only the charts of the queue count, other files of the directory are left alone.
+        """
+        charts = []
+        with os.scandir(self.output_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and CHART_FILE_PATTERN.search(entry.name) and entry.path != keep:
+                    stat = entry.stat()
+                    charts.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in charts)
+        if keep is not None and os.path.exists(keep):
+            total += os.path.getsize(keep)
+
+        for _, size, chart_path in sorted(charts):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(chart_path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            with self._lock:
+                self.evicted += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "rendered": self.rendered,
+                "reused": self.reused,
+                "evicted": self.evicted,
+            }
+
+    def close(self):
+        self.executor.shutdown(wait=True)
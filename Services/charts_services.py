@@ -1,20 +1,51 @@
-import matplotlib.pyplot as plt
 from datetime import datetime
 import os
 import pandas as pd
 import numpy as np
 
+import constants
+from Services.downsampling import as_float_array, downsample, quantiles, segment_reduce, segment_starts
+from Services.groupby_services import GROUP_BY_AGGREGATES, GroupByService
+from Services.metrics_services import metrics
+
+
+def new_figure(figsize=(8, 4)):
+    # matplotlib is imported when the first chart is drawn, not when the module is.
+    # A plain Figure is drawn by Agg without pyplot's global figure list, so figures are
+    # freed once unused and can be drawn off the main thread.
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=figsize)
+    return fig, fig.subplots()
+
 
 class VisualizationServices:
-    def __init__(self, dataframe, query_intent):
+    def __init__(self, dataframe, query_intent, stats_index=None, groupby_service=None, save=True):
         self.dataframe = dataframe
         self.query_intent = query_intent
+        # Shares the cached group by results with the intent executor
+        self.groupby_service = groupby_service if groupby_service is not None else GroupByService(dataframe)
+        # Precomputed statistics, the column is only scanned when they are missing
+        self.stats_index = stats_index
+        # False when the caller saves the figure itself (ChartRenderQueue)
+        self.save = save
+
+    def column_stats(self, column):
+        if self.stats_index is None or not self.stats_index.is_current(self.dataframe):
+            return None
+        return self.stats_index.get(column)
 
     def execute(self):
         action = self.query_intent.get("action")
         column = self.query_intent.get("column")
 
-        print(action, column)
+        if action == "filter" and self.query_intent.get("filters") is not None:
+            # The filtered rows are the answer, there is nothing to plot
+            return None, None
+
+        group_by = self.query_intent.get("group_by")
+        if group_by is not None and action in GROUP_BY_AGGREGATES:
+            return self.plot_group_by(action, column, group_by, save=self.save)
+
         if not action or not column:
             raise ValueError("Could not understand the intent or column.")
 
@@ -28,7 +59,7 @@ class VisualizationServices:
 
         fig, file_message = None, None
         if action == "mean":
-            fig, file_message = self.plot_mean(column, save=True)
+            fig, file_message = self.plot_mean(column, save=self.save)
         # commenting this as only KPI is good
         # elif action == "sum":
         #     fig, file_message = self.plot_sum(column, save=False)
@@ -36,7 +67,7 @@ class VisualizationServices:
         # elif action == "count":
         #     fig, file_message = self.plot_count(column, save=True)
         elif action == "filter":
-            fig, file_message = self.plot_filter(column, save=True)
+            fig, file_message = self.plot_filter(column, save=self.save)
         # else:
         #     fig , file_message = None, None
         #     # raise ValueError(f"Action '{action}' is not supported yet")
@@ -44,15 +75,16 @@ class VisualizationServices:
         return fig, file_message
 
     def plot_mean(self, column, save=False):
-        data = self.dataframe[column]
-        mean_val = data.mean()
-        chunk_size = self.get_chunk_size(column=column)
-        data_agg = data.groupby(np.arange(len(data)) // chunk_size).mean()
-        # print("Chunk size: ", chunk_size)
-
-        # print(data_agg)
-        fig, ax = plt.subplots(figsize=(8,4))
-        ax.plot(data_agg.index, data_agg.values, linestyle='-')
+        values = as_float_array(self.dataframe[column])
+        stats = self.column_stats(column)
+        mean_val = stats.mean if stats is not None else np.nanmean(values)
+        chunk_size = self.get_chunk_size(column=column, values=values)
+        chunk_means = segment_reduce(values, segment_starts(len(values), chunk_size), how="mean")
+        # At most two points per pixel are drawn, however many chunks there are
+        chunk_index, chunk_means = downsample(np.arange(len(chunk_means)), chunk_means)
+
+        fig, ax = new_figure(figsize=(8,4))
+        ax.plot(chunk_index, chunk_means, linestyle='-')
         ax.axhline(mean_val, color='r', linestyle='--', label='Overall Mean')
 
         # ax.bar(len(data), mean_val, color='red', label='Mean')
@@ -87,7 +119,7 @@ class VisualizationServices:
     def plot_sum(self, column, save=False):
         sum_val = self.dataframe[column].sum()
 
-        fig, ax = plt.subplots(figsize=(8,4))
+        fig, ax = new_figure(figsize=(8,4))
         # Simple bar with one bar showing sum
         ax.bar([0], [sum_val], color='purple')
         ax.set_xticks([0], [f'Sum of {column}'])
@@ -104,7 +136,7 @@ class VisualizationServices:
     def plot_count(self, column, save=False):
         count_val = self.dataframe[column].count()
 
-        fig, ax = plt.subplots(figsize=(8,4))
+        fig, ax = new_figure(figsize=(8,4))
         # Count is a single number, show as bar
         ax.bar([0], [count_val], color='green')
         ax.set_xticks([0], [f'Count of {column}'])
@@ -119,12 +151,21 @@ class VisualizationServices:
         return fig, file_message
 
     def plot_filter(self, column, save=False):
-        unique_vals, counts = self.dataframe[column].value_counts().index, self.dataframe[column].value_counts().values
-
-        fig, ax = plt.subplots(figsize=(8,4))
+        stats = self.column_stats(column)
+        value_counts = stats.value_counts_series() if stats is not None else None
+        if value_counts is None:
+            value_counts = self.dataframe[column].value_counts()
+        # A bar and a label per value would cost the same as the column has distinct values
+        shown = value_counts.head(constants.CHART_MAX_BARS)
+        unique_vals, counts = shown.index, shown.values
+
+        fig, ax = new_figure(figsize=(8,4))
         ax.bar(range(len(unique_vals)), counts)
         ax.set_xticks(range(len(unique_vals)), unique_vals, rotation=45, ha='right')
-        ax.set_title(f'Unique values count in {column}')
+        title = f'Unique values count in {column}'
+        if len(shown) < len(value_counts):
+            title += f' (top {len(shown)} of {len(value_counts)})'
+        ax.set_title(title)
         ax.set_ylabel('Frequency')
         fig.tight_layout()
 
@@ -135,24 +176,53 @@ class VisualizationServices:
 
         return fig, file_message
 
+    def plot_group_by(self, action, column, group_by, save=False):
+        measure = None if action == "count" or column == group_by else column
+        result = self.groupby_service.aggregate(action, group_by, measure=measure, dataframe=self.dataframe)
+        value_name = result.columns[1]
+
+        fig, ax = new_figure(figsize=(8,4))
+        ax.bar(range(len(result)), result[value_name])
+        ax.set_xticks(range(len(result)), result[group_by], rotation=45, ha='right')
+        ax.set_title(f'{value_name} by {group_by}')
+        ax.set_ylabel(value_name)
+        fig.tight_layout()
+
+        file_message = None
+        if save:
+            filename = self.save_fig_with_timestamp(fig, prefix=f'{value_name}_by_{group_by}')
+            file_message = f"Chart is saved to {filename}"
+
+        return fig, file_message
+
     def save_fig_with_timestamp(self, fig, prefix="chart"):
         os.makedirs("outputs", exist_ok=True)
         filename = f"outputs/{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
-        fig.savefig(filename, bbox_inches='tight')
+        with metrics.span("savefig"):
+            fig.savefig(filename, bbox_inches='tight')
         return filename
 
-    def freedman_daiconis_bin_width(self, column):
-        q75, q25 = np.percentile(list(self.dataframe[column]), [75, 25])
+    def freedman_daiconis_bin_width(self, column, values=None):
+        stats = self.column_stats(column)
+        if stats is None and values is None:
+            values = as_float_array(self.dataframe[column])
+        q75, q25 = quantiles([0.75, 0.25], stats=stats, values=values)
         iqr = q75 - q25
         n = len(self.dataframe[column])
         bin_width = 2 * iqr / (n ** (1/3))
         return bin_width
 
-    def get_chunk_size(self, column):
-        bin_width = self.freedman_daiconis_bin_width(column=column)
-        if bin_width == 0 :
+    def get_chunk_size(self, column, values=None):
+        # values: the column as a float array, when the caller already has it
+        bin_width = self.freedman_daiconis_bin_width(column=column, values=values)
+        if not bin_width > 0:
             return 1
-        data_range = self.dataframe[column].max() - self.dataframe[column].min()
+        stats = self.column_stats(column)
+        if stats is not None:
+            data_range = stats.max - stats.min
+        else:
+            values = as_float_array(self.dataframe[column]) if values is None else values
+            data_range = np.nanmax(values) - np.nanmin(values)
         num_bins = max(1, int(np.ceil(data_range / bin_width)))
         chunk_size = max(1, len(self.dataframe[column]) // num_bins)
         return chunk_size
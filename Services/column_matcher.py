@@ -0,0 +1,140 @@
+"""
+    Column name index used to find the column a question is about.
+
+    Built once per schema: every column gets normalized aliases (its name, plural
+    and synonyms such as "subscribed" -> y) and every alias is indexed by its
+    character trigrams. A question is matched by collecting the aliases that share
+    enough trigrams with it, then scoring only those candidates against the words
+    of the question with a normalized edit distance.
+"""
+import re
+from collections import Counter
+from functools import lru_cache
+
+import constants
+
+# An alias is a candidate once it shares this fraction of its trigrams with the question
+PREFILTER_RATIO = 0.3
+
+
+def normalize(text):
+    return " ".join(re.findall(r"[a-z0-9]+", str(text).lower()))
+
+
+def trigrams(text):
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_ratio(left, right):
+    """
+    Similarity of two strings between 0 and 100, from their Levenshtein distance.
+    """
+    if left == right:
+        return 100
+    if not left or not right:
+        return 0
+    previous = list(range(len(right) + 1))
+    for i, left_char in enumerate(left, 1):
+        current = [i]
+        for j, right_char in enumerate(right, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (left_char != right_char)))
+        previous = current
+    return round(100 * (1 - previous[-1] / max(len(left), len(right))))
+
+
+class ColumnMatcher:
+    def __init__(self, columns, synonyms=None):
+        self.columns = list(columns)
+        synonyms = constants.COLUMN_SYNONYMS if synonyms is None else synonyms
+
+        # alias text -> column, the first column wins when two columns share an alias
+        self.aliases = {}
+        for column in self.columns:
+            name = normalize(column)
+            for alias in [name, f"{name}s"] + [normalize(synonym) for synonym in synonyms.get(column, [])]:
+                if alias and alias not in self.aliases:
+                    self.aliases[alias] = column
+
+        self.alias_list = list(self.aliases)
+        self.alias_words = [len(alias.split()) for alias in self.alias_list]
+        self.alias_sizes = sorted(set(self.alias_words))
+        self.alias_gram_counts = []
+        # trigram -> ids of the aliases that contain it
+        self.gram_index = {}
+        for alias_id, alias in enumerate(self.alias_list):
+            grams = trigrams(alias)
+            self.alias_gram_counts.append(len(grams))
+            for gram in grams:
+                self.gram_index.setdefault(gram, []).append(alias_id)
+
+    def candidates(self, query_text):
+        shared = Counter()
+        for gram in trigrams(query_text):
+            for alias_id in self.gram_index.get(gram, ()):
+                shared[alias_id] += 1
+        return [alias_id for alias_id, count in shared.items()
+                if count >= PREFILTER_RATIO * self.alias_gram_counts[alias_id]]
+
+    def match(self, user_question, threshold=70, stop_at_exact=False):
+        """
+        Rank the columns mentioned in the question.
+
+        Args:
+            user_question (str): Natural language input from the user.
+            threshold (int): Minimum score (0-100) to consider a column a match.
+            stop_at_exact (bool): Skip the fuzzy pass when an alias is found as is.
+
+        Returns:
+            list: (column, score) tuples, best first.
+        """
+        query_text = normalize(user_question)
+        words = query_text.split()
+        # Ties go to the earlier mention, then to the longer alias ("days passed" over "days")
+        best = {}
+
+        # Exact pass: every run of words is a dict lookup
+        for size in self.alias_sizes:
+            for start in range(len(words) - size + 1):
+                column = self.aliases.get(" ".join(words[start:start + size]))
+                if column is not None:
+                    rank = (100, -start, size)
+                    if column not in best or rank > best[column]:
+                        best[column] = rank
+
+        if not (stop_at_exact and best):
+            # Fuzzy pass, only on the aliases that share enough trigrams with the question
+            max_distance_ratio = 1 - threshold / 100
+            for alias_id in self.candidates(query_text):
+                alias = self.alias_list[alias_id]
+                column = self.aliases[alias]
+                if best.get(column, (0,))[0] == 100:
+                    continue
+                size = self.alias_words[alias_id]
+                for start in range(max(1, len(words) - size + 1)):
+                    window = " ".join(words[start:start + size])
+                    # Too different in length to ever reach the threshold
+                    if abs(len(window) - len(alias)) > max_distance_ratio * max(len(window), len(alias)):
+                        continue
+                    rank = (edit_ratio(alias, window), -start, size)
+                    if rank[0] >= threshold and (column not in best or rank > best[column]):
+                        best[column] = rank
+
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+        return [(column, rank[0]) for column, rank in ranked]
+
+    def best_match(self, user_question, threshold=70):
+        matches = self.match(user_question, threshold, stop_at_exact=True)
+        return matches[0] if matches else None
+
+
+@lru_cache(maxsize=constants.COLUMN_MATCHER_CACHE_SIZE)
+def matcher_for(schema):
+    """
+    The ColumnMatcher of a schema, built on first use and shared by the whole process.
+    A matcher is never changed after it is built, so threads can share it.
+
+    Args:
+        schema (tuple): Column names.
+    """
+    return ColumnMatcher(schema)
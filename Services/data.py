@@ -4,14 +4,28 @@
 """
 import os
 import zipfile
+from contextlib import ExitStack, contextmanager
+
 import pandas as pd
 
+from Services.cache_services import ColumnarCacheService, dataset_fingerprint
+from Services.schema_services import SchemaService
+import constants
+
 class DataService:
-    def __init__(self, file_path, zip_file_name, csv_file_name):
+    def __init__(self, file_path, zip_file_name, csv_file_name, cache_dir=None, verify_cache_hash=False,
+                 compact_dtypes=True):
         self.file_path = file_path
         self.zip_file_name = zip_file_name
         self.csv_file_name = csv_file_name
         self._processed_zips = set()  # Keep track of extracted zips
+        # Loads text columns as categories and downcasts the integers
+        self.schema_service = SchemaService() if compact_dtypes else None
+        # No cache dir means every load parses the CSV again
+        self.cache_service = ColumnarCacheService(
+            cache_dir=cache_dir,
+            verify_hash=verify_cache_hash,
+        ) if cache_dir else None
 
     def unzip_all(self):
         zip_path = os.path.abspath(os.path.join(self.file_path, self.zip_file_name))
@@ -31,17 +45,146 @@ class DataService:
         with zipfile.ZipFile(zip_path, 'r') as zip_ref:
             zip_ref.extractall(extract_to)
             # print(f"Extracted: {zip_path}")
+            nested_members = [name for name in zip_ref.namelist() if name.endswith(".zip")]
 
         # Optionally delete the zip after extracting to prevent reprocessing
         # os.remove(zip_path)
 
-        for root, _, files in os.walk(extract_to):
-            for file in files:
-                if file.endswith(".zip"):
-                    nested_zip_path = os.path.abspath(os.path.join(root, file))
-                    if nested_zip_path not in self._processed_zips:
-                        # print(f"Found nested zip: {nested_zip_path}")
-                        self._extract_and_find_nested(nested_zip_path, root)
+        # Only the zips that came out of this archive are visited, no rescan of the folder
+        for member in nested_members:
+            nested_zip_path = os.path.abspath(os.path.join(extract_to, member))
+            if nested_zip_path not in self._processed_zips:
+                # print(f"Found nested zip: {nested_zip_path}")
+                self._extract_and_find_nested(nested_zip_path, os.path.dirname(nested_zip_path))
+
+    def find_archive_member(self, member_name=None):
+        """
+        Look for a file inside the zip, following nested zips without extracting them.
+
+        Args:
+            member_name (str): File name to look for, defaults to the CSV file name.
+
+        Returns:
+            list: Member names from the outer zip down to the file,
+                e.g. ['bank.zip', 'bank-full.csv'], or None if it is not found.
+        """
+        member_name = member_name or self.csv_file_name
+        zip_path = os.path.abspath(os.path.join(self.file_path, self.zip_file_name))
+        if not os.path.isfile(zip_path):
+            raise FileNotFoundError(f"Zip file not found: {zip_path}")
+
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            return self._find_member_in_zip(zip_ref, member_name)
+
+    def _find_member_in_zip(self, zip_ref, member_name):
+        names = [name for name in zip_ref.namelist() if not name.startswith("__MACOSX/")]
+
+        for name in names:
+            if os.path.basename(name) == member_name:
+                return [name]
+
+        for name in names:
+            if name.endswith(".zip"):
+                # ZipExtFile is seekable, so the inner zip is read straight from the outer one
+                with zip_ref.open(name) as nested_file, zipfile.ZipFile(nested_file) as nested_zip:
+                    chain = self._find_member_in_zip(nested_zip, member_name)
+                if chain:
+                    return [name] + chain
+
+        return None
+
+    def list_archive_members(self, extension=".csv"):
+        """
+        List the files of the zip with the given extension, nested zips included.
+
+        Returns:
+            list: (chain, uncompressed size) of every file, chains as in find_archive_member.
+        """
+        zip_path = os.path.abspath(os.path.join(self.file_path, self.zip_file_name))
+        if not os.path.isfile(zip_path):
+            raise FileNotFoundError(f"Zip file not found: {zip_path}")
+
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            return self._list_members_in_zip(zip_ref, extension)
+
+    def _list_members_in_zip(self, zip_ref, extension):
+        members = []
+        for info in zip_ref.infolist():
+            if info.filename.startswith("__MACOSX/") or info.is_dir():
+                continue
+            if info.filename.endswith(extension):
+                members.append(([info.filename], info.file_size))
+            elif info.filename.endswith(".zip"):
+                with zip_ref.open(info.filename) as nested_file, zipfile.ZipFile(nested_file) as nested_zip:
+                    members += [([info.filename] + chain, size)
+                                for chain, size in self._list_members_in_zip(nested_zip, extension)]
+        return members
+
+    @contextmanager
+    def open_archive_member(self, chain):
+        """
+        Open a (possibly nested) zip member as a binary stream, nothing is written to disk.
+        """
+        zip_path = os.path.abspath(os.path.join(self.file_path, self.zip_file_name))
+        with ExitStack() as stack:
+            zip_ref = stack.enter_context(zipfile.ZipFile(zip_path, 'r'))
+            for name in chain[:-1]:
+                zip_ref = stack.enter_context(zipfile.ZipFile(stack.enter_context(zip_ref.open(name))))
+            yield stack.enter_context(zip_ref.open(chain[-1]))
+
+    def read_archive_chunks(self, chain, chunksize=None):
+        """
+        Stream the CSV member of the archive through the CSV parser chunk by chunk.
+        """
+        chunksize = chunksize or constants.ARCHIVE_READ_CHUNK_SIZE
+        with self.open_archive_member(chain) as member_file:
+            for chunk in pd.read_csv(member_file, delimiter=';', chunksize=chunksize, dtype=self._read_csv_dtypes()):
+                yield chunk
+
+    def _read_csv_dtypes(self):
+        return self.schema_service.read_csv_dtypes() if self.schema_service is not None else None
+
+    def load_dataset_from_archive(self, chunksize=None):
+        """
+            *********
+                This code load the data set straight from the zip file as a data frame
+            *********
+
+        :param
+             chunksize - number of rows parsed at a time
+        :return
+            DataFrame
+        """
+        if not self.zip_file_name:
+            raise FileNotFoundError("Please provide a zip file name")
+
+        zip_path = os.path.abspath(os.path.join(self.file_path, self.zip_file_name))
+        if not os.path.isfile(zip_path):
+            raise FileNotFoundError(f"Zip file not found: {zip_path}")
+
+        # A cache hit does not need to open the archive at all
+        cache_key = self.csv_file_name
+        if self.cache_service is not None:
+            dataset = self.cache_service.load(zip_path, key=cache_key)
+            if dataset is not None:
+                dataset.attrs["fingerprint"] = dataset_fingerprint(zip_path, key=cache_key)
+                return dataset
+
+        chain = self.find_archive_member()
+        if not chain:
+            raise FileNotFoundError(f"The file {self.csv_file_name} does not exist in {self.zip_file_name}")
+
+        if self.schema_service is not None:
+            dataset = self.schema_service.concat_chunks(self.read_archive_chunks(chain, chunksize))
+        else:
+            dataset = pd.concat(self.read_archive_chunks(chain, chunksize), ignore_index=True)
+
+        if self.cache_service is not None:
+            self.cache_service.store(zip_path, dataset, key=cache_key)
+
+        # Lets caches of query results tell one version of the data set from another
+        dataset.attrs["fingerprint"] = dataset_fingerprint(zip_path, key=cache_key)
+        return dataset
 
     def load_dataset(self):
         """
@@ -75,6 +218,111 @@ class DataService:
         if not os.path.isfile(file_full_path):
             raise FileNotFoundError(f"The file {self.csv_file_name} does not exist at {self.file_path}")
 
-        dataset = pd.read_csv(file_full_path,delimiter=';')
+        if self.cache_service is not None:
+            dataset = self.cache_service.load(file_full_path)
+            if dataset is not None:
+                dataset.attrs["fingerprint"] = dataset_fingerprint(file_full_path)
+                return dataset
 
+        dataset = pd.read_csv(file_full_path, delimiter=';', dtype=self._read_csv_dtypes())
+        if self.schema_service is not None:
+            dataset = self.schema_service.apply(dataset)
+
+        if self.cache_service is not None:
+            self.cache_service.store(file_full_path, dataset)
+
+        # Lets caches of query results tell one version of the data set from another
+        dataset.attrs["fingerprint"] = dataset_fingerprint(file_full_path)
         return dataset
+
+    @contextmanager
+    def open_source(self):
+        """
+        Open the data set for streaming reads: the CSV on disk when it exists,
+        otherwise its member inside the zip.
+        """
+        file_full_path = os.path.normpath(os.path.join(self.file_path, self.csv_file_name))
+        if os.path.isfile(file_full_path):
+            yield file_full_path
+            return
+
+        chain = self.find_archive_member()
+        if not chain:
+            raise FileNotFoundError(f"The file {self.csv_file_name} does not exist at {self.file_path}")
+        with self.open_archive_member(chain) as member_file:
+            yield member_file
+
+    def read_columns(self):
+        # Only the header line is parsed
+        with self.open_source() as source:
+            return list(pd.read_csv(source, delimiter=';', nrows=0).columns)
+
+    def cache_entry(self):
+        """
+        Source path and key of the columnar cache entry of the data set, or None without a cache.
+        """
+        if self.cache_service is None:
+            return None
+
+        file_full_path = os.path.normpath(os.path.join(self.file_path, self.csv_file_name))
+        if os.path.isfile(file_full_path):
+            return file_full_path, None
+
+        zip_path = os.path.abspath(os.path.join(self.file_path, self.zip_file_name or ""))
+        if self.zip_file_name and os.path.isfile(zip_path):
+            return zip_path, self.csv_file_name
+        return None
+
+    def load_cached_dataset(self, columns=None):
+        """
+        Return the data set (or some of its columns) from the columnar cache without parsing anything, or None.
+        """
+        entry = self.cache_entry()
+        if entry is None:
+            return None
+        source_path, key = entry
+        return self.cache_service.load(source_path, key=key, columns=columns)
+
+    def estimate_chunk_size(self, columns=None, memory_limit_mb=None):
+        """
+        Number of rows per chunk that keeps one parsed chunk under the memory limit.
+
+        Args:
+            columns (list): Columns that will be read, None for all of them.
+            memory_limit_mb (int): Memory ceiling of a chunk, defaults to STREAMING_MEMORY_LIMIT_MB.
+
+        Returns:
+            int: Rows per chunk.
+        """
+        memory_limit_mb = memory_limit_mb or constants.STREAMING_MEMORY_LIMIT_MB
+        with self.open_source() as source:
+            sample = pd.read_csv(source, delimiter=';', usecols=columns,
+                                 nrows=constants.STREAMING_SAMPLE_ROWS, dtype=self._read_csv_dtypes())
+
+        if sample.empty:
+            return constants.STREAMING_SAMPLE_ROWS
+        bytes_per_row = sample.memory_usage(index=False, deep=True).sum() / len(sample)
+        # The parser needs about as much memory again for its own buffers
+        return max(1, int(memory_limit_mb * 1024 * 1024 / (2 * bytes_per_row)))
+
+    def iter_chunks(self, columns=None, memory_limit_mb=None):
+        """
+        Yield the data set chunk by chunk so it never has to fit in memory at once.
+        Chunks are sliced out of the columnar cache when there is a valid entry,
+        otherwise they are parsed from the CSV (or the zip) on the fly.
+        """
+        chunksize = self.estimate_chunk_size(columns, memory_limit_mb)
+
+        entry = self.cache_entry()
+        if entry is not None:
+            # Only the asked columns are opened, and only one chunk of rows is decoded at a time
+            source_path, key = entry
+            cached_chunks = self.cache_service.iter_chunks(source_path, chunksize, key=key, columns=columns)
+            if cached_chunks is not None:
+                yield from cached_chunks
+                return
+
+        with self.open_source() as source:
+            for chunk in pd.read_csv(source, delimiter=';', usecols=columns, chunksize=chunksize,
+                                     dtype=self._read_csv_dtypes()):
+                yield self.schema_service.apply(chunk) if self.schema_service is not None else chunk
@@ -0,0 +1,149 @@
+"""
+    Downsampling of long series for charts.
+
+    Segment reductions run on the raw NumPy buffer with ufunc.reduceat, one pass in C
+    and no group labels. Line charts are then cut down to CHART_PIXEL_BUDGET points
+    with min-max buckets or LTTB, both keep the peaks a plain stride would skip, so the
+    drawing cost depends on the size of the chart and not on the number of rows.
+"""
+import numpy as np
+
+import constants
+
+
+def as_float_array(values):
+    # Raw buffer of a column, missing values as NaN
+    if hasattr(values, "to_numpy"):
+        return values.to_numpy(dtype=float, na_value=np.nan)
+    return np.asarray(values, dtype=float)
+
+
+def segment_starts(length, segment_size):
+    return np.arange(0, length, max(1, int(segment_size)))
+
+
+def segment_reduce(values, starts, how="mean"):
+    """
+    Reduce the segments values[starts[i]:starts[i + 1]], missing values are skipped.
+
+    Args:
+        values (ndarray): Float values.
+        starts (ndarray): Increasing start index of every segment, the first one 0.
+        how (str): "mean", "sum", "min", "max" or "count".
+
+    Returns:
+        ndarray: One value per segment, NaN for a segment without values.
+    """
+    if not len(values):
+        return np.empty(0)
+    valid = ~np.isnan(values)
+    if how == "count":
+        return np.add.reduceat(valid, starts).astype(float)
+    if how == "min":
+        # fmin / fmax skip NaN as long as the segment has a value
+        return np.fmin.reduceat(values, starts)
+    if how == "max":
+        return np.fmax.reduceat(values, starts)
+
+    sums = np.add.reduceat(np.where(valid, values, 0.0), starts)
+    if how == "sum":
+        return sums
+    if how == "mean":
+        counts = np.add.reduceat(valid, starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+    raise ValueError(f"Unknown segment reduction '{how}'")
+
+
+def minmax_indices(values, buckets):
+    """
+    Index of the smallest and the largest value of each of `buckets` equal buckets.
+
+    Returns:
+        ndarray: Sorted indices, at most 2 * buckets (first and last point included).
+    """
+    length = len(values)
+    if length <= 2 * buckets:
+        return np.arange(length)
+
+    bucket_size = -(-length // buckets)
+    padded = np.full(buckets * bucket_size, np.nan)
+    padded[:length] = values
+    padded = padded.reshape(buckets, bucket_size)
+    offsets = np.arange(buckets) * bucket_size
+    # A NaN never wins, an all NaN bucket gives its first index
+    lows = np.argmin(np.where(np.isnan(padded), np.inf, padded), axis=1) + offsets
+    highs = np.argmax(np.where(np.isnan(padded), -np.inf, padded), axis=1) + offsets
+    indices = np.unique(np.concatenate([[0, length - 1], lows, highs]))
+    return indices[indices < length]
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: the `threshold` points that keep the shape of the line.
+
+    The loop is over the output points, the work per point is vectorized over its bucket.
+
+    Returns:
+        ndarray: Sorted indices, first and last point included.
+    """
+    length = len(y)
+    if threshold >= length or threshold < 3:
+        return np.arange(length)
+
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    edges = np.linspace(1, length - 1, threshold - 1).astype(np.int64)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, length - 1
+    selected = 0
+    for bucket in range(threshold - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        # The third vertex is the average of the next bucket
+        next_start, next_stop = stop, edges[bucket + 2] if bucket + 2 < len(edges) else length
+        next_x, next_y = x[next_start:next_stop].mean(), np.nanmean(y[next_start:next_stop])
+        areas = np.abs(
+            (x[selected] - next_x) * (y[start:stop] - y[selected])
+            - (x[selected] - x[start:stop]) * (next_y - y[selected])
+        )
+        selected = start + int(np.nanargmax(areas)) if not np.isnan(areas).all() else start
+        indices[bucket + 1] = selected
+    return indices
+
+
+def downsample(x, y, budget=None, method="minmax"):
+    """
+    Points of a line chart to draw for a budget of horizontal pixels.
+
+    Args:
+        x (ndarray): x values, increasing.
+        y (ndarray): y values.
+        budget (int): Pixels, defaults to CHART_PIXEL_BUDGET.
+        method (str): "minmax" (two points per pixel, keeps every peak) or "lttb"
+            (one point per pixel, keeps the overall shape).
+
+    Returns:
+        tuple: (x, y) downsampled.
+    """
+    budget = budget or constants.CHART_PIXEL_BUDGET
+    y = np.asarray(y, dtype=float)
+    if method == "minmax":
+        indices = minmax_indices(y, budget)
+    elif method == "lttb":
+        indices = lttb_indices(x, y, budget)
+    else:
+        raise ValueError(f"Unknown downsampling method '{method}'")
+    return np.asarray(x)[indices], y[indices]
+
+
+def quantiles(q, stats=None, values=None):
+    """
+    Quantiles from the column statistics when there are some, else from the values.
+
+    Args:
+        q (float or list): Quantile(s) between 0 and 1.
+        stats (ColumnStatistics): Precomputed statistics of the column.
+        values (Series or ndarray): Column values, missing values are skipped.
+    """
+    if stats is not None:
+        return stats.quantile(q)
+    return np.nanquantile(as_float_array(values), q)
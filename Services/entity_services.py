@@ -0,0 +1,153 @@
+"""
+    Recognises the values of categorical columns in a question ("married" -> marital).
+
+    Every distinct value of every categorical column goes into one Aho-Corasick
+    automaton, so all column / value mentions are found in a single pass over the
+    question whatever the number of values. The automaton is kept in sync with the
+    data set: new values are added, vanished ones dropped, and the failure links are
+    rebuilt lazily on the next search.
+"""
+import threading
+from collections import deque
+
+
+class ValueAutomaton:
+    def __init__(self):
+        # Node 0 is the root. Per node: outgoing edges, failure link and the patterns ending there
+        self.edges = [{}]
+        self.fail = [0]
+        self.outputs = [set()]
+        # Pattern ending at a node -> payloads of that pattern
+        self.payloads = {}
+        self.pattern_nodes = {}
+        self.dirty = False
+
+    def add(self, pattern, payload):
+        node = self.pattern_nodes.get(pattern)
+        if node is None:
+            node = 0
+            for char in pattern:
+                next_node = self.edges[node].get(char)
+                if next_node is None:
+                    next_node = len(self.edges)
+                    self.edges[node][char] = next_node
+                    self.edges.append({})
+                    self.fail.append(0)
+                    self.outputs.append(set())
+                    self.dirty = True
+                node = next_node
+            self.pattern_nodes[pattern] = node
+            self.dirty = True
+        self.payloads.setdefault(pattern, set()).add(payload)
+
+    def remove(self, pattern, payload):
+        # The trie keeps its nodes, the pattern just stops producing this payload
+        payloads = self.payloads.get(pattern)
+        if payloads is not None:
+            payloads.discard(payload)
+
+    def build(self):
+        """
+        Compute the failure links breadth first, and merge the outputs along them.
+        """
+        self.outputs = [set() for _ in self.edges]
+        for pattern, node in self.pattern_nodes.items():
+            self.outputs[node].add(pattern)
+
+        queue = deque()
+        for child in self.edges[0].values():
+            self.fail[child] = 0
+            queue.append(child)
+
+        while queue:
+            node = queue.popleft()
+            for char, child in self.edges[node].items():
+                # Longest proper suffix of the child that is also a prefix in the trie
+                fallback = self.fail[node]
+                while fallback and char not in self.edges[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.edges[fallback].get(char, 0)
+                self.outputs[child] |= self.outputs[self.fail[child]]
+                queue.append(child)
+        self.dirty = False
+
+    def find(self, text):
+        """
+        Yield (start, end, pattern) for every occurrence of every pattern in the text.
+        """
+        if self.dirty:
+            self.build()
+
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in self.edges[node]:
+                node = self.fail[node]
+            node = self.edges[node].get(char, 0)
+            for pattern in self.outputs[node]:
+                if self.payloads.get(pattern):
+                    yield position + 1 - len(pattern), position + 1, pattern
+
+
+class ValueEntityRecognizer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.automaton = ValueAutomaton()
+        # (column, value) pairs currently in the automaton
+        self.entries = set()
+
+    def sync(self, value_domains):
+        """
+        Bring the automaton in line with the categorical values of the data set.
+
+        Args:
+            value_domains (dict): Known values per categorical column (FilterIndex.domains()).
+
+        Returns:
+            ValueEntityRecognizer: self, so it can be used as a registry loader.
+        """
+        wanted = {
+            (column, value)
+            for column, values in value_domains.items()
+            for value in values
+            if str(value).strip()
+        }
+        with self._lock:
+            for column, value in wanted - self.entries:
+                self.automaton.add(str(value).lower(), (column, value))
+            for column, value in self.entries - wanted:
+                self.automaton.remove(str(value).lower(), (column, value))
+            self.entries = wanted
+            if self.automaton.dirty:
+                self.automaton.build()
+        return self
+
+    def find(self, query):
+        """
+        All column / value mentions of the question, as whole words.
+
+        Overlapping mentions keep the leftmost, then longest one
+        ("blue-collar" rather than a value "blue").
+
+        Returns:
+            list: (start, end, [(column, value), ...]) in the order they appear.
+                A value shared by several columns ("yes", "unknown") has several candidates.
+        """
+        text = query.lower()
+        mentions = []
+        with self._lock:
+            for start, end, pattern in self.automaton.find(text):
+                # Whole words only, "single" must not match inside "singles"
+                if start > 0 and text[start - 1].isalnum() and text[start].isalnum():
+                    continue
+                if end < len(text) and text[end].isalnum() and text[end - 1].isalnum():
+                    continue
+                mentions.append((start, end, sorted(self.automaton.payloads[pattern], key=str)))
+
+        mentions.sort(key=lambda mention: (mention[0], -(mention[1] - mention[0])))
+        selected = []
+        last_end = -1
+        for start, end, candidates in mentions:
+            if start >= last_end:
+                selected.append((start, end, candidates))
+                last_end = end
+        return selected
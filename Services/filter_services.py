@@ -0,0 +1,392 @@
+"""
+    Row filtering backed by precomputed indexes.
+
+    Categorical columns get one packed bitmap per value, numeric columns get a sorted
+    index (argsort order + sorted values). A predicate made of equality, range and IN
+    conditions combined with AND / OR is then answered with bitwise operations on the
+    packed bitmaps instead of comparing the full column for every condition.
+
+    The sorted indexes also answer top-k / bottom-k questions by reading k entries
+    from either end of the order.
+"""
+import numpy as np
+import pandas as pd
+
+import constants
+
+# Number of set bits of every byte value, used to count the rows of a packed bitmap
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+OPERATORS = ["==", "!=", "in", "<", "<=", ">", ">=", "between"]
+
+
+def pack_mask(mask):
+    return np.packbits(np.asarray(mask, dtype=bool))
+
+
+def unpack_mask(bitmap, row_count):
+    return np.unpackbits(bitmap, count=row_count).astype(bool)
+
+
+def _rank_order(rows, values, largest):
+    # Best value first, equal values in data set order
+    return rows[np.lexsort((rows, -values if largest else values))]
+
+
+def select_top_rows(values, k, largest=True):
+    """
+    Positions of the k largest (or smallest) values without sorting the column.
+
+    One introselect partition finds the k-th value, only the k selected rows are sorted.
+    Missing values are never selected, ties keep the first rows of the data set.
+
+    Args:
+        values (ndarray): Float values of the column.
+        k (int): Number of rows.
+        largest (bool): The largest values, else the smallest.
+
+    Returns:
+        ndarray: Row positions, best value first.
+    """
+    valid = np.flatnonzero(~np.isnan(values))
+    keys = -values[valid] if largest else values[valid]
+    k = min(k, len(valid))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    kth = np.partition(keys, k - 1)[k - 1]
+    better = keys < kth
+    rows = np.concatenate([valid[better], valid[keys == kth][:k - int(better.sum())]])
+    return _rank_order(rows, values[rows], largest)
+
+
+class Condition:
+    def __init__(self, column, operator, value):
+        if operator not in OPERATORS:
+            raise ValueError(f"Operator '{operator}' is not supported")
+        self.column = column
+        self.operator = operator
+        self.value = value
+
+    def columns(self):
+        return [self.column]
+
+    def mask(self, dataframe):
+        """
+        Evaluate the condition by scanning the column, used when there is no index for it.
+        """
+        series = dataframe[self.column]
+        if self.operator == "==":
+            return (series == self.value).to_numpy(dtype=bool)
+        if self.operator == "!=":
+            return (series.notna() & (series != self.value)).to_numpy(dtype=bool)
+        if self.operator == "in":
+            return series.isin(list(self.value)).to_numpy(dtype=bool)
+        if self.operator == "between":
+            low, high = self.value
+            return series.between(low, high).to_numpy(dtype=bool)
+        if not pd.api.types.is_numeric_dtype(series):
+            raise ValueError(f"Column '{self.column}' must be numeric for '{self.operator}' condition.")
+        compare = {"<": series.lt, "<=": series.le, ">": series.gt, ">=": series.ge}[self.operator]
+        return compare(self.value).to_numpy(dtype=bool)
+
+    def __str__(self):
+        if self.operator == "in":
+            return f"{self.column} in {list(self.value)}"
+        if self.operator == "between":
+            return f"{self.column} between {self.value[0]} and {self.value[1]}"
+        return f"{self.column} {self.operator} {self.value!r}"
+
+
+class And:
+    def __init__(self, *predicates):
+        self.predicates = list(predicates)
+
+    def columns(self):
+        return [column for predicate in self.predicates for column in predicate.columns()]
+
+    def mask(self, dataframe):
+        mask = np.ones(len(dataframe), dtype=bool)
+        for predicate in self.predicates:
+            mask &= predicate.mask(dataframe)
+        return mask
+
+    def __str__(self):
+        return " and ".join(f"({predicate})" if isinstance(predicate, Or) else str(predicate)
+                            for predicate in self.predicates)
+
+
+class Or:
+    def __init__(self, *predicates):
+        self.predicates = list(predicates)
+
+    def columns(self):
+        return [column for predicate in self.predicates for column in predicate.columns()]
+
+    def mask(self, dataframe):
+        mask = np.zeros(len(dataframe), dtype=bool)
+        for predicate in self.predicates:
+            mask |= predicate.mask(dataframe)
+        return mask
+
+    def __str__(self):
+        return " or ".join(f"({predicate})" if isinstance(predicate, And) else str(predicate)
+                           for predicate in self.predicates)
+
+
+class BitmapIndex:
+    def __init__(self, series):
+        self.row_count = 0
+        self.bitmaps = {}
+        self.append(series)
+
+    @classmethod
+    def from_bitmaps(cls, row_count, bitmaps):
+        # Index over bitmaps built elsewhere, e.g. views of a shared memory block
+        index = cls.__new__(cls)
+        index.row_count, index.bitmaps = row_count, bitmaps
+        return index
+
+    def append(self, series):
+        """
+        Add the bits of new rows. Bitmaps are packed per 8 rows, so the old bits are
+        unpacked, extended and packed again.
+        """
+        codes, values = pd.factorize(series)
+        # Stable sort groups the rows of every value, each value then is one slice
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(values) + 1))
+
+        new_row_count = self.row_count + len(series)
+        for position, value in enumerate(values):
+            mask = np.zeros(new_row_count, dtype=bool)
+            if value in self.bitmaps:
+                mask[:self.row_count] = unpack_mask(self.bitmaps[value], self.row_count)
+            mask[self.row_count + order[bounds[position]:bounds[position + 1]]] = True
+            self.bitmaps[value] = pack_mask(mask)
+
+        # Values missing from the new rows only need zero bits at the end
+        for value, bitmap in self.bitmaps.items():
+            if value not in values:
+                mask = np.zeros(new_row_count, dtype=bool)
+                mask[:self.row_count] = unpack_mask(bitmap, self.row_count)
+                self.bitmaps[value] = pack_mask(mask)
+
+        self.row_count = new_row_count
+
+    def values(self):
+        return list(self.bitmaps)
+
+    def nbytes(self):
+        return sum(bitmap.nbytes for bitmap in self.bitmaps.values())
+
+    def lookup(self, value):
+        bitmap = self.bitmaps.get(value)
+        if bitmap is None:
+            return np.zeros((self.row_count + 7) // 8, dtype=np.uint8)
+        return bitmap
+
+    def evaluate(self, condition):
+        if condition.operator == "==":
+            return self.lookup(condition.value)
+        if condition.operator == "in":
+            bitmap = np.zeros((self.row_count + 7) // 8, dtype=np.uint8)
+            for value in condition.value:
+                bitmap |= self.lookup(value)
+            return bitmap
+        if condition.operator == "!=":
+            # Every other known value, missing values are never part of the result
+            return self.evaluate(Condition(condition.column, "in",
+                                           [value for value in self.bitmaps if value != condition.value]))
+        return None
+
+
+class SortedIndex:
+    def __init__(self, series):
+        self.row_count = 0
+        self.order = np.empty(0, dtype=np.int64)
+        self.sorted_values = np.empty(0, dtype=float)
+        self.append(series)
+
+    @classmethod
+    def from_arrays(cls, row_count, order, sorted_values):
+        # Index over arrays built elsewhere, e.g. views of a shared memory block
+        index = cls.__new__(cls)
+        index.row_count, index.order, index.sorted_values = row_count, order, sorted_values
+        return index
+
+    def append(self, series):
+        """
+        Merge new rows into the sorted order with one searchsorted + insert, no full re-sort.
+        Missing values are left out of the index.
+        """
+        values = series.to_numpy(dtype=float, na_value=np.nan)
+        positions = np.flatnonzero(~np.isnan(values))
+        new_order = positions[np.argsort(values[positions], kind="stable")]
+        new_sorted = values[new_order]
+
+        insert_at = np.searchsorted(self.sorted_values, new_sorted, side="right")
+        self.sorted_values = np.insert(self.sorted_values, insert_at, new_sorted)
+        self.order = np.insert(self.order, insert_at, new_order + self.row_count)
+        self.row_count += len(values)
+
+    def nbytes(self):
+        return self.order.nbytes + self.sorted_values.nbytes
+
+    def rows_between(self, low=None, high=None, low_inclusive=True, high_inclusive=True):
+        start = 0 if low is None else np.searchsorted(self.sorted_values, low, side="left" if low_inclusive else "right")
+        stop = len(self.sorted_values) if high is None else \
+            np.searchsorted(self.sorted_values, high, side="right" if high_inclusive else "left")
+        return self.order[start:max(start, stop)]
+
+    def top_rows(self, k, largest=True):
+        """
+        Same rows as select_top_rows, read from the ends of the order: O(log n + k log k).
+        """
+        length = len(self.sorted_values)
+        k = min(k, length)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        if not largest:
+            # Equal values are in row order already, the first k are the answer
+            return self.order[:k]
+
+        boundary = self.sorted_values[length - k]
+        above = np.searchsorted(self.sorted_values, boundary, side="right")
+        first_tie = np.searchsorted(self.sorted_values, boundary, side="left")
+        ties = slice(first_tie, first_tie + k - (length - above))
+        rows = np.concatenate([self.order[above:], self.order[ties]])
+        values = np.concatenate([self.sorted_values[above:], self.sorted_values[ties]])
+        return _rank_order(rows, values, largest)
+
+    def evaluate(self, condition):
+        value = condition.value
+        if condition.operator == "==":
+            rows = self.rows_between(value, value)
+        elif condition.operator == "in":
+            rows = np.concatenate([self.rows_between(item, item) for item in value] or [np.empty(0, dtype=np.int64)])
+        elif condition.operator == "between":
+            rows = self.rows_between(value[0], value[1])
+        elif condition.operator == "<":
+            rows = self.rows_between(high=value, high_inclusive=False)
+        elif condition.operator == "<=":
+            rows = self.rows_between(high=value)
+        elif condition.operator == ">":
+            rows = self.rows_between(low=value, low_inclusive=False)
+        elif condition.operator == ">=":
+            rows = self.rows_between(low=value)
+        else:
+            # != is everything below plus everything above
+            rows = np.concatenate([self.rows_between(high=value, high_inclusive=False),
+                                   self.rows_between(low=value, low_inclusive=False)])
+
+        mask = np.zeros(self.row_count, dtype=bool)
+        mask[rows] = True
+        return pack_mask(mask)
+
+
+class FilterIndex:
+    def __init__(self, max_categories=None):
+        self.max_categories = max_categories or constants.STATS_MAX_CATEGORIES
+        self.indexes = {}
+        self.row_count = 0
+
+    @classmethod
+    def from_indexes(cls, row_count, indexes):
+        filter_index = cls()
+        filter_index.row_count, filter_index.indexes = row_count, indexes
+        return filter_index
+
+    def build(self, dataframe):
+        """
+        Index every column: numeric columns get a sorted index, low-cardinality
+        columns get bitmaps, the rest stay unindexed and are scanned.
+        """
+        self.indexes = {}
+        self.row_count = len(dataframe)
+        for column in dataframe.columns:
+            series = dataframe[column]
+            if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                self.indexes[column] = SortedIndex(series)
+            elif series.nunique() <= self.max_categories:
+                self.indexes[column] = BitmapIndex(series)
+        return self
+
+    def append(self, rows):
+        for column, index in self.indexes.items():
+            index.append(rows[column])
+        self.row_count += len(rows)
+        return self
+
+    def is_current(self, dataframe):
+        return self.row_count == len(dataframe)
+
+    def nbytes(self):
+        return sum(index.nbytes() for index in self.indexes.values())
+
+    def domains(self):
+        """
+        Known values of every categorical column, e.g. {'marital': ['married', 'single', ...]}.
+        """
+        return {
+            column: index.values()
+            for column, index in self.indexes.items()
+            if isinstance(index, BitmapIndex)
+        }
+
+    def evaluate(self, predicate, dataframe=None):
+        """
+        Evaluate a predicate to a packed bitmap of the matching rows.
+
+        Args:
+            predicate (Condition, And or Or): The filter to apply.
+            dataframe (DataFrame): Only needed for conditions on unindexed columns.
+
+        Returns:
+            ndarray: Packed bitmap (np.packbits) with one bit per row.
+        """
+        if isinstance(predicate, And):
+            bitmap = pack_mask(np.ones(self.row_count, dtype=bool))
+            for child in predicate.predicates:
+                bitmap &= self.evaluate(child, dataframe)
+            return bitmap
+
+        if isinstance(predicate, Or):
+            bitmap = np.zeros((self.row_count + 7) // 8, dtype=np.uint8)
+            for child in predicate.predicates:
+                bitmap |= self.evaluate(child, dataframe)
+            return bitmap
+
+        index = self.indexes.get(predicate.column)
+        bitmap = index.evaluate(predicate) if index is not None else None
+        if bitmap is None:
+            if dataframe is None:
+                raise ValueError(f"Column '{predicate.column}' is not indexed for '{predicate.operator}' condition.")
+            bitmap = pack_mask(predicate.mask(dataframe))
+        return bitmap
+
+    def top_rows(self, column, k, largest=True):
+        """
+        Positions of the k rows with the largest (or smallest) values of the column.
+
+        Returns:
+            ndarray: Row positions, best value first. None when the column has no sorted index.
+        """
+        index = self.indexes.get(column)
+        if not isinstance(index, SortedIndex):
+            return None
+        return index.top_rows(k, largest)
+
+    def rows(self, predicate, dataframe=None):
+        return np.flatnonzero(unpack_mask(self.evaluate(predicate, dataframe), self.row_count))
+
+    def count(self, predicate, dataframe=None):
+        # Padding bits of the last byte are never set, so counting bits counts rows
+        return int(_POPCOUNT[self.evaluate(predicate, dataframe)].sum())
+
+    def filter(self, dataframe, predicate):
+        """
+        Rows of the dataframe matching the predicate.
+        """
+        return dataframe.iloc[self.rows(predicate, dataframe)]
+
@@ -0,0 +1,119 @@
+"""
+    Group by aggregations ("average balance by job") over integer category codes.
+
+    The key column is turned into codes once, then every aggregate is a vectorized
+    reduction: np.bincount for count / sum / mean and ufunc.reduceat over the rows
+    sorted by code for min / max. Results are cached per (aggregate, measure, key).
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+GROUP_BY_AGGREGATES = ["count", "sum", "mean", "max", "min"]
+
+
+class GroupByService:
+    def __init__(self, dataframe):
+        self.dataframe = dataframe
+        self._lock = threading.Lock()
+        # key column -> (codes, groups) of the whole dataframe
+        self._codes = {}
+        # (aggregate, measure, key) -> result DataFrame
+        self._results = {}
+
+    @staticmethod
+    def encode(series):
+        """
+        Integer codes of the key column and the group labels. -1 marks a missing key.
+        """
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            return series.cat.codes.to_numpy(), series.cat.categories
+        codes, groups = pd.factorize(series, sort=True)
+        return codes, groups
+
+    def key_codes(self, dataframe, key):
+        if dataframe is not self.dataframe:
+            return self.encode(dataframe[key])
+        with self._lock:
+            if key not in self._codes:
+                self._codes[key] = self.encode(dataframe[key])
+            return self._codes[key]
+
+    def aggregate(self, aggregate, key, measure=None, dataframe=None):
+        """
+        Aggregate the measure column per value of the key column.
+
+        Args:
+            aggregate (str): One of GROUP_BY_AGGREGATES.
+            key (str): Column to group by.
+            measure (str): Numeric column to aggregate, None to count rows.
+            dataframe (DataFrame): Rows to use, defaults to the whole data set.
+                Only results over the whole data set are cached.
+
+        Returns:
+            DataFrame: One row per group, with the key and the aggregated value.
+        """
+        dataframe = self.dataframe if dataframe is None else dataframe
+        if aggregate not in GROUP_BY_AGGREGATES:
+            raise ValueError(f"Action '{aggregate}' is not supported for group by")
+        if measure is None and aggregate != "count":
+            raise ValueError(f"A column is needed for {aggregate} by {key}")
+
+        cache_key = (aggregate, measure, key)
+        if dataframe is self.dataframe and cache_key in self._results:
+            return self._results[cache_key]
+
+        result = self._compute(dataframe, aggregate, key, measure)
+
+        if dataframe is self.dataframe:
+            with self._lock:
+                self._results[cache_key] = result
+        return result
+
+    def _compute(self, dataframe, aggregate, key, measure):
+        codes, groups = self.key_codes(dataframe, key)
+        valid = codes >= 0
+
+        if measure is None:
+            values = None
+        else:
+            if not pd.api.types.is_numeric_dtype(dataframe[measure]):
+                raise ValueError(f"Column '{measure}' must be numeric for {aggregate} operation.")
+            values = dataframe[measure].to_numpy(dtype=float, na_value=np.nan)
+            valid &= ~np.isnan(values)
+
+        group_codes = codes[valid]
+        counts = np.bincount(group_codes, minlength=len(groups))
+
+        if aggregate == "count":
+            aggregated = counts
+        elif aggregate in ("sum", "mean"):
+            sums = np.bincount(group_codes, weights=values[valid], minlength=len(groups))
+            if aggregate == "sum":
+                # bincount sums in float, integer columns get integer sums back
+                integer = pd.api.types.is_integer_dtype(dataframe[measure])
+                aggregated = np.rint(sums).astype(np.int64) if integer else sums
+            else:
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    aggregated = sums / counts
+        else:
+            # Sort the rows by group, then reduce every contiguous run of one group
+            order = np.argsort(group_codes, kind="stable")
+            sorted_values = values[valid][order]
+            present = np.flatnonzero(counts)
+            starts = np.concatenate([[0], np.cumsum(counts[present])[:-1]])
+            reduce = np.maximum if aggregate == "max" else np.minimum
+            aggregated = np.full(len(groups), np.nan)
+            if len(sorted_values):
+                aggregated[present] = reduce.reduceat(sorted_values, starts)
+
+        value_name = f"{aggregate}_{measure}" if measure is not None else "count"
+        result = pd.DataFrame({key: np.asarray(groups), value_name: aggregated})
+        # Groups without rows are left out, like pandas groupby(observed=True)
+        return result[counts > 0].reset_index(drop=True)
+
+    def clear(self):
+        with self._lock:
+            self._codes = {}
+            self._results = {}
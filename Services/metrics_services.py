@@ -0,0 +1,267 @@
+"""
+    Latency metrics of the query pipeline.
+
+    Every stage (vectorize, classify, column_match, execute, plot, savefig, ...) is timed
+    with a span that adds its duration to a histogram of fixed log-spaced buckets: one
+    perf_counter pair, a bisect and a lock per span. The histograms give p50/p95/p99
+    and are exported as JSON or in the Prometheus text format.
+
+    A question is wrapped in trace_query(): when it takes longer than SLOW_QUERY_MS,
+    its stage timings are passed to the slow query hooks. With the sampling profiler
+    switched on, the stacks of the thread answering it are sampled while it runs and
+    the hottest ones are part of the report.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+import constants
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyHistogram:
+    def __init__(self, bounds):
+        # Upper bounds in seconds, the last bucket has no bound
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.buckets[bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """
+        Quantile estimated from the buckets, linear inside the bucket it falls in.
+        """
+        if not self.count:
+            return float("nan")
+        rank = q * self.count
+        seen = 0
+        for position, bucket_count in enumerate(self.buckets):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.bounds[position - 1] if position > 0 else 0.0
+                upper = self.bounds[position] if position < len(self.bounds) else self.max
+                estimate = lower + (upper - lower) * (rank - seen) / bucket_count
+                return min(estimate, self.max)
+            seen += bucket_count
+        return self.max
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of the threads answering a question, every interval_ms.
+
+    Only threads inside trace_query() are sampled, the sampler thread sleeps otherwise.
+    """
+    def __init__(self, interval_ms=None, max_depth=None):
+        self.interval = (interval_ms or constants.PROFILER_INTERVAL_MS) / 1000
+        self.max_depth = max_depth or constants.PROFILER_MAX_DEPTH
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def begin(self, thread_id):
+        with self._lock:
+            self._samples[thread_id] = Counter()
+
+    def end(self, thread_id):
+        with self._lock:
+            return self._samples.pop(thread_id, Counter())
+
+    def _stack(self, frame):
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            code = frame.f_code
+            stack.append(f"{os.path.basename(code.co_filename)}:{frame.f_lineno} {code.co_name}")
+            frame = frame.f_back
+        return tuple(stack)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                thread_ids = list(self._samples)
+            if not thread_ids:
+                continue
+            frames = sys._current_frames()
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = self._stack(frame)
+                with self._lock:
+                    samples = self._samples.get(thread_id)
+                    if samples is not None:
+                        samples[stack] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def log_slow_query(report):
+    lines = [f"Slow query ({report['elapsed_ms']:.1f} ms): {report['query']!r}"]
+    lines += [f"    {stage:<14} {elapsed_ms:10.2f} ms" for stage, elapsed_ms in report["stages"]]
+    for stack, samples in report.get("profile") or []:
+        lines.append(f"    {samples} samples in {stack[0]}, called from {' < '.join(stack[1:4])}")
+    logger.warning("\n".join(lines))
+
+
+class Span:
+    # A class, not a generator context manager: a span is on the path of every question
+    __slots__ = ("registry", "stage", "start")
+
+    def __init__(self, registry, stage):
+        self.registry = registry
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.registry.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class MetricsRegistry:
+    def __init__(self, buckets_ms=None, slow_query_ms=None):
+        self.bounds = [bound / 1000 for bound in (buckets_ms or constants.METRICS_BUCKETS_MS)]
+        self.slow_query_ms = slow_query_ms or constants.SLOW_QUERY_MS
+        self.enabled = constants.METRICS_ENABLED
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.histograms = {}
+        self.slow_queries = 0
+        self.slow_query_hooks = [log_slow_query]
+        self.profiler = None
+
+    def span(self, stage):
+        return Span(self, stage) if self.enabled else nullcontext()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = LatencyHistogram(self.bounds)
+            histogram.observe(seconds)
+        trace = getattr(self._local, "trace", None)
+        if trace is not None:
+            trace.append((stage, seconds * 1000))
+
+    @contextmanager
+    def trace_query(self, query, stage="query"):
+        """
+        Time a whole question, and report it to the slow query hooks when it is slow.
+        Nested traces are timed as plain spans.
+        """
+        if not self.enabled or getattr(self._local, "trace", None) is not None:
+            with self.span(stage):
+                yield
+            return
+
+        self._local.trace = []
+        profiler = self.profiler
+        thread_id = threading.get_ident()
+        if profiler is not None:
+            profiler.begin(thread_id)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stages, self._local.trace = self._local.trace, None
+            samples = profiler.end(thread_id) if profiler is not None else None
+            self.observe(stage, elapsed)
+            if elapsed * 1000 >= self.slow_query_ms:
+                self.report_slow_query(query, elapsed, stages, samples)
+
+    def report_slow_query(self, query, elapsed, stages, samples=None):
+        with self._lock:
+            self.slow_queries += 1
+        report = {
+            "query": query,
+            "elapsed_ms": elapsed * 1000,
+            "stages": stages,
+            # Hottest stacks, innermost frame first
+            "profile": samples.most_common(constants.PROFILER_TOP_STACKS) if samples else None,
+        }
+        for hook in list(self.slow_query_hooks):
+            try:
+                hook(report)
+            except Exception:
+                logger.exception("Slow query hook failed")
+
+    def enable_profiler(self, interval_ms=None):
+        # Sample the stacks of every question from now on, slow ones report their hottest stacks
+        if self.profiler is None:
+            self.profiler = SamplingProfiler(interval_ms)
+        return self.profiler
+
+    def disable_profiler(self):
+        profiler, self.profiler = self.profiler, None
+        if profiler is not None:
+            profiler.stop()
+
+    def to_dict(self):
+        """
+        Count, mean, p50, p95, p99 and max (ms) of every stage.
+        """
+        with self._lock:
+            stages = {}
+            for stage, histogram in sorted(self.histograms.items()):
+                stages[stage] = {
+                    "count": histogram.count,
+                    "mean_ms": histogram.sum / histogram.count * 1000 if histogram.count else None,
+                    "p50_ms": histogram.quantile(0.50) * 1000,
+                    "p95_ms": histogram.quantile(0.95) * 1000,
+                    "p99_ms": histogram.quantile(0.99) * 1000,
+                    "max_ms": histogram.max * 1000,
+                }
+            return {"stages": stages, "slow_queries": self.slow_queries}
+
+    def to_prometheus(self, prefix="askquery"):
+        """
+        Histograms in the Prometheus text exposition format.
+        """
+        name = f"{prefix}_stage_seconds"
+        lines = [
+            f"# HELP {name} Latency of the query pipeline stages.",
+            f"# TYPE {name} histogram",
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.bounds + [float("inf")], histogram.buckets):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else f"{bound:.6g}"
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum:.9g}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+            lines += [
+                f"# HELP {prefix}_slow_queries_total Questions slower than {self.slow_query_ms} ms.",
+                f"# TYPE {prefix}_slow_queries_total counter",
+                f"{prefix}_slow_queries_total {self.slow_queries}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.slow_queries = 0
+
+
+# One registry per process, shared by the app, the server and the use cases
+metrics = MetricsRegistry()
@@ -1,28 +1,41 @@
 import os
 
-import joblib
-import nltk
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
-from fuzzywuzzy import fuzz
-from streamlit import dataframe
 import re
+import numpy as np
 import pandas as pd
-from Services.charts_services import VisualizationServices
+from intent_classifier.compiled_model import load_compiled_model
+from Services.column_matcher import matcher_for
+from Services.entity_services import ValueEntityRecognizer
+from Services.filter_services import And, Condition, Or, select_top_rows
+from Services.groupby_services import GROUP_BY_AGGREGATES, GroupByService
+from Services.metrics_services import metrics
 
 import constants
 
+
+# nltk, joblib and scikit-learn are imported on first use only, parsing and executing
+# a question needs none of them once the shared resources are loaded
+def load_stopwords():
+    from nltk.corpus import stopwords
+    return set(stopwords.words("english"))
+
+
 class NLPServices:
-    def __init__(self, intent_keywords):
+    def __init__(self, intent_keywords, intent_model=None, stop_words=None, value_recognizer=None):
         self.intent_keywords = intent_keywords if intent_keywords else constants.INTENT_KEYWORDS
-        self.stop_words = set(stopwords.words('english'))
-        self.intent_classifier, self.query_vectorizer = self.load_model()
+        # Shared resources can be passed in so nothing is loaded per query
+        self.stop_words = stop_words if stop_words is not None else load_stopwords()
+        self.intent_classifier, self.query_vectorizer = intent_model if intent_model else self.load_model()
+        # Built at load time from the categorical values, or on first use from value_domains
+        self.value_recognizer = value_recognizer
+        self._owns_recognizer = value_recognizer is None
 
     def preprocess(self, query):
+        from nltk.tokenize import word_tokenize
         tokens = word_tokenize(query.lower())
         return [word for word in tokens if word.isalpha() and word not in self.stop_words]
 
-    def parse_query(self, query, df_columns, threshold = 70):
+    def parse_query(self, query, df_columns, threshold = 70, value_domains=None):
 
         # This is rule based Intent Detection
 
@@ -40,92 +53,332 @@ class NLPServices:
 
 
         # This is ML based Intent Detection - Created by Synthetic data
-        print("QUery", query)
-        x_vector = self.query_vectorizer.transform([query])
-        intent_prediction = self.intent_classifier.predict(x_vector)
+        with metrics.span("vectorize"):
+            x_vector = self.query_vectorizer.transform([query])
+        with metrics.span("classify"):
+            intent_prediction = self.intent_classifier.predict(x_vector)
 
         best_intent = None
-        if intent_prediction:
-            print("this is intent", intent_prediction)
+        if len(intent_prediction):
             best_intent = intent_prediction[0]
 
-        matched_column = None
-        if best_intent is not None:
-            matched_column = self.match_column(query, df_columns, threshold)
+        return self.build_intent(query, best_intent, df_columns, threshold, value_domains)
+
+    def parse_queries(self, queries, df_columns, threshold=70, value_domains=None):
+        """
+        Parse many questions at once.
+
+        All distinct questions are vectorized and classified in one sparse matrix call,
+        and questions that only differ in case or spacing are parsed once.
+
+        Args:
+            queries (list): Natural language questions.
+            df_columns (list): The actual column names in the DataFrame.
+            threshold (int): Minimum fuzzy matching score to consider a column a match.
+            value_domains (dict): Known values per categorical column (FilterIndex.domains()).
+
+        Returns:
+            list: One parsed intent per question, in the same order.
+        """
+        normalized = [" ".join(str(query).lower().split()) for query in queries]
+        unique_queries = list(dict.fromkeys(normalized))
+        if not unique_queries:
+            return []
+
+        with metrics.span("vectorize"):
+            x_vectors = self.query_vectorizer.transform(unique_queries)
+        with metrics.span("classify"):
+            predictions = self.intent_classifier.predict(x_vectors)
+        match_cache = {}
+        parsed = {
+            query: self.build_intent(query, intent, df_columns, threshold, value_domains, match_cache)
+            for query, intent in zip(unique_queries, predictions)
+        }
+        # Copies, so changing one result never changes the intent of a duplicate question
+        return [dict(parsed[query]) for query in normalized]
+
+    def build_intent(self, query, best_intent, df_columns, threshold=70, value_domains=None, match_cache=None):
+        limit, ranked_action, ranked_column, measure_query = self.extract_limit(query, df_columns, value_domains)
+        if limit is not None:
+            best_intent = ranked_action
+        if ranked_column is not None:
+            # "top 10 clients by balance" ranks on balance, "by" is not a group by here
+            group_by = None
+        else:
+            # "top 5 balance by job" ranks the groups of job on the measured column
+            group_by, measure_query = self.extract_group_by(measure_query, df_columns)
+            if group_by is not None and limit is None:
+                # "average balance by job" is an aggregate per job whatever the classifier says
+                best_intent = self.keyword_intent(query, GROUP_BY_AGGREGATES) or best_intent
+        if limit is None and group_by is None:
+            # "maximum age" asks for the extreme value whatever the classifier says
+            best_intent = self.keyword_intent(query, ["max", "min"]) or best_intent
+
+        matched_column = (ranked_column, 100) if ranked_column is not None else None
+        if best_intent is not None and matched_column is None:
+            # The group by column is not a candidate for the measured column
+            with metrics.span("column_match"):
+                if match_cache is not None:
+                    if measure_query not in match_cache:
+                        match_cache[measure_query] = self.match_column(measure_query, df_columns, threshold)
+                    matched_column = match_cache[measure_query]
+                else:
+                    matched_column = self.match_column(measure_query, df_columns, threshold)
+
+        with metrics.span("conditions"):
+            filters = self.extract_conditions(query, df_columns, value_domains)
 
         return {
             "action": best_intent,
             "column": matched_column[0] if matched_column else None,
             "column_match_score": matched_column[1] if matched_column else None,
+            "filters": filters,
+            "group_by": group_by,
+            # Number of rows of a top-k / bottom-k question, None for a single value
+            "limit": limit,
         }
 
-    def match_column(self, user_question, df_columns, threshold=70):
+    def keyword_intent(self, query, intents):
+        """
+        The intent whose keyword comes first in the question, among the given intents.
+
+        Returns:
+            str: The intent, or None when none of their keywords is in the question.
+        """
+        query_lower = query.lower()
+        first = None
+        for intent in intents:
+            for keyword in self.intent_keywords.get(intent, []):
+                match = re.search(rf"\b{re.escape(keyword)}\b", query_lower)
+                if match is not None and (first is None or match.start() < first[0]):
+                    first = (match.start(), intent)
+        return first[1] if first else None
+
+    def extract_limit(self, query, df_columns, value_domains=None):
+        """
+        Find a "top <k>" / "<k> lowest" phrase, and the "by <column>" it ranks on.
+
+        A categorical column (one of value_domains) is never ranked on, its "by" is a
+        group by and is left in the query.
+
+        Returns:
+            tuple: (k or None, "max" or "min", ranked column or None, query without the phrases)
+        """
+        match = re.search(r"\b(top|highest|largest|biggest|bottom|lowest|smallest)\s+(\d+)\b", query.lower()) or \
+            re.search(r"\b(\d+)\s+(highest|largest|biggest|lowest|smallest)\b", query.lower())
+        if match is None:
+            return None, None, None, query
+
+        word, number = (match.group(1), match.group(2)) if not match.group(1).isdigit() else \
+            (match.group(2), match.group(1))
+        action = "min" if word in ("bottom", "lowest", "smallest") else "max"
+        rest = query[:match.start()] + query[match.end():]
+
+        columns_by_name = {str(column).lower(): column for column in df_columns}
+        categorical = set(value_domains or ())
+        for by_match in re.finditer(r"\bby\s+([a-z_][\w.]*)", rest.lower()):
+            column = columns_by_name.get(by_match.group(1))
+            if column is not None and column not in categorical:
+                return int(number), action, column, rest[:by_match.start()] + rest[by_match.end():]
+        return int(number), action, None, rest
+
+    def extract_group_by(self, query, df_columns):
+        """
+        Find a "by <column>" / "per <column>" / "for each <column>" phrase.
+
+        Returns:
+            tuple: (group by column or None, query without the phrase)
+        """
+        columns_by_name = {str(column).lower(): column for column in df_columns}
+        for match in re.finditer(r"\b(?:by|per|for each|each|across)\s+([a-z_][\w.]*)", query.lower()):
+            column = columns_by_name.get(match.group(1))
+            if column is not None:
+                return column, query[:match.start()] + query[match.end():]
+        return None, query
+
+    def extract_conditions(self, query, df_columns, value_domains=None):
         """
-        Match terms from the user question to DataFrame columns using fuzzy string matching.
+        Find the row filters in the question.
+
+        Two kinds of conditions are recognised:
+            - comparisons written against a column, e.g. "age > 30" or "job = management"
+            - known values of categorical columns, e.g. "unemployed" -> job == 'unemployed'
+            - words of VALUE_ALIASES, e.g. "subscribed" -> y == 'yes'
 
         Args:
-            user_question (str): Natural language input from the user.
+            query (str): Natural language input from the user.
             df_columns (list): The actual column names in the DataFrame.
-            threshold (int): Minimum fuzzy matching score to consider a column a match.
+            value_domains (dict): Known values per categorical column (FilterIndex.domains()).
 
         Returns:
-            list: A list of column names from the DataFrame that best match the question.
+            Condition, And, Or or None: The predicate, None when the question has no filter.
+        """
+        columns_by_name = {str(column).lower(): column for column in df_columns}
+        query_lower = query.lower()
+        conditions = []
+        used_spans = []
+
+        for match in re.finditer(r"([a-z_][\w.]*)\s*(<=|>=|!=|==|=|<|>)\s*([\w.\-]+)", query_lower):
+            column = columns_by_name.get(match.group(1))
+            if column is None:
+                continue
+            operator = "==" if match.group(2) in ("=", "==") else match.group(2)
+            conditions.append(Condition(column, operator, self._condition_value(match.group(3), column, value_domains)))
+            used_spans.append(match.span())
+
+        # Categorical values mentioned on their own, grouped per column
+        values_by_column = {}
+        recognizer = self.get_value_recognizer(value_domains)
+        if recognizer is not None:
+            for start, end, candidates in recognizer.find(query):
+                if any(span_start < end and start < span_end for span_start, span_end in used_spans):
+                    continue
+                if len(candidates) > 1:
+                    # Values such as "yes" or "unknown" exist in many columns, keep the one named in the question
+                    candidates = [candidate for candidate in candidates
+                                  if re.search(rf"\b{re.escape(str(candidate[0]).lower())}\b", query_lower)]
+                if len(candidates) == 1:
+                    column, value = candidates[0]
+                    values_by_column.setdefault(column, [])
+                    if value not in values_by_column[column]:
+                        values_by_column[column].append(value)
+
+        # Words that stand for a value, e.g. "subscribed" clients are the rows where y is 'yes'
+        for word, (column, value) in constants.VALUE_ALIASES.items():
+            named = column in values_by_column or any(condition.column == column for condition in conditions)
+            if column in columns_by_name.values() and not named and re.search(rf"\b{re.escape(word)}\b", query_lower):
+                values_by_column[column] = [self._condition_value(value, column, value_domains)]
+
+        for column, values in values_by_column.items():
+            conditions.append(Condition(column, "==", values[0]) if len(values) == 1 else Condition(column, "in", values))
+
+        if not conditions:
+            return None
+        if len(conditions) == 1:
+            return conditions[0]
+        return Or(*conditions) if re.search(r"\bor\b", query_lower) else And(*conditions)
+
+    def get_value_recognizer(self, value_domains=None):
         """
-        matched_columns = []
+        The value recognizer to use, a shared one when given, else one kept in sync with value_domains.
+        """
+        if not value_domains or not self._owns_recognizer:
+            return self.value_recognizer
+        if self.value_recognizer is None:
+            self.value_recognizer = ValueEntityRecognizer()
+        # Only new or vanished values touch the automaton
+        return self.value_recognizer.sync(value_domains)
+
+    @staticmethod
+    def _condition_value(text, column, value_domains):
+        # Categorical columns compare against their own spelling of the value
+        for value in (value_domains or {}).get(column, []):
+            if str(value).lower() == text:
+                return value
+        try:
+            number = float(text)
+            return int(number) if number.is_integer() else number
+        except ValueError:
+            return text
 
-        for col in df_columns:
-            # Calculate similarity between the column name and the entire user question
-            # partial_ratio is used because it can match substrings (e.g., "sales" in "total sales figures")
-            score = fuzz.partial_ratio(col.lower(), user_question.lower())
+    def match_column(self, user_question, df_columns, threshold=70):
+        """
+        Match terms from the user question to DataFrame columns.
 
-            # Only consider columns with a match score above the threshold
-            if score >= threshold:
-                matched_columns.append((col, score))
+        Args:
+            user_question (str): Natural language input from the user.
+            df_columns (list): The actual column names in the DataFrame.
+            threshold (int): Minimum matching score to consider a column a match.
 
-        # Sort matched columns by score in descending order to prioritize the best matches
-        matched_columns.sort(key=lambda x: x[1], reverse=True)
+        Returns:
+            tuple: (column, score) of the best matching column, or None.
+        """
+        # The column index is built once per schema and process, NLPServices is built per question
+        matcher = matcher_for(tuple(df_columns))
 
-        # Return only the column names
         # for now only return the max matched column
-        return matched_columns[0]
+        return matcher.best_match(user_question, threshold)
+
+    @staticmethod
+    def load_model(model_name = constants.INTENT_MODEL_NAME, vector_name = constants.INTENT_VECTORIZER_NAME,
+                   compiled_name = constants.INTENT_COMPILED_MODEL_NAME,
+                   online_name = constants.INTENT_ONLINE_MODEL_NAME):
 
-    def load_model(self, model_name = 'clf_folded.joblib', vector_name = 'vectorizer_folded.joblib'):
+        # The compiled models score with NumPy only, scikit-learn is not even imported
+        for name in (online_name, compiled_name):
+            if name:
+                compiled_path = os.path.join(constants.MODELS_DIR, name)
+                if os.path.exists(compiled_path):
+                    return load_compiled_model(compiled_path)
 
         if not model_name:
             raise Exception('No model path provided.')
 
-        model_path = os.path.join('./models/', model_name)
-        vectorizer_path = os.path.join('./models/', vector_name)
+        model_path = os.path.join(constants.MODELS_DIR, model_name)
+        vectorizer_path = os.path.join(constants.MODELS_DIR, vector_name)
 
         if not os.path.exists(model_path):
             raise Exception('Model path does not exist.')
 
+        import joblib
         classifier_model = joblib.load(model_path)
         vectorizer = joblib.load(vectorizer_path)
 
         return classifier_model, vectorizer
 
 class IntentExecutorServices:
-    def __init__(self, dataframe, query_intent):
+    def __init__(self, dataframe, query_intent, stats_index=None, filter_index=None, groupby_service=None):
         self.dataframe = dataframe
         self.query_intent = query_intent
+        # Keeps the category codes and the results of earlier group by questions
+        self.groupby_service = groupby_service if groupby_service is not None else GroupByService(dataframe)
+        # Precomputed statistics, the column is only scanned when they are missing
+        self.stats_index = stats_index
+        # Bitmap / sorted indexes used to apply the filters of the question
+        self.filter_index = filter_index
+
+    def apply_filters(self, predicate):
+        if self.filter_index is not None and self.filter_index.is_current(self.dataframe):
+            return self.filter_index.filter(self.dataframe, predicate)
+        return self.dataframe[predicate.mask(self.dataframe)]
+
+    def column_stats(self, column):
+        if self.stats_index is None or not self.stats_index.is_current(self.dataframe):
+            return None
+        return self.stats_index.get(column)
 
     def execute(self):
         action = self.query_intent.get("action")
         column = self.query_intent.get("column")
 
-        print(action, column)
+        predicate = self.query_intent.get("filters")
+        group_by = self.query_intent.get("group_by")
+
+        if predicate is not None:
+            # The rest of the question is answered on the matching rows only
+            self.dataframe = self.apply_filters(predicate)
+            if action == "filter":
+                return self.dataframe
+
+        if group_by is not None and action in GROUP_BY_AGGREGATES:
+            return self.handle_group_by(action, column, group_by)
+
         if not action or not column:
             raise ValueError("Could not understand the intent or column.")
 
         if column not in self.dataframe.columns:
             raise ValueError(f"Column '{column}' not found.")
 
-        # Numeric checks for mean and sum
-        if action in ["mean", "sum"]:
+        # Numeric checks for mean, sum and the extreme values
+        if action in ["mean", "sum", "max", "min"]:
             if not pd.api.types.is_numeric_dtype(self.dataframe[column]):
                 raise ValueError(f"Column '{column}' must be numeric for {action} operation.")
 
+        if action in ["max", "min"] and self.query_intent.get("limit") is not None:
+            # The matching rows are the answer
+            return self.handle_top_rows(column, self.query_intent["limit"], largest=action == "max",
+                                        filtered=predicate is not None)
+
         if action == "mean":
             result =  self.handle_mean(column)
         elif action == "sum":
@@ -134,25 +387,75 @@ class IntentExecutorServices:
             result = self.handle_count(column)
         elif action == "filter":
             result = self.handle_filter(column)
+        elif action in ["max", "min"]:
+            result = self.handle_extreme(column, largest=action == "max")
         else:
-            raise f"Action '{action}' is not supported yet"
+            raise ValueError(f"Action '{action}' is not supported yet")
+
+        if predicate is not None:
+            result = f"{result} (where {predicate})"
+        return result
+
+    def handle_group_by(self, action, column, group_by):
+        if group_by not in self.dataframe.columns:
+            raise ValueError(f"Column '{group_by}' not found.")
+        if column is not None and column not in self.dataframe.columns:
+            raise ValueError(f"Column '{column}' not found.")
 
+        # Counting needs no measured column, it counts the rows of every group
+        measure = None if action == "count" or column == group_by else column
+        result = self.groupby_service.aggregate(action, group_by, measure=measure, dataframe=self.dataframe)
+
+        limit = self.query_intent.get("limit")
+        if limit is not None:
+            # The k groups with the largest (or smallest) aggregate, best first
+            value_name = result.columns[-1]
+            result = result.sort_values(value_name, ascending=action == "min", kind="stable").head(limit)
+            result = result.reset_index(drop=True)
         return result
 
     def handle_mean(self, column):
-        mean_val = self.dataframe[column].mean()
+        stats = self.column_stats(column)
+        mean_val = stats.mean if stats is not None else self.dataframe[column].mean()
         return f"Average {column}: {mean_val:.2f}"
 
     def handle_sum(self, column):
-        sum_val = self.dataframe[column].sum()
+        stats = self.column_stats(column)
+        sum_val = stats.sum if stats is not None else self.dataframe[column].sum()
         return f"Sum of {column}: {sum_val}"
 
     def handle_count(self, column):
-        count_val = self.dataframe[column].count()
+        stats = self.column_stats(column)
+        count_val = stats.count if stats is not None else self.dataframe[column].count()
         return f"Count of {column}: {count_val}"
 
+    def handle_extreme(self, column, largest=True):
+        stats = self.column_stats(column)
+        if stats is not None:
+            value = stats.max if largest else stats.min
+        else:
+            value = self.dataframe[column].max() if largest else self.dataframe[column].min()
+        return f"{'Maximum' if largest else 'Minimum'} {column}: {value}"
+
+    def handle_top_rows(self, column, k, largest=True, filtered=False):
+        """
+        The k rows with the largest (or smallest) values of the column, best first.
+
+        Read from the sorted index of the column in O(k) when it covers these rows,
+        else selected from the column with one partition, no full sort.
+        """
+        rows = None
+        if not filtered and self.filter_index is not None and self.filter_index.is_current(self.dataframe):
+            rows = self.filter_index.top_rows(column, k, largest)
+        if rows is None:
+            rows = select_top_rows(self.dataframe[column].to_numpy(dtype=float, na_value=np.nan), k, largest)
+        return self.dataframe.iloc[rows]
+
     def handle_filter(self, column):
-        unique_vals = self.dataframe[column].unique()
+        stats = self.column_stats(column)
+        unique_vals = stats.unique_values() if stats is not None else None
+        if unique_vals is None:
+            unique_vals = self.dataframe[column].unique()
         return f"Unique values in {column}: {list(unique_vals)}"
 
 
@@ -0,0 +1,116 @@
+"""
+    Process wide registry of the expensive resources (data set, intent model, stopwords).
+
+    A resource is loaded once on first use (or by the warm up hook) and then shared
+    by every caller of the process. Resources that watch files are reloaded when one
+    of those files changes. Access is thread safe, Streamlit runs every session in its own thread.
+"""
+import os
+import threading
+
+# Loaded once and kept until released
+LIFETIME_PROCESS = "process"
+# Reloaded when one of the watched files changes
+LIFETIME_WATCH = "watch"
+
+
+class _Resource:
+    def __init__(self, name, loader, lifetime, watch_paths):
+        self.name = name
+        self.loader = loader
+        self.lifetime = lifetime
+        self.watch_paths = list(watch_paths or [])
+        self.lock = threading.Lock()
+        self.value = None
+        self.loaded = False
+        self.signature = None
+
+    def current_signature(self):
+        signature = []
+        for path in self.watch_paths:
+            try:
+                stat = os.stat(path)
+                signature.append((path, stat.st_size, stat.st_mtime_ns))
+            except FileNotFoundError:
+                signature.append((path, None, None))
+        return tuple(signature)
+
+    def is_stale(self):
+        if not self.loaded:
+            return True
+        return self.lifetime == LIFETIME_WATCH and self.current_signature() != self.signature
+
+
+class ResourceRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._resources = {}
+
+    def register(self, name, loader, lifetime=LIFETIME_PROCESS, watch_paths=None):
+        """
+        Register how a resource is loaded. Registering a name twice keeps the first
+        registration, so scripts that run again (Streamlit reruns) keep the loaded value.
+
+        Args:
+            name (str): Name used to get the resource.
+            loader (callable): Builds the resource, called without arguments.
+            lifetime (str): LIFETIME_PROCESS or LIFETIME_WATCH.
+            watch_paths (list): Files whose change triggers a reload (LIFETIME_WATCH only).
+        """
+        if lifetime not in (LIFETIME_PROCESS, LIFETIME_WATCH):
+            raise ValueError(f"Unknown resource lifetime '{lifetime}'")
+
+        with self._lock:
+            if name not in self._resources:
+                self._resources[name] = _Resource(name, loader, lifetime, watch_paths)
+            return self._resources[name]
+
+    def is_registered(self, name):
+        return name in self._resources
+
+    def get(self, name):
+        resource = self._resources.get(name)
+        if resource is None:
+            raise KeyError(f"Resource '{name}' is not registered")
+
+        # Fast path without locking once the resource is loaded and fresh
+        if not resource.is_stale():
+            value = resource.value
+            # None when a release ran after the check, the locked path loads it again
+            if value is not None:
+                return value
+
+        with resource.lock:
+            # Another thread may have loaded it while we were waiting
+            if resource.is_stale():
+                signature = resource.current_signature()
+                # Swapped in one assignment, readers see either the old or the new value
+                resource.value = resource.loader()
+                resource.signature = signature
+                resource.loaded = True
+            return resource.value
+
+    def warm_up(self, names=None):
+        """
+        Load the given resources (all registered ones by default) ahead of the first query.
+        """
+        for name in names or list(self._resources):
+            self.get(name)
+
+    def release(self, name):
+        resource = self._resources.get(name)
+        if resource is None:
+            return
+        with resource.lock:
+            # Marked unloaded before the value goes, the fast path of get() never returns a released value
+            resource.loaded = False
+            resource.value = None
+            resource.signature = None
+
+    def clear(self):
+        for name in list(self._resources):
+            self.release(name)
+
+
+# Shared by every module of the process
+registry = ResourceRegistry()
@@ -0,0 +1,156 @@
+"""
+    LRU cache of answered questions.
+
+    Parsed intents are cached by normalized question and results (text or table answer
+    and file message, never a figure) by parsed intent, both tied to the fingerprint of
+    the data set. A new fingerprint means the data set changed, so every entry is
+    dropped. Results are bounded by count and by bytes, table answers can be large.
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+import constants
+
+
+def normalize_query(query):
+    return " ".join(str(query).lower().split())
+
+
+def intent_key(parsed_intent):
+    # Hashable form of a parsed intent, questions with the same intent share one answer
+    filters = parsed_intent.get("filters")
+    return (
+        parsed_intent.get("action"),
+        parsed_intent.get("column"),
+        parsed_intent.get("group_by"),
+        str(filters) if filters is not None else None,
+        parsed_intent.get("limit"),
+    )
+
+
+def dataframe_fingerprint(dataframe):
+    """
+    Fingerprint of the data set: the one DataService stored in DataFrame.attrs, or a
+    hash of the content for data frames that were not loaded through DataService.
+    """
+    fingerprint = dataframe.attrs.get("fingerprint")
+    if fingerprint is None:
+        fingerprint = str(pd.util.hash_pandas_object(dataframe, index=True).sum())
+        dataframe.attrs["fingerprint"] = fingerprint
+    return fingerprint
+
+
+def value_nbytes(value):
+    # Deep size of a cached answer: data frames by their memory usage, the rest by sys.getsizeof
+    if isinstance(value, tuple):
+        return sum(value_nbytes(item) for item in value)
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(deep=True).sum())
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    def __init__(self, max_entries=None, max_bytes=None):
+        self.max_entries = max_entries or constants.RESULT_CACHE_SIZE
+        self.max_bytes = max_bytes or constants.RESULT_CACHE_MAX_BYTES
+        self._lock = threading.Lock()
+        self._intents = OrderedDict()
+        # intent key -> (value, bytes)
+        self._results = OrderedDict()
+        self.nbytes = 0
+        self.fingerprint = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_fingerprint(self, fingerprint):
+        if fingerprint != self.fingerprint:
+            if self._intents or self._results:
+                self.invalidations += 1
+            self._intents.clear()
+            self._results.clear()
+            self.nbytes = 0
+            self.fingerprint = fingerprint
+
+    def _put(self, entries, key, value):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_intent(self, query, fingerprint):
+        # Parsing is not counted in the hit / miss counters, only full answers are
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            key = normalize_query(query)
+            parsed_intent = self._intents.get(key)
+            if parsed_intent is not None:
+                self._intents.move_to_end(key)
+            return parsed_intent
+
+    def put_intent(self, query, fingerprint, parsed_intent):
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            self._put(self._intents, normalize_query(query), parsed_intent)
+
+    def get(self, parsed_intent, fingerprint):
+        """
+        Cached (result, fig, file_message) of the intent, or None. fig is always None,
+        figures are not cached.
+        """
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            key = intent_key(parsed_intent)
+            entry = self._results.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._results.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, parsed_intent, fingerprint, value):
+        """
+        Cache the (result, fig, file_message) of the intent. The figure is dropped, and a
+        result larger than max_bytes on its own is not cached.
+        """
+        result, _, file_message = value
+        value = (result, None, file_message)
+        nbytes = value_nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            key = intent_key(parsed_intent)
+            previous = self._results.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous[1]
+            self._results[key] = (value, nbytes)
+            self.nbytes += nbytes
+            while len(self._results) > self.max_entries or self.nbytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._results.popitem(last=False)
+                self.nbytes -= evicted_bytes
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._intents.clear()
+            self._results.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._results),
+            "bytes": self.nbytes,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
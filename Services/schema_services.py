@@ -0,0 +1,98 @@
+"""
+    Compact dtypes for the loaded data sets.
+
+    Text columns are loaded as `category` (declared from the synthetic data schema,
+    or inferred from their cardinality) and integer columns are downcast to the
+    smallest integer type that holds their values.
+"""
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from intent_classifier.generate_data import COLUMNS
+
+
+class SchemaService:
+    def __init__(self, declared_columns=None, max_category_ratio=0.5):
+        self.declared_columns = declared_columns if declared_columns is not None else COLUMNS
+        # Undeclared text columns become categories when unique values / rows is below this ratio
+        self.max_category_ratio = max_category_ratio
+
+    def read_csv_dtypes(self):
+        """
+        dtype mapping for pd.read_csv, so declared categorical columns are never
+        materialized as strings. Columns missing from the file are ignored by pandas.
+        """
+        return {
+            column: "category"
+            for column, column_type in self.declared_columns.items()
+            if column_type != "numeric"
+        }
+
+    def infer(self, dataframe):
+        """
+        Work out the compact dtype of every column that can be shrunk.
+
+        Args:
+            dataframe (DataFrame): The loaded data set.
+
+        Returns:
+            dict: Column name to target dtype, only for columns that change.
+        """
+        dtypes = {}
+        for column in dataframe.columns:
+            series = dataframe[column]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                continue
+
+            if pd.api.types.is_integer_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                downcast = pd.to_numeric(series, downcast="integer").dtype
+                if downcast != series.dtype:
+                    dtypes[column] = downcast
+            elif pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+                if self.declared_columns.get(column, None) not in (None, "numeric"):
+                    dtypes[column] = "category"
+                elif len(series) and series.nunique() / len(series) <= self.max_category_ratio:
+                    dtypes[column] = "category"
+        return dtypes
+
+    def apply(self, dataframe):
+        dtypes = self.infer(dataframe)
+        if not dtypes:
+            return dataframe
+        return dataframe.astype(dtypes)
+
+    def concat_chunks(self, chunks):
+        """
+        Concatenate compacted chunks. pd.concat falls back to object dtype when the
+        categories of two chunks differ, so categorical columns are unioned first.
+        """
+        chunks = [self.apply(chunk) for chunk in chunks]
+        if not chunks:
+            return pd.DataFrame()
+
+        dataset = pd.concat(chunks, ignore_index=True)
+        for column in chunks[0].columns:
+            if isinstance(chunks[0][column].dtype, pd.CategoricalDtype) and \
+                    not isinstance(dataset[column].dtype, pd.CategoricalDtype):
+                dataset[column] = union_categoricals([chunk[column] for chunk in chunks])
+        # Integer chunks may have been downcast to different widths
+        return self.apply(dataset)
+
+    @staticmethod
+    def memory_report(dataframe):
+        """
+        Per column memory usage of the data set.
+
+        Returns:
+            DataFrame: dtype, bytes and share of the total for every column,
+                with a final 'total' row.
+        """
+        memory = dataframe.memory_usage(index=False, deep=True)
+        report = pd.DataFrame({
+            "dtype": dataframe.dtypes.astype(str),
+            "memory_bytes": memory,
+            "share": memory / max(int(memory.sum()), 1),
+        })
+        report.loc["total"] = ["", int(memory.sum()), 1.0]
+        report.index.name = "column"
+        return report
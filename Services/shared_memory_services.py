@@ -0,0 +1,318 @@
+"""
+    Data set shared by worker processes through multiprocessing.shared_memory.
+
+    The columns are copied once into one shared memory block: numeric columns as
+    their values, categorical and text columns as integer codes with the categories
+    kept in the (picklable) descriptor. Workers attach read-only NumPy views of the
+    block, so adding workers does not add copies of the data set.
+
+    The arrays of the filter index (sorted orders and packed bitmaps) go in the same
+    block and the statistics index, which is small, in the descriptor. Workers answer
+    with the same index lookups as the threads of the parent process.
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pandas as pd
+
+import constants
+from Services.filter_services import BitmapIndex, FilterIndex, SortedIndex
+from Services.groupby_services import GroupByService
+from Services.result_cache import dataframe_fingerprint, intent_key
+
+# Every column starts on a cache line
+ALIGNMENT = 64
+
+
+def _column_layout(series):
+    """
+    The array to share for one column, and what is needed to rebuild the column from it.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), {
+            "kind": "categorical",
+            "categories": series.cat.categories.tolist(),
+            "ordered": bool(series.cat.ordered),
+        }
+    if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        if isinstance(series.dtype, np.dtype):
+            return series.to_numpy(), {"kind": "array"}
+        # Nullable numbers become float with NaN when they have missing values
+        if series.hasnans:
+            return series.to_numpy(dtype=float, na_value=np.nan), {"kind": "array"}
+        return series.to_numpy(dtype=series.dtype.numpy_dtype), {"kind": "array"}
+    # Text columns are shared as codes, workers see them as categoricals
+    codes, uniques = pd.factorize(series)
+    categorical = pd.Categorical.from_codes(codes, categories=uniques, validate=False)
+    return categorical.codes, {"kind": "categorical", "categories": categorical.categories.tolist(), "ordered": False}
+
+
+def _filter_index_layout(filter_index):
+    """
+    The arrays to share for the filter index, and what is needed to rebuild it.
+    """
+    arrays, layouts = [], []
+    for column, index in filter_index.indexes.items():
+        if isinstance(index, SortedIndex):
+            arrays += [index.order, index.sorted_values]
+            layouts.append({"column": column, "kind": "sorted"})
+        else:
+            # One row of packed bits per value
+            values = list(index.bitmaps)
+            width = (index.row_count + 7) // 8
+            arrays.append(np.stack([index.bitmaps[value] for value in values]) if values
+                          else np.empty((0, width), dtype=np.uint8))
+            layouts.append({"column": column, "kind": "bitmap", "values": values})
+    return arrays, layouts
+
+
+def _write_block(arrays):
+    """
+    Copy the arrays into a new shared memory block, every array on a cache line.
+
+    Returns:
+        tuple: (SharedMemory, placements), the dtype, shape and offset of every array.
+    """
+    placements = []
+    offset = 0
+    for array in arrays:
+        offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        placements.append({"dtype": array.dtype.str, "shape": array.shape, "offset": offset})
+        offset += array.nbytes
+
+    shared_memory = SharedMemory(create=True, size=max(offset, 1))
+    for array, placement in zip(arrays, placements):
+        target = np.ndarray(array.shape, dtype=array.dtype, buffer=shared_memory.buf, offset=placement["offset"])
+        target[:] = array
+    return shared_memory, placements
+
+
+def _view(shared_memory, placement):
+    array = np.ndarray(placement["shape"], dtype=np.dtype(placement["dtype"]),
+                       buffer=shared_memory.buf, offset=placement["offset"])
+    array.flags.writeable = False
+    return array
+
+
+def publish_dataframe(dataframe, stats_index=None, filter_index=None):
+    """
+    Copy the data frame (and its filter index) into a new shared memory block.
+
+    Args:
+        stats_index (StatisticsIndex): Sent to the workers in the descriptor.
+        filter_index (FilterIndex): Shared with the workers through the block.
+            Indexes that are not current for the data frame are left out.
+
+    Returns:
+        tuple: (SharedMemory, descriptor). The caller owns the block and has to
+            close() and unlink() it. The descriptor is what workers need to attach.
+    """
+    arrays, column_layouts = [], []
+    for column in dataframe.columns:
+        array, layout = _column_layout(dataframe[column])
+        arrays.append(np.ascontiguousarray(array))
+        layout["column"] = column
+        column_layouts.append(layout)
+
+    index_layouts = None
+    if filter_index is not None and filter_index.is_current(dataframe):
+        index_arrays, index_layouts = _filter_index_layout(filter_index)
+        arrays += [np.ascontiguousarray(array) for array in index_arrays]
+
+    shared_memory, placements = _write_block(arrays)
+    for layout, placement in zip(column_layouts, placements):
+        layout.update(placement)
+    if index_layouts is not None:
+        index_placements = iter(placements[len(column_layouts):])
+        for layout in index_layouts:
+            count = 2 if layout["kind"] == "sorted" else 1
+            layout["arrays"] = [next(index_placements) for _ in range(count)]
+
+    descriptor = {
+        "name": shared_memory.name,
+        "row_count": len(dataframe),
+        "columns": column_layouts,
+        "filter_index": index_layouts,
+        "stats_index": stats_index if stats_index is not None and stats_index.is_current(dataframe) else None,
+        "fingerprint": dataframe_fingerprint(dataframe),
+    }
+    return shared_memory, descriptor
+
+
+def attach_dataframe(descriptor):
+    """
+    Build a data frame over the shared block without copying it.
+
+    Returns:
+        tuple: (SharedMemory, DataFrame). Keep the SharedMemory alive as long as the
+            data frame is used.
+    """
+    # Workers are children of the owner and share its resource tracker, so attaching
+    # here never unlinks the block when a worker exits
+    shared_memory = SharedMemory(name=descriptor["name"])
+
+    columns = {}
+    for layout in descriptor["columns"]:
+        array = _view(shared_memory, layout)
+        if layout["kind"] == "categorical":
+            columns[layout["column"]] = pd.Categorical.from_codes(
+                array, categories=layout["categories"], ordered=layout["ordered"], validate=False)
+        else:
+            columns[layout["column"]] = array
+    dataframe = pd.DataFrame(columns, copy=False)
+    dataframe.attrs["fingerprint"] = descriptor["fingerprint"]
+    return shared_memory, dataframe
+
+
+def attach_filter_index(descriptor, shared_memory):
+    """
+    Build the filter index over the shared block without copying it, None when none was shared.
+    """
+    if descriptor.get("filter_index") is None:
+        return None
+    row_count = descriptor["row_count"]
+    indexes = {}
+    for layout in descriptor["filter_index"]:
+        arrays = [_view(shared_memory, placement) for placement in layout["arrays"]]
+        if layout["kind"] == "sorted":
+            indexes[layout["column"]] = SortedIndex.from_arrays(row_count, *arrays)
+        else:
+            indexes[layout["column"]] = BitmapIndex.from_bitmaps(row_count, dict(zip(layout["values"], arrays[0])))
+    return FilterIndex.from_indexes(row_count, indexes)
+
+
+# State of a worker process, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(descriptor):
+    _worker["shared_memory"], _worker["dataframe"] = attach_dataframe(descriptor)
+    _worker["stats_index"] = descriptor.get("stats_index")
+    _worker["filter_index"] = attach_filter_index(descriptor, _worker["shared_memory"])
+    # Keeps the key codes and the group by results of the worker, like the shared one of the parent
+    _worker["groupby_service"] = GroupByService(_worker["dataframe"])
+
+
+def _execute_intent(parsed_intent):
+    from Services.nlp_services import IntentExecutorServices
+
+    try:
+        result = IntentExecutorServices(
+            dataframe=_worker["dataframe"],
+            query_intent=parsed_intent,
+            stats_index=_worker["stats_index"],
+            filter_index=_worker["filter_index"],
+            groupby_service=_worker["groupby_service"],
+        ).execute()
+        return result, None
+    except (ValueError, KeyError, TypeError) as e:
+        return None, str(e)
+
+
+class _Generation:
+    # One shared copy of the data set and the workers attached to it
+    def __init__(self, shared_memory, executor, fingerprint):
+        self.shared_memory = shared_memory
+        self.executor = executor
+        self.fingerprint = fingerprint
+        # Calls of execute_many using it, it is shut down once it is replaced and unused
+        self.users = 0
+        self.retired = False
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+        self.shared_memory.close()
+        self.shared_memory.unlink()
+
+
+class SharedWorkerPool:
+    def __init__(self, dataframe, processes=None, stats_index=None, filter_index=None):
+        self.processes = processes or constants.WORKER_PROCESSES or os.cpu_count()
+        self._lock = threading.Lock()
+        self._current = None
+        self.publish(dataframe, stats_index, filter_index)
+
+    @property
+    def fingerprint(self):
+        current = self._current
+        return current.fingerprint if current is not None else None
+
+    def publish(self, dataframe, stats_index=None, filter_index=None, only_if_changed=False):
+        """
+        Share the data frame and start workers attached to it, replacing the previous ones.
+
+        The previous workers finish the questions already given to them and are shut
+        down after the last one. The check and the swap are done under one lock, so
+        threads that see the same new data set publish it once.
+        """
+        with self._lock:
+            if only_if_changed and self._current is not None and \
+                    self._current.fingerprint == dataframe_fingerprint(dataframe):
+                return
+            shared_memory, descriptor = publish_dataframe(dataframe, stats_index, filter_index)
+            # spawn, so a worker never inherits the threads or the data of the parent
+            executor = ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(descriptor,),
+            )
+            retired = self._retire(_Generation(shared_memory, executor, descriptor["fingerprint"]))
+        if retired is not None:
+            retired.shutdown()
+
+    def ensure_current(self, dataframe, stats_index=None, filter_index=None):
+        self.publish(dataframe, stats_index, filter_index, only_if_changed=True)
+
+    def execute_many(self, parsed_intents):
+        """
+        Execute the intents in parallel on the workers, identical intents once.
+
+        Returns:
+            list: (result, error) per intent, in the same order.
+        """
+        with self._lock:
+            generation = self._current
+            if generation is None:
+                raise ValueError("The worker pool is closed")
+            generation.users += 1
+        try:
+            futures = {}
+            for parsed_intent in parsed_intents:
+                key = intent_key(parsed_intent)
+                if key not in futures:
+                    futures[key] = generation.executor.submit(_execute_intent, parsed_intent)
+            return [futures[intent_key(parsed_intent)].result() for parsed_intent in parsed_intents]
+        finally:
+            self._release(generation)
+
+    def _release(self, generation):
+        with self._lock:
+            generation.users -= 1
+            unused = generation.retired and not generation.users
+        if unused:
+            generation.shutdown()
+
+    def _retire(self, replacement):
+        # Called with the lock held, returns the previous generation when it can be shut down now
+        retired, self._current = self._current, replacement
+        if retired is None:
+            return None
+        retired.retired = True
+        return None if retired.users else retired
+
+    def close(self):
+        with self._lock:
+            retired = self._retire(None)
+        if retired is not None:
+            retired.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,130 @@
+"""
+    Per column statistics built once when the data set is loaded.
+
+    Aggregate intents (mean, sum, count, unique values) and the charts read their
+    numbers from here instead of scanning the column on every query. Appended rows
+    are folded in incrementally.
+"""
+import numpy as np
+import pandas as pd
+
+from Services.streaming_services import PartialAggregate
+import constants
+
+
+class ColumnStatistics(PartialAggregate):
+    def __init__(self, column, max_categories=None, sample_size=None, seed=42):
+        super().__init__()
+        self.column = column
+        self.max_categories = max_categories or constants.STATS_MAX_CATEGORIES
+        self.sample_size = sample_size or constants.STATS_QUANTILE_SAMPLE_SIZE
+        self.rng = np.random.default_rng(seed)
+        # Full value counts, in first-seen order, only for low-cardinality columns
+        self.value_counts = {}
+        # Uniform sample of the non-null numeric values, used for the quantiles
+        self.sample = np.empty(0)
+        self.sample_rows = 0
+
+    def update(self, series):
+        super().update(series)
+        self._update_value_counts(series)
+        if self.numeric:
+            self._update_sample(series.dropna().to_numpy())
+        return self
+
+    def _update_value_counts(self, series):
+        if self.value_counts is None:
+            return
+
+        # unique() keeps the first-seen order, value_counts() gives the numbers
+        uniques = series.dropna().unique()
+        if len(uniques) > self.max_categories:
+            self.value_counts = None
+            return
+
+        counts = series.value_counts(dropna=True)
+        for value in uniques:
+            self.value_counts[value] = self.value_counts.get(value, 0) + int(counts[value])
+
+        if len(self.value_counts) > self.max_categories:
+            # Too many values to be worth keeping, callers fall back to scanning
+            self.value_counts = None
+
+    def _update_sample(self, values):
+        total_rows = self.sample_rows + len(values)
+        if total_rows <= self.sample_size:
+            self.sample = np.concatenate([self.sample, values.astype(float)])
+        elif len(values):
+            # Keep each side in proportion to the number of rows it stands for
+            keep_old = self.rng.hypergeometric(self.sample_rows, len(values), self.sample_size)
+            keep_new = self.sample_size - keep_old
+            old = self.rng.choice(self.sample, size=min(keep_old, len(self.sample)), replace=False)
+            new = self.rng.choice(values, size=min(keep_new, len(values)), replace=False).astype(float)
+            self.sample = np.concatenate([old, new])
+        self.sample_rows = total_rows
+
+    @property
+    def exact_quantiles(self):
+        # The sample holds every value while the column is smaller than the sample size
+        return self.sample_rows <= self.sample_size
+
+    def quantile(self, q):
+        """
+        Quantile(s) of the column, exact for small columns and approximate otherwise.
+
+        Args:
+            q (float or list): Quantile(s) between 0 and 1.
+
+        Returns:
+            float or ndarray: NaN when the column is not numeric or empty.
+        """
+        if not self.numeric or not len(self.sample):
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else float("nan")
+        return np.quantile(self.sample, q)
+
+    def unique_values(self):
+        return None if self.value_counts is None else list(self.value_counts)
+
+    def value_counts_series(self):
+        """
+        Same output as Series.value_counts(): counts sorted from the most frequent value.
+        """
+        if self.value_counts is None:
+            return None
+        counts = pd.Series(self.value_counts, dtype="int64")
+        return counts.sort_values(ascending=False, kind="stable")
+
+
+class StatisticsIndex:
+    def __init__(self, max_categories=None, sample_size=None):
+        self.max_categories = max_categories or constants.STATS_MAX_CATEGORIES
+        self.sample_size = sample_size or constants.STATS_QUANTILE_SAMPLE_SIZE
+        self.columns = {}
+        self.row_count = 0
+
+    def build(self, dataframe):
+        self.columns = {}
+        self.row_count = 0
+        return self.append(dataframe)
+
+    def append(self, rows):
+        """
+        Fold new rows into the statistics without rescanning the old ones.
+        """
+        for column in rows.columns:
+            if column not in self.columns:
+                self.columns[column] = ColumnStatistics(
+                    column,
+                    max_categories=self.max_categories,
+                    sample_size=self.sample_size,
+                )
+            self.columns[column].update(rows[column])
+        self.row_count += len(rows)
+        return self
+
+    def get(self, column):
+        return self.columns.get(column)
+
+    def is_current(self, dataframe):
+        # Only trusted while it describes exactly the rows of the dataframe
+        return self.row_count == len(dataframe) and all(column in self.columns for column in dataframe.columns)
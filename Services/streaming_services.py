@@ -0,0 +1,216 @@
+"""
+    Out-of-core execution of the query intents.
+
+    The data set is read chunk by chunk and every chunk is folded into a
+    mergeable partial aggregate, so only one chunk is in memory at a time.
+    Row filters are applied to every chunk (the filter columns are read with
+    the measured one) and group by questions keep one partial per group.
+"""
+import pandas as pd
+
+from Services.groupby_services import GROUP_BY_AGGREGATES
+import constants
+
+
+class PartialAggregate:
+    def __init__(self, max_distinct=None, track_distinct=False):
+        self.count = 0
+        self.null_count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+        # False as soon as one chunk of the column is not numeric
+        self.numeric = True
+        self.track_distinct = track_distinct
+        self.max_distinct = max_distinct
+        # dict keeps the first-seen order of the values, like Series.unique()
+        self.distinct = {}
+        self.distinct_truncated = False
+
+    def update(self, series):
+        non_null = series.dropna()
+        self.count += len(non_null)
+        self.null_count += len(series) - len(non_null)
+        self.numeric = self.numeric and pd.api.types.is_numeric_dtype(series)
+
+        if len(non_null) and self.numeric:
+            # .item() turns numpy scalars into python ones, so sums of ints never overflow
+            self.sum += non_null.sum().item()
+            chunk_min, chunk_max = non_null.min().item(), non_null.max().item()
+            self.min = chunk_min if self.min is None else min(self.min, chunk_min)
+            self.max = chunk_max if self.max is None else max(self.max, chunk_max)
+
+        if self.track_distinct:
+            self._add_distinct(series.unique())
+        return self
+
+    def merge(self, other):
+        """
+        Merge the aggregate of another chunk (or worker) into this one.
+        """
+        self.count += other.count
+        self.null_count += other.null_count
+        self.sum += other.sum
+        self.numeric = self.numeric and other.numeric
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        if other.max is not None:
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        if self.track_distinct:
+            self._add_distinct(other.distinct)
+            self.distinct_truncated = self.distinct_truncated or other.distinct_truncated
+        return self
+
+    def _add_distinct(self, values):
+        for value in values:
+            if value in self.distinct:
+                continue
+            if self.max_distinct is not None and len(self.distinct) >= self.max_distinct:
+                self.distinct_truncated = True
+                return
+            self.distinct[value] = None
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else float("nan")
+
+
+def format_aggregate_result(action, column, aggregate):
+    """
+    Answer an intent from a partial aggregate, with the same wording as IntentExecutorServices.
+    """
+    # Numeric checks for mean, sum and the extreme values
+    if action in ["mean", "sum", "max", "min"] and not aggregate.numeric:
+        raise ValueError(f"Column '{column}' must be numeric for {action} operation.")
+
+    if action == "mean":
+        return f"Average {column}: {aggregate.mean:.2f}"
+    if action == "sum":
+        return f"Sum of {column}: {aggregate.sum}"
+    if action == "count":
+        return f"Count of {column}: {aggregate.count}"
+    if action == "max":
+        return f"Maximum {column}: {aggregate.max}"
+    if action == "min":
+        return f"Minimum {column}: {aggregate.min}"
+    if action == "filter":
+        prefix = f"first {aggregate.max_distinct} " if aggregate.distinct_truncated else ""
+        return f"Unique values in {column}: {prefix}{list(aggregate.distinct)}"
+    raise ValueError(f"Action '{action}' is not supported yet")
+
+
+class StreamingIntentExecutorServices:
+    def __init__(self, data_service, query_intent, memory_limit_mb=None, max_distinct=None):
+        self.data_service = data_service
+        self.query_intent = query_intent
+        self.memory_limit_mb = memory_limit_mb or constants.STREAMING_MEMORY_LIMIT_MB
+        self.max_distinct = max_distinct or constants.STREAMING_MAX_DISTINCT
+
+    def execute(self):
+        action = self.query_intent.get("action")
+        column = self.query_intent.get("column")
+
+        if self.query_intent.get("limit") is not None:
+            raise ValueError("Top / bottom rows questions need the data set in memory")
+
+        columns = self.data_service.read_columns()
+        predicate = self.query_intent.get("filters")
+        if predicate is not None:
+            if action == "filter":
+                # The answer would be every matching row, which is not bounded
+                raise ValueError("Row filter questions need the data set in memory")
+            missing = [name for name in predicate.columns() if name not in columns]
+            if missing:
+                raise ValueError(f"Column '{missing[0]}' not found.")
+
+        group_by = self.query_intent.get("group_by")
+        if group_by is not None and action in GROUP_BY_AGGREGATES:
+            if group_by not in columns:
+                raise ValueError(f"Column '{group_by}' not found.")
+            if column is not None and column not in columns:
+                raise ValueError(f"Column '{column}' not found.")
+            return self.group_by(action, column, group_by, predicate)
+
+        if not action or not column:
+            raise ValueError("Could not understand the intent or column.")
+
+        if column not in columns:
+            raise ValueError(f"Column '{column}' not found.")
+
+        if action not in ["mean", "sum", "count", "filter", "max", "min"]:
+            raise ValueError(f"Action '{action}' is not supported yet")
+
+        aggregate = self.aggregate(column, track_distinct=action == "filter", predicate=predicate)
+        result = format_aggregate_result(action, column, aggregate)
+        if predicate is not None:
+            result = f"{result} (where {predicate})"
+        return result
+
+    def iter_rows(self, columns, predicate=None):
+        # Chunks of the columns, with the filter columns read too and only the matching rows kept
+        if predicate is not None:
+            columns = list(dict.fromkeys(columns + predicate.columns()))
+        for chunk in self.data_service.iter_chunks(columns=columns, memory_limit_mb=self.memory_limit_mb):
+            yield chunk[predicate.mask(chunk)] if predicate is not None else chunk
+
+    def aggregate(self, column, track_distinct=False, predicate=None):
+        """
+        Fold every chunk of the column into one partial aggregate.
+
+        Args:
+            column (str): Column to aggregate, only this column (and the filter columns) is parsed.
+            track_distinct (bool): Also collect the distinct values (bounded by max_distinct).
+            predicate (Condition): Only the rows matching it are aggregated.
+
+        Returns:
+            PartialAggregate: The merged aggregate.
+        """
+        aggregate = PartialAggregate(max_distinct=self.max_distinct, track_distinct=track_distinct)
+        for chunk in self.iter_rows([column], predicate):
+            aggregate.merge(PartialAggregate(self.max_distinct, track_distinct).update(chunk[column]))
+        return aggregate
+
+    def group_by(self, action, column, group_by, predicate=None):
+        """
+        Aggregate the column per value of group_by, one chunk at a time.
+
+        Every chunk gives the count, sum, min and max of each group, which are merged
+        with those of the chunks before; memory grows with the groups, not the rows.
+
+        Returns:
+            DataFrame: Same layout as GroupByService.aggregate.
+        """
+        # Counting needs no measured column, it counts the rows of every group
+        measure = None if action == "count" or column == group_by else column
+        partial = None
+        integer = True
+        for chunk in self.iter_rows([group_by] if measure is None else [group_by, measure], predicate):
+            if measure is None:
+                chunk_partial = chunk[group_by].value_counts().to_frame("count")
+            else:
+                if not pd.api.types.is_numeric_dtype(chunk[measure]):
+                    raise ValueError(f"Column '{measure}' must be numeric for {action} operation.")
+                integer = integer and pd.api.types.is_integer_dtype(chunk[measure])
+                chunk_partial = chunk.groupby(group_by, observed=True)[measure].agg(["count", "sum", "min", "max"])
+            # Category labels differ from chunk to chunk, the groups are merged on the plain values
+            chunk_partial.index = chunk_partial.index.astype(object)
+            if partial is not None:
+                chunk_partial = pd.concat([partial, chunk_partial]).groupby(level=0).agg(
+                    {name: "sum" if name in ("count", "sum") else name for name in chunk_partial.columns})
+            partial = chunk_partial
+
+        value_name = f"{action}_{measure}" if measure is not None else "count"
+        if partial is None:
+            return pd.DataFrame({group_by: [], value_name: []})
+        # Groups without rows are left out, like GroupByService
+        partial = partial[partial["count"] > 0].sort_index()
+        if action == "count":
+            values = partial["count"].astype("int64")
+        elif action == "mean":
+            values = partial["sum"] / partial["count"]
+        elif action == "sum" and integer:
+            values = partial["sum"].round().astype("int64")
+        else:
+            # Float like GroupByService, which reduces the measure as floats
+            values = partial[action].astype(float)
+        return pd.DataFrame({group_by: partial.index.to_numpy(), value_name: values.to_numpy()})
@@ -1,20 +1,16 @@
-from Usecases.data_handler import DataHandler
-from Services.data import DataService
+from Usecases.data_handler import DataUsecase
 
 
+# Run from the project root: python -m Test.data
 if __name__ == "__main__":
-    file_path = "../Data"
+    file_path = "./Data"
     zip_file_name = "bank+marketing.zip"
     csv_file_name = "bank.csv"
-    data_service = DataService(
-        file_path=file_path,
-        zip_file_name=zip_file_name,
-        csv_file_name=csv_file_name
-    )
-    data_handler = DataHandler(
+    data_usecase = DataUsecase(
         file_path=file_path,
         zip_file_name=zip_file_name,
         csv_file_name=csv_file_name,
-        data_service=data_service
     )
-    data_handler.execute()
+    status, data_set = data_usecase.execute()
+    print(status, data_set.shape)
+    data_set.info()
@@ -0,0 +1,24 @@
+import pandas as pd
+
+import constants
+from Services.filter_services import FilterIndex
+from Services.nlp_services import IntentExecutorServices, NLPServices
+
+
+# Run from the project root: python -m Test.extreme_Test
+if __name__ == "__main__":
+    dataframe = pd.read_csv("./Data/bank.csv", delimiter=";")
+    filter_index = FilterIndex().build(dataframe)
+    # Parsing never reads the stopwords
+    nlp_services = NLPServices(constants.INTENT_KEYWORDS, stop_words=set())
+
+    for query, action, column, expected in [
+        ("maximum age", "max", "age", dataframe["age"].max()),
+        ("minimum balance", "min", "balance", dataframe["balance"].min()),
+    ]:
+        parsed_intent = nlp_services.parse_query(query, dataframe.columns, constants.COLUMN_MATCH_THRESHOLD,
+                                                 filter_index.domains())
+        assert (parsed_intent["action"], parsed_intent["column"]) == (action, column), parsed_intent
+        result = IntentExecutorServices(dataframe, parsed_intent, filter_index=filter_index).execute()
+        assert result == f"{'Maximum' if action == 'max' else 'Minimum'} {column}: {expected}", result
+        print(query, "->", result)
@@ -0,0 +1,41 @@
+import pandas as pd
+
+import constants
+from Services.filter_services import FilterIndex
+from Services.nlp_services import IntentExecutorServices, NLPServices
+
+
+def answer(nlp_services, dataframe, filter_index, query):
+    parsed_intent = nlp_services.parse_query(query, dataframe.columns, constants.COLUMN_MATCH_THRESHOLD,
+                                             filter_index.domains())
+    return parsed_intent, IntentExecutorServices(dataframe, parsed_intent, filter_index=filter_index).execute()
+
+
+def check_groups(result, expected):
+    # One row per group, in any order, with the value pandas gives
+    actual = result.set_index(result.columns[0])[result.columns[-1]]
+    expected = expected[expected > 0] if expected.name == "count" else expected
+    assert sorted(map(str, actual.index)) == sorted(map(str, expected.index)), (actual.index, expected.index)
+    for group, value in expected.items():
+        assert abs(float(actual[group]) - float(value)) < 1e-6, (group, actual[group], value)
+
+
+# Run from the project root: python -m Test.groupby_Test
+if __name__ == "__main__":
+    dataframe = pd.read_csv("./Data/bank.csv", delimiter=";")
+    filter_index = FilterIndex().build(dataframe)
+    # Parsing never reads the stopwords
+    nlp_services = NLPServices(constants.INTENT_KEYWORDS, stop_words=set())
+
+    query = "average balance by job"
+    parsed_intent, result = answer(nlp_services, dataframe, filter_index, query)
+    assert (parsed_intent["action"], parsed_intent["column"], parsed_intent["group_by"]) == ("mean", "balance", "job")
+    check_groups(result, dataframe.groupby("job")["balance"].mean())
+    print(query, "->", len(result), "groups")
+
+    query = "count of subscribed clients per month"
+    parsed_intent, result = answer(nlp_services, dataframe, filter_index, query)
+    assert (parsed_intent["action"], parsed_intent["group_by"]) == ("count", "month")
+    assert str(parsed_intent["filters"]) == "y == 'yes'", parsed_intent["filters"]
+    check_groups(result, dataframe[dataframe["y"] == "yes"].groupby("month").size().rename("count"))
+    print(query, "->", len(result), "groups")
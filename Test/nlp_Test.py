@@ -1,20 +1,31 @@
 import constants
 import nltk
 from Usecases.query_processing import QueryProcessingUseCase
-from Services.nlp_services import NLPServices
+from Usecases.resources import build_nlp_services, register_resources, warm_up
+from Services.resource_registry import registry
 nltk.download('punkt')
 nltk.download('stopwords')
 nltk.download('wordnet')
 
 
 
+# Run from the project root: python -m Test.nlp_Test
 if __name__ == "__main__":
-    nlp_services = NLPServices(
-        intent_keywords=constants.INTENT_KEYWORDS,
+    register_resources(
+        file_path="./Data",
+        zip_file_name="bank+marketing.zip",
+        csv_file_name="bank-full.csv",
     )
+    warm_up()
+    nlp_services = build_nlp_services()
     for query in constants.QUERIES:
         nlpqueryprocessing_usecase = QueryProcessingUseCase(
             nlp_service=nlp_services,
-            query=query
+            query=query,
+            dataframe=registry.get("dataset"),
+            stats_index=registry.get("stats_index"),
+            filter_index=registry.get("filter_index"),
+            groupby_service=registry.get("groupby_service"),
         )
-        nlpqueryprocessing_usecase.execute()
\ No newline at end of file
+        result, fig, file_message = nlpqueryprocessing_usecase.execute()
+        print(query, "->", result if file_message is None else f"{result} ({file_message})")
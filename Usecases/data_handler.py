@@ -3,17 +3,22 @@
 """
 import os
 from Services.data import DataService
-import traceback
+
+import constants
 
 class DataUsecase:
-    def __init__(self, file_path, zip_file_name,csv_file_name):
+    def __init__(self, file_path, zip_file_name,csv_file_name, use_cache=True, extract_archives=False):
         self.file_path = file_path
         self.zip_file_name = zip_file_name
         self.csv_file_name = csv_file_name
+        # Extracting the zips to disk is only a fallback, by default the CSV is streamed from the zip
+        self.extract_archives = extract_archives
         self.data_service = DataService(
             file_path=self.file_path,
             zip_file_name=self.zip_file_name,
-            csv_file_name=self.csv_file_name
+            csv_file_name=self.csv_file_name,
+            cache_dir=os.path.join(self.file_path, constants.DATA_CACHE_DIR_NAME) if use_cache else None,
+            verify_cache_hash=constants.DATA_CACHE_VERIFY_HASH,
         )
 
     def execute(self):
@@ -21,7 +26,9 @@ class DataUsecase:
         # checks if the file is already present in the path
         csv_file_full_path = os.path.join(self.file_path, self.csv_file_name)
 
-        if not os.path.isfile(csv_file_full_path):
+        if os.path.isfile(csv_file_full_path):
+            data_set = self.data_service.load_dataset()
+        elif self.extract_archives:
             #unzip the files
             self.data_service.unzip_all()
 
@@ -29,7 +36,10 @@ class DataUsecase:
             if not os.path.isfile(csv_file_full_path):
                 raise FileNotFoundError(f"The file {self.csv_file_name} does not exist at {self.file_path}")
 
-        data_set =  self.data_service.load_dataset()
+            data_set = self.data_service.load_dataset()
+        else:
+            # read the CSV straight out of the (nested) zip
+            data_set = self.data_service.load_dataset_from_archive()
 
         # get the data set tops
         # print("This is the top Rows")
@@ -0,0 +1,241 @@
+"""
+    Several data sets behind one app: discovery, routing, lazy loading and eviction.
+
+    Every CSV under the data folder (on disk or inside a zip, nested zips included) is
+    a data set named after its file, e.g. "bank-full". Only its header is read when it
+    is discovered; its resources (data frame, indexes, recognizer, ...) are registered
+    in the resource registry under "<data set>/<resource>" and loaded on its first
+    question. A question goes to the data set whose columns it names. Once the loaded
+    data sets (data frame, filter index and cached answers) take more than
+    DATASET_MEMORY_BUDGET_MB, the least recently used ones are released and loaded
+    again from the columnar cache when they are asked for.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from Services.column_matcher import matcher_for
+from Services.data import DataService
+from Services.resource_registry import registry
+from Usecases.resources import (DATASET_RESOURCES, build_nlp_services, register_resources,
+                                register_shared_resources, resource_name)
+import constants
+
+
+class DatasetSource:
+    def __init__(self, name, file_path, zip_file_name, csv_file_name, size):
+        self.name = name
+        self.file_path = file_path
+        # None when the CSV is on disk
+        self.zip_file_name = zip_file_name
+        self.csv_file_name = csv_file_name
+        # Bytes of the CSV, the larger of two data sets with the same columns is preferred
+        self.size = size
+        self.columns = None
+
+    def read_columns(self):
+        if self.columns is None:
+            self.columns = DataService(self.file_path, self.zip_file_name, self.csv_file_name).read_columns()
+        return self.columns
+
+    def to_dict(self):
+        return {
+            "path": os.path.join(self.file_path, self.zip_file_name or "", self.csv_file_name),
+            "size_mb": self.size / 2 ** 20,
+            "columns": len(self.columns or []),
+        }
+
+
+class DatasetRegistry:
+    def __init__(self, root=None, memory_budget_mb=None, default=None, resource_registry=registry):
+        self.root = root or constants.DATA_DIR
+        self.memory_budget = (memory_budget_mb or constants.DATASET_MEMORY_BUDGET_MB) * 2 ** 20
+        self.default = default or constants.DEFAULT_DATASET
+        self.resource_registry = resource_registry
+        self.sources = {}
+        self._lock = threading.Lock()
+        # Loaded data sets and the bytes of their data frame and indexes, least recently used first
+        self._resident = OrderedDict()
+        # Result cache of every loaded data set, counted in the budget with its current size
+        self._caches = {}
+        self._dataset_locks = {}
+        self.loads = 0
+        self.evictions = 0
+
+    def discover(self):
+        """
+        Find the data sets under the root folder and register their resources.
+        A CSV on disk wins over the same file inside a zip.
+
+        Returns:
+            DatasetRegistry: self
+        """
+        archives = []
+        for directory, subdirectories, files in os.walk(self.root):
+            subdirectories[:] = sorted(subdirectory for subdirectory in subdirectories
+                                       if subdirectory not in constants.DATASET_SKIP_DIRS)
+            for file_name in sorted(files):
+                if file_name.endswith(".csv"):
+                    self._add(file_name, directory, None, file_name,
+                              os.path.getsize(os.path.join(directory, file_name)))
+                elif file_name.endswith(".zip"):
+                    archives.append((directory, file_name))
+
+        for directory, zip_file_name in archives:
+            members = DataService(directory, zip_file_name, None).list_archive_members(".csv")
+            for chain, size in members:
+                csv_file_name = os.path.basename(chain[-1])
+                self._add(csv_file_name, directory, zip_file_name, csv_file_name, size)
+
+        for source in self.sources.values():
+            source.read_columns()
+            register_resources(source.file_path, source.zip_file_name, source.csv_file_name,
+                               resource_registry=self.resource_registry, dataset=source.name)
+        register_shared_resources(self.resource_registry)
+        return self
+
+    def _add(self, file_name, file_path, zip_file_name, csv_file_name, size):
+        name = file_name[:-len(".csv")]
+        if file_name in constants.DATASET_EXCLUDE or name in self.sources:
+            return
+        self.sources[name] = DatasetSource(name, file_path, zip_file_name, csv_file_name, size)
+        self._dataset_locks[name] = threading.Lock()
+
+    def names(self):
+        return list(self.sources)
+
+    def columns(self, name):
+        return self.sources[name].read_columns()
+
+    def route(self, query, threshold=None):
+        """
+        Pick the data set a question is about.
+
+        In order: a data set named in the question ("... in bank-additional"), the most
+        columns named word for word, the best fuzzy column match, the default data set,
+        a data set already in memory, the largest one.
+
+        Returns:
+            str: Name of the data set.
+        """
+        if not self.sources:
+            raise ValueError(f"No data set found under {self.root}")
+        threshold = threshold or constants.COLUMN_MATCH_THRESHOLD
+        text = query.lower()
+        words = set(re.findall(r"[a-z0-9_.-]+", text))
+
+        def score(source):
+            named = re.search(rf"\b(?:in|from|of|dataset|table)\s+{re.escape(source.name.lower())}(?![\w.-])", text)
+            hits = len(words & {str(column).lower() for column in source.read_columns()})
+            match = matcher_for(tuple(source.read_columns())).best_match(query, threshold)
+            return (
+                named is not None,
+                hits,
+                match[1] if match else 0,
+                source.name == self.default,
+                source.name in self._resident,
+                source.size,
+            )
+
+        return max(self.sources.values(), key=score).name
+
+    def resources(self, name):
+        """
+        Resources of a data set, loaded on first use, as keyword arguments of
+        QueryProcessingUseCase (dataframe, stats_index, filter_index, groupby_service, result_cache).
+        """
+        if name not in self.sources:
+            raise KeyError(f"Unknown data set '{name}'")
+
+        # Loading and recording a data set is one step, a release of it waits for both
+        with self._dataset_locks[name]:
+            loaded = {resource: self.resource_registry.get(resource_name(resource, name))
+                      for resource in DATASET_RESOURCES}
+            with self._lock:
+                if name in self._resident:
+                    self._resident.move_to_end(name)
+                else:
+                    self._resident[name] = self._nbytes(loaded)
+                    self._caches[name] = loaded["result_cache"]
+                    self.loads += 1
+                # Cached answers grow between loads, so the budget is checked on every use
+                evicted = self._evict(keep=name)
+
+        # Released outside the lock of this data set, two data sets evicting each other never wait on each other
+        for dataset in evicted:
+            self._release(dataset, only_if_evicted=True)
+
+        loaded["dataframe"] = loaded.pop("dataset")
+        loaded.pop("value_recognizer")
+        return loaded
+
+    def build_nlp_services(self, name):
+        return build_nlp_services(self.resource_registry, dataset=name)
+
+    @staticmethod
+    def _nbytes(loaded):
+        # The data frame and the filter index are what grows with the rows
+        return int(loaded["dataset"].memory_usage(deep=True).sum()) + loaded["filter_index"].nbytes()
+
+    def _resident_bytes(self, name):
+        # Called with the lock held
+        return self._resident[name] + self._caches[name].nbytes
+
+    def _evict(self, keep):
+        # Called with the lock held, the data set just used is never evicted
+        evicted = []
+        while len(self._resident) > 1 and \
+                sum(self._resident_bytes(name) for name in self._resident) > self.memory_budget:
+            name = next(dataset for dataset in self._resident if dataset != keep)
+            del self._resident[name]
+            self._caches.pop(name)
+            self.evictions += 1
+            evicted.append(name)
+        return evicted
+
+    def release(self, name):
+        # Queries already holding the data frame finish with it, the next one loads it again
+        self._release(name)
+
+    def _release(self, name, only_if_evicted=False):
+        with self._dataset_locks[name]:
+            with self._lock:
+                if only_if_evicted and name in self._resident:
+                    # Asked for again since it was evicted, it is recorded with its new size
+                    return
+                self._resident.pop(name, None)
+                self._caches.pop(name, None)
+            # The result cache goes too, its table answers can be as large as the data set
+            for resource in DATASET_RESOURCES:
+                self.resource_registry.release(resource_name(resource, name))
+
+    def cache_stats(self, name):
+        """
+        Stats of the result cache of a loaded data set, {} when it is not in memory.
+        Never loads anything, so looking at them does not bring back an evicted data set.
+        """
+        with self._lock:
+            cache = self._caches.get(name)
+            return cache.stats() if cache is not None else {}
+
+    def stats(self):
+        with self._lock:
+            resident = {name: self._resident_bytes(name) for name in self._resident}
+            return {
+                "datasets": {name: source.to_dict() for name, source in self.sources.items()},
+                "resident": {name: nbytes / 2 ** 20 for name, nbytes in resident.items()},
+                "resident_mb": sum(resident.values()) / 2 ** 20,
+                "budget_mb": self.memory_budget / 2 ** 20,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
+
+
+def load_datasets(resource_registry=registry):
+    # One DatasetRegistry per process, Streamlit reruns reuse it
+    resource_registry.register(
+        "datasets",
+        loader=lambda: DatasetRegistry(resource_registry=resource_registry).discover(),
+    )
+    return resource_registry.get("datasets")
@@ -1,36 +1,283 @@
-import nltk
 from Services.nlp_services import IntentExecutorServices
+from Services.streaming_services import PartialAggregate, StreamingIntentExecutorServices, format_aggregate_result
 import constants
 from Services.charts_services import VisualizationServices
+from Services.metrics_services import metrics
+from Services.result_cache import dataframe_fingerprint, intent_key
 
 
 class QueryProcessingUseCase:
-    def __init__(self, nlp_service, query, dataframe):
+    def __init__(self, nlp_service, query=None, dataframe=None, data_service=None, memory_limit_mb=None,
+                 stats_index=None, filter_index=None, groupby_service=None, result_cache=None, worker_pool=None, chart_queue=None):
         self.nlp_service = nlp_service
         self.query = query
         self.dataframe = dataframe
+        self.stats_index = stats_index
+        self.filter_index = filter_index
+        self.groupby_service = groupby_service
+        # Answers of earlier questions, tied to the fingerprint of the data set
+        self.result_cache = result_cache
+        # Worker processes attached to a shared memory copy of the data set (SharedWorkerPool)
+        self.worker_pool = worker_pool
+        # With a ChartRenderQueue charts are drawn in the background and the chart item of
+        # an answer is a ChartJob (result() gives the PNG path) instead of a figure
+        self.chart_queue = chart_queue
+        # Without a dataframe the query is answered chunk by chunk from the data service
+        self.data_service = data_service
+        self.memory_limit_mb = memory_limit_mb
         self.intent_executor = None
         self.visualizer = None
 
     def execute(self):
+        # One trace per question, slow questions are reported with the time of every stage
+        with metrics.trace_query(self.query):
+            return self._execute()
 
-        parsed_intent = self.nlp_service.parse_query(
-            query=self.query,
-            df_columns=self.dataframe.columns,
-            threshold=constants.COLUMN_MATCH_THRESHOLD,
-        )
-        print(parsed_intent)
+    def _execute(self):
+        if self.dataframe is None:
+            if self.data_service is None:
+                raise ValueError("Please provide a dataframe or a data service")
+            return self.execute_streaming()
+
+        fingerprint = dataframe_fingerprint(self.dataframe) if self.result_cache is not None else None
+        parsed_intent = self.result_cache.get_intent(self.query, fingerprint) if self.result_cache is not None else None
+        if parsed_intent is None:
+            with metrics.span("parse"):
+                parsed_intent = self.nlp_service.parse_query(
+                    query=self.query,
+                    df_columns=self.dataframe.columns,
+                    threshold=constants.COLUMN_MATCH_THRESHOLD,
+                    value_domains=self.filter_index.domains() if self.filter_index is not None else None,
+                )
+            if self.result_cache is not None:
+                self.result_cache.put_intent(self.query, fingerprint, parsed_intent)
+
+        if self.result_cache is not None:
+            cached = self.result_cache.get(parsed_intent, fingerprint)
+            if cached is not None:
+                result, fig, file_message = cached
+                if self.chart_queue is not None:
+                    # The PNG may have been evicted since, submit() reuses it or draws it again
+                    fig = self.submit_chart(None, parsed_intent)
+                return result, fig, file_message
 
         self.intent_executor = IntentExecutorServices(
             dataframe=self.dataframe,
             query_intent=parsed_intent,
+            stats_index=self.stats_index,
+            filter_index=self.filter_index,
+            groupby_service=self.groupby_service,
         )
-        result = self.intent_executor.execute()
+        with metrics.span("execute"):
+            result = self.intent_executor.execute()
 
+        # The executor keeps the filtered rows, the chart is drawn from the same rows
         self.visualizer = VisualizationServices(
-            dataframe=self.dataframe,
+            dataframe=self.intent_executor.dataframe,
             query_intent=parsed_intent,
+            stats_index=self.stats_index,
+            groupby_service=self.groupby_service,
+            save=self.chart_queue is None,
         )
-        fig, file_message = self.visualizer.execute()
+        if self.chart_queue is not None:
+            fig, file_message = self.submit_chart(self.visualizer, parsed_intent), None
+        else:
+            with metrics.span("plot"):
+                fig, file_message = self.visualizer.execute()
+
+        if self.result_cache is not None:
+            # Figures and chart jobs are never cached: a figure holds the plotted data and a
+            # PNG can be evicted while the answer is not. file_message keeps the saved chart path.
+            self.result_cache.put(parsed_intent, fingerprint, (result, None, file_message))
         return result, fig, file_message
 
+    def submit_chart(self, visualizer, parsed_intent):
+        """
+        Reuse the saved chart of the same intent on the same data, or draw it on the render thread.
+
+        Args:
+            visualizer (VisualizationServices): Draws the chart from the rows of the answer.
+                None for a cached answer: the intent is executed again on the render thread,
+                only when its PNG is not saved any more.
+        """
+        if visualizer is None:
+            return self.chart_queue.submit(parsed_intent, dataframe_fingerprint(self.dataframe),
+                                           lambda: self.draw_chart(parsed_intent))
+        return self.chart_queue.submit(
+            parsed_intent,
+            dataframe_fingerprint(self.dataframe),
+            lambda: visualizer.execute()[0],
+        )
+
+    def draw_chart(self, parsed_intent):
+        executor = IntentExecutorServices(
+            dataframe=self.dataframe,
+            query_intent=parsed_intent,
+            stats_index=self.stats_index,
+            filter_index=self.filter_index,
+            groupby_service=self.groupby_service,
+        )
+        executor.execute()
+        return VisualizationServices(
+            dataframe=executor.dataframe,
+            query_intent=parsed_intent,
+            stats_index=self.stats_index,
+            groupby_service=self.groupby_service,
+            save=False,
+        ).execute()[0]
+
+    def execute_streaming(self):
+        with metrics.span("parse"):
+            parsed_intent = self.nlp_service.parse_query(
+                query=self.query,
+                df_columns=self.data_service.read_columns(),
+                threshold=constants.COLUMN_MATCH_THRESHOLD,
+            )
+
+        self.intent_executor = StreamingIntentExecutorServices(
+            data_service=self.data_service,
+            query_intent=parsed_intent,
+            memory_limit_mb=self.memory_limit_mb,
+        )
+        with metrics.span("execute"):
+            result = self.intent_executor.execute()
+
+        # Charts need the whole column in memory, so there is none in streaming mode
+        return result, None, None
+
+    def execute_many(self, queries, with_charts=False):
+        """
+        Answer many questions with work proportional to the distinct questions.
+
+        Questions are classified in one batch, identical intents are executed once,
+        and plain aggregates on the same column share one scan of that column.
+
+        Args:
+            queries (list): Natural language questions.
+            with_charts (bool): Also draw the chart of every distinct intent.
+
+        Returns:
+            list: One dict per question with the query, parsed intent, result,
+                fig, file_message and error (None when it was answered).
+        """
+        with metrics.trace_query(queries, stage="batch"):
+            return self._execute_many(queries, with_charts)
+
+    def _execute_many(self, queries, with_charts):
+        if self.dataframe is None:
+            raise ValueError("Please provide a dataframe")
+
+        with metrics.span("parse"):
+            parsed_intents = self.nlp_service.parse_queries(
+                queries=queries,
+                df_columns=self.dataframe.columns,
+                threshold=constants.COLUMN_MATCH_THRESHOLD,
+                value_domains=self.filter_index.domains() if self.filter_index is not None else None,
+            )
+
+        # Identical intents share one answer
+        distinct_intents = {}
+        for parsed_intent in parsed_intents:
+            distinct_intents.setdefault(intent_key(parsed_intent), parsed_intent)
+
+        # Charts are drawn from the rows of a fresh answer, so cached answers are used without charts only
+        use_cache = self.result_cache is not None and not with_charts
+        fingerprint = dataframe_fingerprint(self.dataframe) if use_cache else None
+        cached = {}
+        if use_cache:
+            for key, parsed_intent in distinct_intents.items():
+                value = self.result_cache.get(parsed_intent, fingerprint)
+                if value is not None:
+                    cached[key] = {"result": value[0], "error": None, "dataframe": None}
+
+        with metrics.span("scan_columns"):
+            answers = self.scan_columns_once({key: parsed_intent for key, parsed_intent in distinct_intents.items()
+                                              if key not in cached})
+        answers.update(cached)
+        if self.worker_pool is not None and not with_charts:
+            # Charts need the filtered rows, which stay in the workers, so only plain answers go there
+            pending = [(key, parsed_intent) for key, parsed_intent in distinct_intents.items() if key not in answers]
+            self.worker_pool.ensure_current(self.dataframe, self.stats_index, self.filter_index)
+            with metrics.span("pool_execute"):
+                pool_answers = self.worker_pool.execute_many([parsed_intent for _, parsed_intent in pending])
+            for (key, _), (result, error) in zip(pending, pool_answers):
+                answers[key] = {"result": result, "error": error, "dataframe": None}
+
+        for key, parsed_intent in distinct_intents.items():
+            if key in answers:
+                continue
+            try:
+                executor = IntentExecutorServices(
+                    dataframe=self.dataframe,
+                    query_intent=parsed_intent,
+                    stats_index=self.stats_index,
+                    filter_index=self.filter_index,
+                    groupby_service=self.groupby_service,
+                )
+                with metrics.span("execute"):
+                    result = executor.execute()
+                answers[key] = {"result": result, "error": None, "dataframe": executor.dataframe}
+            except (ValueError, KeyError, TypeError) as e:
+                answers[key] = {"result": None, "error": str(e), "dataframe": None}
+
+        if use_cache:
+            for key, parsed_intent in distinct_intents.items():
+                if key not in cached and answers[key]["error"] is None:
+                    self.result_cache.put(parsed_intent, fingerprint, (answers[key]["result"], None, None))
+
+        for key, parsed_intent in distinct_intents.items():
+            answer = answers[key]
+            answer["fig"], answer["file_message"] = None, None
+            if with_charts and answer["error"] is None:
+                visualizer = VisualizationServices(
+                    dataframe=answer.get("dataframe") if answer.get("dataframe") is not None else self.dataframe,
+                    query_intent=parsed_intent,
+                    stats_index=self.stats_index,
+                    groupby_service=self.groupby_service,
+                    save=self.chart_queue is None,
+                )
+                if self.chart_queue is not None:
+                    answer["fig"] = self.submit_chart(visualizer, parsed_intent)
+                else:
+                    with metrics.span("plot"):
+                        answer["fig"], answer["file_message"] = visualizer.execute()
+
+        results = []
+        for query, parsed_intent in zip(queries, parsed_intents):
+            answer = answers[intent_key(parsed_intent)]
+            results.append({
+                "query": query,
+                "intent": parsed_intent,
+                "result": answer["result"],
+                "fig": answer["fig"],
+                "file_message": answer["file_message"],
+                "error": answer["error"],
+            })
+        return results
+
+    def scan_columns_once(self, distinct_intents):
+        """
+        Answer the plain mean / sum / count / filter intents with one aggregate per column.
+        Skipped when the statistics index is current, it already answers them without a scan.
+        """
+        if self.stats_index is not None and self.stats_index.is_current(self.dataframe):
+            return {}
+
+        intents_by_column = {}
+        for key, parsed_intent in distinct_intents.items():
+            column = parsed_intent.get("column")
+            if parsed_intent.get("filters") is None and parsed_intent.get("group_by") is None and \
+                    parsed_intent.get("action") in ["mean", "sum", "count", "filter"] and \
+                    column in self.dataframe.columns:
+                intents_by_column.setdefault(column, []).append((key, parsed_intent["action"]))
+
+        answers = {}
+        for column, intents in intents_by_column.items():
+            track_distinct = any(action == "filter" for _, action in intents)
+            aggregate = PartialAggregate(track_distinct=track_distinct).update(self.dataframe[column])
+            for key, action in intents:
+                try:
+                    answers[key] = {"result": format_aggregate_result(action, column, aggregate), "error": None}
+                except ValueError as e:
+                    answers[key] = {"result": None, "error": str(e)}
+        return answers
@@ -0,0 +1,134 @@
+"""
+    Registers the shared resources of the app and warms them up
+"""
+import os
+
+from Services.chart_render_queue import ChartRenderQueue
+from Services.entity_services import ValueEntityRecognizer
+from Services.nlp_services import NLPServices, load_stopwords
+from Services.resource_registry import LIFETIME_PROCESS, LIFETIME_WATCH, registry
+from Services.stats_services import StatisticsIndex
+from Services.filter_services import FilterIndex
+from Services.groupby_services import GroupByService
+from Services.result_cache import ResultCache
+from Usecases.data_handler import DataUsecase
+import constants
+
+
+def resource_name(name, dataset=None):
+    # Resources of a data set of the DatasetRegistry are named "<data set>/<resource>"
+    return name if dataset is None else f"{dataset}/{name}"
+
+
+# Built from one data set, registered once per data set
+DATASET_RESOURCES = ["dataset", "stats_index", "filter_index", "value_recognizer", "groupby_service", "result_cache"]
+
+
+def register_resources(file_path, zip_file_name, csv_file_name, resource_registry=registry, dataset=None):
+    """
+    Register the data set (and its statistics / filter indexes), intent model and stopwords.
+    Safe to call on every Streamlit rerun.
+
+    The classifier and the vectorizer are one resource so a reload can never pair
+    a new classifier with an old vectorizer.
+
+    Args:
+        dataset (str): Name of the data set when several are registered, its resources are
+            then named "<dataset>/<resource>" (see resource_name). The intent model, the
+            stopwords and the chart queue are shared by every data set.
+    """
+    def key(name):
+        return resource_name(name, dataset)
+
+    watch_paths = [os.path.join(file_path, csv_file_name)]
+    if zip_file_name:
+        watch_paths.append(os.path.join(file_path, zip_file_name))
+
+    resource_registry.register(
+        key("dataset"),
+        loader=lambda: DataUsecase(
+            file_path=file_path,
+            zip_file_name=zip_file_name,
+            csv_file_name=csv_file_name,
+        ).execute()[1],
+        lifetime=LIFETIME_WATCH,
+        watch_paths=watch_paths,
+    )
+    # Indexes are built from the data set, so they watch the same files and are rebuilt with it
+    resource_registry.register(
+        key("stats_index"),
+        loader=lambda: StatisticsIndex().build(resource_registry.get(key("dataset"))),
+        lifetime=LIFETIME_WATCH,
+        watch_paths=watch_paths,
+    )
+    resource_registry.register(
+        key("filter_index"),
+        loader=lambda: FilterIndex().build(resource_registry.get(key("dataset"))),
+        lifetime=LIFETIME_WATCH,
+        watch_paths=watch_paths,
+    )
+    # One recognizer for the life of the process, a reload only syncs the values that changed
+    value_recognizer = ValueEntityRecognizer()
+    resource_registry.register(
+        key("value_recognizer"),
+        loader=lambda: value_recognizer.sync(resource_registry.get(key("filter_index")).domains()),
+        lifetime=LIFETIME_WATCH,
+        watch_paths=watch_paths,
+    )
+    resource_registry.register(
+        key("groupby_service"),
+        loader=lambda: GroupByService(resource_registry.get(key("dataset"))),
+        lifetime=LIFETIME_WATCH,
+        watch_paths=watch_paths,
+    )
+    # Per data set, so the answers of one data set never push out those of another
+    resource_registry.register(
+        key("result_cache"),
+        loader=ResultCache,
+        lifetime=LIFETIME_PROCESS,
+    )
+    register_shared_resources(resource_registry)
+    return resource_registry
+
+
+def register_shared_resources(resource_registry=registry):
+    """
+    Register the resources that do not depend on a data set.
+    """
+    resource_registry.register(
+        "intent_model",
+        loader=NLPServices.load_model,
+        lifetime=LIFETIME_WATCH,
+        watch_paths=[
+            os.path.join(constants.MODELS_DIR, constants.INTENT_MODEL_NAME),
+            os.path.join(constants.MODELS_DIR, constants.INTENT_VECTORIZER_NAME),
+            os.path.join(constants.MODELS_DIR, constants.INTENT_COMPILED_MODEL_NAME),
+            os.path.join(constants.MODELS_DIR, constants.INTENT_ONLINE_MODEL_NAME),
+        ],
+    )
+    resource_registry.register(
+        "stopwords",
+        loader=load_stopwords,
+        lifetime=LIFETIME_PROCESS,
+    )
+    resource_registry.register(
+        "chart_queue",
+        loader=ChartRenderQueue,
+        lifetime=LIFETIME_PROCESS,
+    )
+    return resource_registry
+
+
+def warm_up(resource_registry=registry, names=None):
+    # Loads everything (or the given resources) up front so the first query does not pay for it
+    resource_registry.warm_up(names)
+
+
+def build_nlp_services(resource_registry=registry, dataset=None):
+    # Cheap to build, all the heavy parts come from the registry
+    return NLPServices(
+        intent_keywords=constants.INTENT_KEYWORDS,
+        intent_model=resource_registry.get("intent_model"),
+        stop_words=resource_registry.get("stopwords"),
+        value_recognizer=resource_registry.get(resource_name("value_recognizer", dataset)),
+    )
@@ -1,32 +1,34 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.figure
 import constants
-from Services.data import DataService
-from Usecases.data_handler import DataUsecase
 from Usecases.query_processing import QueryProcessingUseCase
-from Services.nlp_services import NLPServices
+from Services.schema_services import SchemaService
+from Services.metrics_services import metrics
+from Services.resource_registry import registry
+from Usecases.dataset_registry import load_datasets
+from Usecases.resources import warm_up
 st.set_page_config(page_title="AskQuery", layout="wide")
-st.title("AskQuery – Ask Questions About Bank Data")
-
-file_path = "./Data"
-zip_file_name = "bank+marketing.zip"
-csv_file_name = "bank-full.csv"
+st.title("AskQuery – Ask Questions About Your Data")
 
 try:
-    data_handler_usecase = DataUsecase(
-        file_path=file_path,
-        zip_file_name=zip_file_name,
-        csv_file_name=csv_file_name,
-    )
-    status, data_set = data_handler_usecase.execute()
+    # The data sets are discovered once per process, each one is loaded on its first question
+    datasets = load_datasets()
+    warm_up(names=["intent_model", "stopwords"])
+    selected = st.selectbox("Data set", ["Auto"] + datasets.names(),
+                            help="Auto picks the data set whose columns the question names")
+    # In Auto mode the preview follows the data set of the last question
+    preview_name = st.session_state.get("dataset", datasets.default) if selected == "Auto" else selected
+    status, data_set = True, datasets.resources(preview_name)["dataframe"]
     st.success("File loaded successfully!")
     # print("loaded")
     if status:
         if data_set is not None:
-            st.write("Here is a preview of your data:")
+            st.write(f"Here is a preview of {preview_name}:")
             st.dataframe(data_set.head(10))
 
+            with st.expander("Memory usage per column"):
+                st.dataframe(SchemaService.memory_report(data_set))
+
             # Step 2: Enter natural language query
             query = st.text_input("Ask a question about your data:")
 
@@ -34,15 +36,20 @@ try:
                 st.markdown("#### Your Query:")
                 st.write(query)
 
-                nlp_services = NLPServices(intent_keywords=constants.INTENT_KEYWORDS)
+                dataset_name = datasets.route(query) if selected == "Auto" else selected
+                st.session_state["dataset"] = dataset_name
+                nlp_services = datasets.build_nlp_services(dataset_name)
 
                 # Step 3: Process the query
                 queryprocessing_usecase = QueryProcessingUseCase(
                     nlp_service=nlp_services,
                     query=query,
-                    dataframe=data_set,
+                    chart_queue=registry.get("chart_queue"),
+                    **datasets.resources(dataset_name),
                 )
-                result, fig, file_message = queryprocessing_usecase.execute()
+                result, chart, _ = queryprocessing_usecase.execute()
+
+                st.caption(f"Answered from {dataset_name}")
 
                 st.markdown("#### Result:")
                 if isinstance(result, pd.DataFrame):
@@ -50,11 +57,28 @@ try:
                 else:
                     st.write(result)
 
-                if isinstance(fig, matplotlib.figure.Figure):
-                    st.pyplot(fig)
+                # The answer is shown first, the chart is drawn (or reused) in the background
+                if chart is not None:
+                    with st.spinner("Drawing the chart..."):
+                        try:
+                            chart_path = chart.result()
+                        except Exception as chart_error:
+                            # The answer stands without its chart
+                            chart_path = None
+                            st.warning(f"Could not draw the chart: {chart_error}")
+                    if chart_path is not None:
+                        st.image(chart_path)
+                        st.write(f"Chart is saved to {chart_path}")
+
+            with st.sidebar.expander("Result cache"):
+                st.json(datasets.cache_stats(preview_name))
+                st.json(registry.get("chart_queue").stats())
+
+            with st.sidebar.expander("Data sets"):
+                st.json(datasets.stats())
 
-                if file_message is not None:
-                    st.write(file_message)
+            with st.sidebar.expander("Latency per stage"):
+                st.json(metrics.to_dict())
 
 
         else:
@@ -45,6 +45,12 @@ QUERIES = [
 ]
 
 COLUMN_MATCH_THRESHOLD = 70
+# Words of a question that stand for a value of a column: word -> (column, value)
+VALUE_ALIASES = {
+    "subscribed": ("y", "yes"),
+}
+# Column indexes (Services/column_matcher.py) kept per process, one per schema
+COLUMN_MATCHER_CACHE_SIZE = 64
 
 INTENT_HANDLERS = {
     'mean_balance': 'handle_mean_balance',
@@ -52,4 +58,117 @@ INTENT_HANDLERS = {
     'filter_clients': 'handle_filter_clients',
     'count_subscribed': 'handle_count_subscribed',
     'filter_job_marital': 'handle_filter_job_marital'
-}
\ No newline at end of file
+}
+
+# Data sets of the app (Usecases/dataset_registry.py): every CSV under DATA_DIR, on disk or in a zip
+DATA_DIR = "./Data"
+# Asked when a question names no column of any data set
+DEFAULT_DATASET = "bank-full"
+# CSV files that are not data sets, and folders that are not searched
+DATASET_EXCLUDE = ["intent_dataset.csv"]
+DATASET_SKIP_DIRS = [".cache", "__MACOSX"]
+# Loaded data sets (data frames and filter indexes) past this are evicted, least recently used first
+DATASET_MEMORY_BUDGET_MB = 1024
+
+# Columnar cache of the loaded data set, created inside the data folder
+DATA_CACHE_DIR_NAME = ".cache"
+# Also compare the sha1 of the source file, not only its size and mtime
+DATA_CACHE_VERIFY_HASH = False
+
+# Number of CSV rows parsed at a time when streaming the data set out of a zip
+ARCHIVE_READ_CHUNK_SIZE = 100_000
+
+# Memory ceiling of one chunk in the streaming (out-of-core) execution mode
+STREAMING_MEMORY_LIMIT_MB = 64
+# Rows read up front to estimate the size of a row
+STREAMING_SAMPLE_ROWS = 1000
+# Distinct values kept while streaming a filter, to keep memory bounded
+STREAMING_MAX_DISTINCT = 10_000
+
+# Intent model files, loaded by NLPServices.load_model
+MODELS_DIR = "./models/"
+INTENT_MODEL_NAME = "clf_folded.joblib"
+INTENT_VECTORIZER_NAME = "vectorizer_folded.joblib"
+# NumPy only copy of the model above (intent_classifier/train.py --compile-only), preferred when present
+INTENT_COMPILED_MODEL_NAME = "intent_model_folded.npz"
+# Model updated from labeled queries (intent_classifier/online_model.py), preferred over both when present
+INTENT_ONLINE_MODEL_NAME = "intent_model_online.npz"
+# Labeled queries appended by POST /feedback, folded into the online model
+FEEDBACK_LOG_PATH = "./Data/feedback.jsonl"
+
+# Columns with more distinct values than this keep no value counts in the statistics index
+STATS_MAX_CATEGORIES = 1000
+# Size of the sample used for approximate quantiles in the statistics index
+STATS_QUANTILE_SAMPLE_SIZE = 10_000
+
+# Number of answered questions kept by the result cache
+RESULT_CACHE_SIZE = 256
+# Bytes of cached results (table answers are data frames), least recently used go first past it
+RESULT_CACHE_MAX_BYTES = 64 * 2 ** 20
+
+# Other words used for a column in questions, used by the column matcher
+COLUMN_SYNONYMS = {
+    "age": ["old", "older", "younger"],
+    "job": ["occupation", "profession", "employment"],
+    "marital": ["marital status"],
+    "education": ["educated", "degree", "schooling"],
+    "default": ["defaulted", "defaults", "in default"],
+    "balance": ["account balance", "yearly balance"],
+    "housing": ["housing loan", "mortgage"],
+    "loan": ["personal loan", "loans"],
+    "contact": ["contacted", "contact type"],
+    "day": ["day of month"],
+    "month": ["monthly"],
+    "duration": ["call duration", "call length"],
+    "campaign": ["contacts during campaign"],
+    "pdays": ["days passed", "days since last contact"],
+    "previous": ["previous contacts"],
+    "poutcome": ["previous outcome", "outcome"],
+    "y": ["subscribed", "subscription", "subscribe", "term deposit"],
+}
+
+# Charts (ChartRenderQueue): saved under a hash of what they show, least recently used
+# ones are removed once the directory is over the byte budget. A directory of their own,
+# nothing else in it is ever removed
+CHART_OUTPUT_DIR = "outputs/charts"
+CHART_OUTPUT_MAX_BYTES = 50 * 1024 * 1024
+CHART_RENDER_WORKERS = 1
+# Horizontal pixels of a line chart, long series are downsampled to about this many points
+CHART_PIXEL_BUDGET = 800
+# Bars of a value counts chart, only the most frequent values are drawn past this
+CHART_MAX_BARS = 50
+
+# Latency metrics of the query pipeline (Services/metrics_services.py)
+METRICS_ENABLED = True
+# Histogram bucket bounds, log spaced from 10 us to about 30 s
+METRICS_BUCKETS_MS = [0.01 * 2 ** (step / 2) for step in range(44)]
+# Questions slower than this are reported to the slow query hooks
+SLOW_QUERY_MS = 1000
+# Sampling profiler of the slow questions (metrics.enable_profiler())
+PROFILER_INTERVAL_MS = 5
+PROFILER_MAX_DEPTH = 30
+PROFILER_TOP_STACKS = 5
+
+# Import time budget (ms) of the modules a worker or CLI starts from, see Benchmark/import_time.py
+IMPORT_TIME_BUDGET_MS = {
+    "Services.nlp_services": 1000,
+    "Usecases.query_processing": 1000,
+    "Usecases.resources": 1000,
+}
+# Loaded on first use only, importing the modules above must not pull them in
+LAZY_IMPORTS = ["matplotlib", "sklearn", "nltk", "streamlit", "joblib", "scipy"]
+
+# Headless HTTP/JSON server (server.py)
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8080
+# Threads running the pandas work of the requests
+SERVER_WORKERS = 4
+# Requests accepted at once (running + waiting for a thread), more get 503 right away
+SERVER_MAX_PENDING = 64
+SERVER_REQUEST_TIMEOUT_S = 10
+SERVER_IDLE_TIMEOUT_S = 30
+SERVER_MAX_BODY_BYTES = 1_000_000
+# Rows of a table result (filter, group by) sent back in one response
+SERVER_RESULT_ROWS = 100
+# Worker processes sharing the data set through shared memory (server.py --processes), None = one per core
+WORKER_PROCESSES = None
@@ -0,0 +1,307 @@
+"""
+    Compiled form of the intent classifier (TfidfVectorizer + LogisticRegression).
+
+    export_compiled_model() writes the vocabulary, the IDF weights and the coefficient
+    matrix to one .npz file. CompiledVectorizer / CompiledClassifier score a question
+    with plain NumPy and give the same predictions and probabilities as scikit-learn,
+    so serving code never has to import scikit-learn.
+
+    The online model (HashingVectorizer + SGDClassifier, see online_model.py) compiles
+    to the same format, with the feature hashing done by murmurhash3_32 below.
+"""
+import os
+import re
+
+import numpy as np
+
+FORMAT_VERSION = 2
+# Hashed terms remembered by a CompiledVectorizer
+HASH_CACHE_SIZE = 100_000
+_MASK_32 = 0xFFFFFFFF
+
+
+def _rotl32(value, shift):
+    return ((value << shift) | (value >> (32 - shift))) & _MASK_32
+
+
+def murmurhash3_32(data, seed=0):
+    """
+    Signed 32 bit MurmurHash3 (x86) of bytes, the hash HashingVectorizer uses.
+    """
+    c1, c2 = 0xCC9E2D51, 0x1B873593
+    hash_value = seed & _MASK_32
+    rounded = len(data) & ~3
+
+    for start in range(0, rounded, 4):
+        k = int.from_bytes(data[start:start + 4], "little")
+        k = (_rotl32((k * c1) & _MASK_32, 15) * c2) & _MASK_32
+        hash_value = (_rotl32(hash_value ^ k, 13) * 5 + 0xE6546B64) & _MASK_32
+
+    k = 0
+    tail = len(data) & 3
+    if tail == 3:
+        k ^= data[rounded + 2] << 16
+    if tail >= 2:
+        k ^= data[rounded + 1] << 8
+    if tail >= 1:
+        k ^= data[rounded]
+        hash_value ^= (_rotl32((k * c1) & _MASK_32, 15) * c2) & _MASK_32
+
+    hash_value ^= len(data)
+    hash_value ^= hash_value >> 16
+    hash_value = (hash_value * 0x85EBCA6B) & _MASK_32
+    hash_value ^= hash_value >> 13
+    hash_value = (hash_value * 0xC2B2AE35) & _MASK_32
+    hash_value ^= hash_value >> 16
+    return hash_value - (1 << 32) if hash_value & 0x80000000 else hash_value
+
+
+def _is_multinomial(classifier):
+    # Same rule LogisticRegression uses to pick softmax over one-vs-rest,
+    # SGDClassifier is always one-vs-rest
+    if len(classifier.classes_) <= 2 or not hasattr(classifier, "solver"):
+        return False
+    multi_class = getattr(classifier, "multi_class", "auto")
+    if multi_class in ("auto", "deprecated"):
+        return classifier.solver != "liblinear"
+    return multi_class == "multinomial"
+
+
+def export_compiled_model(classifier, vectorizer, path):
+    """
+    Compile a fitted TfidfVectorizer + LogisticRegression pair (or a HashingVectorizer +
+    SGDClassifier pair) to a .npz artifact.
+
+    Only the vectorizer settings the scorer reproduces are accepted: word n-grams
+    from a token pattern, optional lowercasing, binary / sublinear tf, IDF weighting
+    and l2 norm.
+
+    Args:
+        classifier (LogisticRegression or SGDClassifier): The fitted classifier.
+        vectorizer (TfidfVectorizer or HashingVectorizer): The fitted vectorizer.
+        path (str): Where to write the artifact.
+
+    Returns:
+        str: The path of the artifact.
+    """
+    params = vectorizer.get_params()
+    hashing = "n_features" in params
+    unsupported = {
+        "analyzer": params["analyzer"] != "word",
+        "tokenizer": params["tokenizer"] is not None,
+        "preprocessor": params["preprocessor"] is not None,
+        "strip_accents": params["strip_accents"] is not None,
+        "stop_words": params["stop_words"] is not None,
+        "norm": params["norm"] not in ("l2", None),
+        # Hashed features are never binary in the scorer
+        "binary": hashing and params["binary"],
+    }
+    unsupported = [name for name, flag in unsupported.items() if flag]
+    if unsupported:
+        raise ValueError(f"Vectorizer settings {unsupported} can not be compiled")
+
+    if hashing:
+        # No vocabulary, the scorer hashes the terms itself
+        terms = np.empty(0, dtype=object)
+        idf = np.ones(params["n_features"])
+    else:
+        terms = np.empty(len(vectorizer.vocabulary_), dtype=object)
+        for term, position in vectorizer.vocabulary_.items():
+            terms[position] = term
+        idf = _idf_weights(vectorizer)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Written next to the target and swapped in, a reader never sees half a file
+    temp_path = f"{path}.tmp.npz"
+    # Compressed, the coefficients of hashed features are mostly zeros
+    np.savez_compressed(
+        temp_path,
+        format_version=np.array(FORMAT_VERSION),
+        terms=terms.astype(str),
+        idf=np.asarray(idf, dtype=np.float64),
+        coef=np.asarray(classifier.coef_, dtype=np.float64),
+        intercept=np.asarray(classifier.intercept_, dtype=np.float64),
+        classes=np.asarray(classifier.classes_).astype(str),
+        token_pattern=np.array(params["token_pattern"]),
+        lowercase=np.array(bool(params["lowercase"])),
+        ngram_range=np.array(params["ngram_range"]),
+        binary=np.array(bool(params["binary"])),
+        sublinear_tf=np.array(bool(params.get("sublinear_tf", False))),
+        l2_norm=np.array(params["norm"] == "l2"),
+        n_features=np.array(params["n_features"] if hashing else 0),
+        alternate_sign=np.array(bool(params.get("alternate_sign", False))),
+        multinomial=np.array(_is_multinomial(classifier)),
+    )
+    os.replace(temp_path, path)
+    return path
+
+
+def _idf_weights(vectorizer):
+    if not vectorizer.get_params()["use_idf"]:
+        return np.ones(len(vectorizer.vocabulary_))
+    if hasattr(vectorizer._tfidf, "_idf_diag"):
+        # Vectorizers pickled by older scikit-learn keep the weights as a diagonal matrix,
+        # newer versions do not read it back and silently score without IDF
+        return vectorizer._tfidf._idf_diag.diagonal()
+    return vectorizer.idf_
+
+
+def verify_compiled_model(classifier, vectorizer, path, queries):
+    """
+    Check the artifact against scikit-learn on the given questions.
+
+    Raises:
+        ValueError: When a prediction or a probability differs.
+    """
+    from sklearn.feature_extraction.text import CountVectorizer
+    from sklearn.preprocessing import normalize
+
+    queries = list(queries)
+    if hasattr(getattr(vectorizer, "_tfidf", None), "_idf_diag"):
+        # Rebuild the features the model was trained on: counts x IDF, l2 normalized
+        features = CountVectorizer.transform(vectorizer, queries).multiply(_idf_weights(vectorizer)).tocsr()
+        features = normalize(features) if vectorizer.get_params()["norm"] == "l2" else features
+    else:
+        features = vectorizer.transform(queries)
+
+    compiled_classifier, compiled_vectorizer = load_compiled_model(path)
+    compiled_features = compiled_vectorizer.transform(queries)
+    if not np.allclose(classifier.predict_proba(features), compiled_classifier.predict_proba(compiled_features),
+                       rtol=1e-9, atol=1e-12):
+        raise ValueError(f"Compiled model {path} does not match the scikit-learn model")
+    if list(classifier.predict(features)) != list(compiled_classifier.predict(compiled_features)):
+        raise ValueError(f"Compiled model {path} does not predict like the scikit-learn model")
+
+
+class CompiledVectorizer:
+    def __init__(self, terms, idf, token_pattern, lowercase=True, l2_norm=True, ngram_range=(1, 1),
+                 binary=False, sublinear_tf=False, n_features=0, alternate_sign=False):
+        # Without n_features terms are looked up in the vocabulary, with it they are hashed
+        self.vocabulary = {term: position for position, term in enumerate(terms)}
+        self.n_features = n_features
+        self.alternate_sign = alternate_sign
+        # Hashes of the terms seen so far, questions repeat the same few words
+        self._hashes = {}
+        self.idf = idf
+        self.token_pattern = re.compile(token_pattern)
+        self.lowercase = lowercase
+        self.l2_norm = l2_norm
+        self.ngram_range = tuple(ngram_range)
+        self.binary = binary
+        self.sublinear_tf = sublinear_tf
+
+    def feature(self, term):
+        """
+        (column, sign) of a term, column None for a term outside the vocabulary.
+        """
+        if not self.n_features:
+            return self.vocabulary.get(term), 1
+        feature = self._hashes.get(term)
+        if feature is None:
+            hash_value = murmurhash3_32(term.encode("utf-8"))
+            sign = -1 if self.alternate_sign and hash_value < 0 else 1
+            feature = (abs(hash_value) % self.n_features, sign)
+            if len(self._hashes) < HASH_CACHE_SIZE:
+                self._hashes[term] = feature
+        return feature
+
+    def terms(self, tokens):
+        # Word n-grams joined by a space, like TfidfVectorizer
+        min_n, max_n = self.ngram_range
+        for n in range(min_n, max_n + 1):
+            for start in range(len(tokens) - n + 1):
+                yield " ".join(tokens[start:start + n])
+
+    def transform(self, queries):
+        """
+        TF-IDF features of every question.
+
+        Returns:
+            list: One (feature ids, weights) pair of arrays per question.
+        """
+        features = []
+        for query in queries:
+            if self.lowercase:
+                query = query.lower()
+            counts = {}
+            for term in self.terms(self.token_pattern.findall(query)):
+                position, sign = self.feature(term)
+                if position is not None:
+                    counts[position] = counts.get(position, 0) + sign
+
+            positions = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+            weights = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+            # Hashed terms can cancel each other out
+            keep = weights != 0
+            positions, weights = positions[keep], weights[keep]
+            if self.binary:
+                weights[:] = 1
+            elif self.sublinear_tf:
+                weights = 1 + np.log(weights)
+            weights *= self.idf[positions]
+            if self.l2_norm and len(weights):
+                weights /= np.sqrt(np.dot(weights, weights))
+            features.append((positions, weights))
+        return features
+
+
+class CompiledClassifier:
+    def __init__(self, coef, intercept, classes, multinomial=True):
+        self.coef = coef
+        self.intercept = intercept
+        self.classes_ = classes
+        self.multinomial = multinomial
+
+    def decision_function(self, features):
+        scores = np.empty((len(features), len(self.intercept)))
+        for row, (positions, weights) in enumerate(features):
+            scores[row] = self.coef[:, positions] @ weights + self.intercept
+        return scores
+
+    def predict_proba(self, features):
+        scores = self.decision_function(features)
+        if self.multinomial:
+            scores -= scores.max(axis=1, keepdims=True)
+            probabilities = np.exp(scores)
+            return probabilities / probabilities.sum(axis=1, keepdims=True)
+        probabilities = 1 / (1 + np.exp(-scores))
+        if probabilities.shape[1] == 1:
+            return np.hstack([1 - probabilities, probabilities])
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+    def predict(self, features):
+        scores = self.decision_function(features)
+        if scores.shape[1] == 1:
+            return self.classes_[(scores[:, 0] > 0).astype(int)]
+        return self.classes_[scores.argmax(axis=1)]
+
+
+def load_compiled_model(path):
+    """
+    Load an artifact written by export_compiled_model().
+
+    Returns:
+        tuple: (CompiledClassifier, CompiledVectorizer), used like the scikit-learn pair.
+    """
+    with np.load(path, allow_pickle=False) as artifact:
+        if int(artifact["format_version"]) != FORMAT_VERSION:
+            raise ValueError(f"Unsupported compiled model version in {path}")
+        vectorizer = CompiledVectorizer(
+            terms=artifact["terms"].tolist(),
+            idf=artifact["idf"],
+            token_pattern=str(artifact["token_pattern"]),
+            lowercase=bool(artifact["lowercase"]),
+            l2_norm=bool(artifact["l2_norm"]),
+            ngram_range=artifact["ngram_range"].tolist(),
+            binary=bool(artifact["binary"]),
+            sublinear_tf=bool(artifact["sublinear_tf"]),
+            n_features=int(artifact["n_features"]) if "n_features" in artifact.files else 0,
+            alternate_sign=bool(artifact["alternate_sign"]) if "alternate_sign" in artifact.files else False,
+        )
+        classifier = CompiledClassifier(
+            coef=artifact["coef"],
+            intercept=artifact["intercept"],
+            classes=artifact["classes"].astype(object),
+            multinomial=bool(artifact["multinomial"]),
+        )
+    return classifier, vectorizer
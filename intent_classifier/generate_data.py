@@ -1,6 +1,9 @@
 import random
 import pandas as pd
+import numpy as np
 import os
+import argparse
+from multiprocessing import Pool
 
 # Mapping of intent types to keywords commonly used in queries
 INTENT_KEYWORDS = {
@@ -33,6 +36,122 @@ COLUMNS = {
     "poutcome": ["unknown", "other", "failure", "success"]
 }
 
+AGGREGATE_INTENTS = ["mean", "sum", "max", "min"]
+INTENT_NAMES = list(INTENT_KEYWORDS)
+COLUMN_NAMES = np.array(list(COLUMNS), dtype=object)
+NUMERIC_COLUMNS = np.array([column for column, col_type in COLUMNS.items() if col_type == "numeric"], dtype=object)
+# Categorical values of every column in one flat table, column i owns VALUE_TABLE[offset:offset + size]
+VALUE_SIZES = np.array([0 if col_type == "numeric" else len(col_type) for col_type in COLUMNS.values()])
+VALUE_OFFSETS = np.concatenate([[0], np.cumsum(VALUE_SIZES)[:-1]])
+VALUE_TABLE = np.array([value for col_type in COLUMNS.values() if col_type != "numeric" for value in col_type],
+                       dtype=object)
+
+# Rows generated and written at a time by write_synthetic_queries
+CHUNK_SIZE = 100_000
+
+
+def generate_chunk(rng, n):
+    """
+    Vectorized version of generate_synthetic_queries: the same templates, drawn per intent with NumPy.
+
+    Args:
+        rng (np.random.Generator): Source of randomness, the chunk is reproducible from its seed.
+        n (int): Number of queries to generate.
+
+    Returns:
+        pd.DataFrame: DataFrame with columns 'query' and 'intent'.
+    """
+    intent_ids = rng.integers(len(INTENT_NAMES), size=n)
+    queries = np.empty(n, dtype=object)
+
+    for intent_id, intent in enumerate(INTENT_NAMES):
+        rows = np.flatnonzero(intent_ids == intent_id)
+        keyword_ids = rng.integers(len(INTENT_KEYWORDS[intent]), size=len(rows))
+        keywords = np.array(INTENT_KEYWORDS[intent], dtype=object)[keyword_ids]
+
+        if intent in AGGREGATE_INTENTS:
+            # Drawn from the numeric columns directly instead of retrying until one is numeric
+            columns = NUMERIC_COLUMNS[rng.integers(len(NUMERIC_COLUMNS), size=len(rows))]
+            queries[rows] = "What is the " + keywords + " " + columns + "?"
+            continue
+
+        column_ids = rng.integers(len(COLUMN_NAMES), size=len(rows))
+        columns = COLUMN_NAMES[column_ids]
+        categorical = VALUE_SIZES[column_ids] > 0
+        # One value per row of a categorical column, numeric rows get an empty value
+        # (their size is 0, the clip only keeps their unused lookup inside the table)
+        value_ids = VALUE_OFFSETS[column_ids] + (rng.random(len(rows)) * VALUE_SIZES[column_ids]).astype(np.int64)
+        values = np.where(categorical, VALUE_TABLE[np.minimum(value_ids, len(VALUE_TABLE) - 1)], "")
+
+        if intent == "count":
+            keywords = np.array([keyword.capitalize() for keyword in INTENT_KEYWORDS[intent]], dtype=object)[keyword_ids]
+            queries[rows] = keywords + " of clients with " + columns + np.where(categorical, " = " + values, "")
+        elif intent == "filter":
+            numbers = rng.integers(1, 101, size=len(rows)).astype(str).astype(object)
+            queries[rows] = keywords + " " + columns + " = " + np.where(categorical, values, numbers)
+        else:
+            queries[rows] = keywords + " " + columns
+
+    return pd.DataFrame({"query": queries, "intent": np.array(INTENT_NAMES, dtype=object)[intent_ids]})
+
+
+def _generate_chunk_from_seed(args):
+    seed, n = args
+    return generate_chunk(np.random.default_rng(seed), n)
+
+
+def iter_synthetic_chunks(n, chunk_size=CHUNK_SIZE, seed=42, processes=1):
+    """
+    Yield the corpus chunk by chunk, only a few chunks are ever in memory.
+
+    Every chunk has its own seed spawned from `seed`, so the corpus is the same
+    whatever the number of processes.
+    """
+    sizes = [min(chunk_size, n - start) for start in range(0, n, chunk_size)]
+    tasks = list(zip(np.random.SeedSequence(seed).spawn(len(sizes)), sizes))
+
+    if processes <= 1:
+        for task in tasks:
+            yield _generate_chunk_from_seed(task)
+        return
+
+    with Pool(processes) as pool:
+        # A window of chunks at a time, so a slow writer never lets results pile up
+        window = processes * 2
+        for start in range(0, len(tasks), window):
+            yield from pool.map(_generate_chunk_from_seed, tasks[start:start + window])
+
+
+def write_synthetic_queries(path, n, chunk_size=CHUNK_SIZE, seed=42, processes=1):
+    """
+    Stream a corpus of n labeled queries to a .csv or .parquet file.
+
+    Returns:
+        int: Number of rows written.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    parquet = path.endswith(".parquet")
+    writer = None
+    rows = 0
+    try:
+        for chunk in iter_synthetic_chunks(n, chunk_size, seed, processes):
+            if parquet:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+            else:
+                chunk.to_csv(path, mode="w" if rows == 0 else "a", header=rows == 0, index=False)
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
 def generate_synthetic_queries(n=10000):
     """
     Generate synthetic natural language queries for intent classification.
@@ -93,13 +212,26 @@ def generate_synthetic_queries(n=10000):
     return pd.DataFrame(queries, columns=["query", "intent"])
 
 if __name__ == "__main__":
-    # Ensure the 'data' directory exists to save the output CSV
-    os.makedirs("../Data", exist_ok=True)
+    parser = argparse.ArgumentParser(description="Generate synthetic intent queries")
+    parser.add_argument("--rows", type=int, default=None,
+                        help="Stream this many queries with a fixed seed instead of the default 1000")
+    parser.add_argument("--output", default="../Data/intent_dataset.csv", help=".csv or .parquet")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--processes", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.rows is None:
+        # Ensure the 'data' directory exists to save the output CSV
+        os.makedirs("../Data", exist_ok=True)
 
-    # Generate 1000 synthetic queries
-    df = generate_synthetic_queries(1000)
+        # Generate 1000 synthetic queries
+        df = generate_synthetic_queries(1000)
 
-    # Save the generated dataset to CSV for training/testing intent model
-    df.to_csv("../Data/intent_dataset.csv", index=False)
+        # Save the generated dataset to CSV for training/testing intent model
+        df.to_csv(args.output, index=False)
 
-    print("Generated intent queries saved to data/intent_dataset.csv")
+        print(f"Generated intent queries saved to {args.output}")
+    else:
+        written = write_synthetic_queries(args.output, args.rows, args.chunk_size, args.seed, args.processes)
+        print(f"Generated {written} intent queries to {args.output}")
@@ -0,0 +1,178 @@
+"""
+    Online updates of the intent model from labeled queries.
+
+    Queries are featurized with a HashingVectorizer, which needs no fitting, so new
+    phrasing is folded into an SGDClassifier with partial_fit without going over the
+    whole corpus again. After every update the model is compiled (compiled_model.py)
+    to models/intent_model_online.npz and the classifier state is saved. Both files
+    are written next to their target and swapped in with os.replace; the running
+    service watches the compiled file and swaps the new model in on its next question.
+
+    Run from intent_classifier/:
+        python online_model.py --bootstrap ../Data/intent_dataset.csv
+        python online_model.py --feedback ../Data/feedback.jsonl
+        python online_model.py --feedback ../Data/feedback.jsonl --watch 30
+"""
+import argparse
+import json
+import os
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+
+from compiled_model import export_compiled_model, verify_compiled_model
+from generate_data import INTENT_KEYWORDS
+
+MODELS_DIR = "../models"
+STATE_NAME = "intent_online_state.joblib"
+COMPILED_NAME = "intent_model_online.npz"
+FEEDBACK_PATH = "../Data/feedback.jsonl"
+
+CLASSES = np.array(list(INTENT_KEYWORDS), dtype=object)
+VECTORIZER_PARAMS = {"n_features": 2 ** 18, "ngram_range": (1, 2), "alternate_sign": False, "norm": "l2"}
+# Rows per partial_fit call
+BATCH_SIZE = 10_000
+
+
+def make_vectorizer():
+    # Stateless, the same object can be rebuilt anywhere from the parameters
+    return HashingVectorizer(**VECTORIZER_PARAMS)
+
+
+def load_state(path):
+    if os.path.exists(path):
+        return joblib.load(path)
+    return {
+        "classifier": SGDClassifier(loss="log_loss", alpha=1e-5, random_state=42),
+        # Bytes of the feedback log already folded into the model
+        "feedback_offset": 0,
+        "samples": 0,
+        "updates": 0,
+    }
+
+
+def save_state(state, path):
+    temp_path = f"{path}.tmp"
+    joblib.dump(state, temp_path)
+    os.replace(temp_path, path)
+
+
+def read_feedback(path, offset=0):
+    """
+    Labeled queries appended to a jsonl log since offset.
+
+    A line needs a "query" and an "intent" (or "label") that is one of CLASSES, other
+    lines are skipped. A last line without its newline is still being written and
+    is left for the next read.
+
+    Returns:
+        tuple: (queries, intents, offset after the last complete line)
+    """
+    queries, intents = [], []
+    if not os.path.exists(path):
+        return queries, intents, offset
+
+    with open(path, "rb") as log:
+        log.seek(offset)
+        for line in log:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(record, dict):
+                continue
+            query, intent = record.get("query"), record.get("intent", record.get("label"))
+            if isinstance(query, str) and query.strip() and intent in CLASSES:
+                queries.append(query)
+                intents.append(intent)
+    return queries, intents, offset
+
+
+def partial_update(state, queries, intents):
+    vectorizer = make_vectorizer()
+    queries, intents = list(queries), np.asarray(intents, dtype=object)
+    for start in range(0, len(queries), BATCH_SIZE):
+        state["classifier"].partial_fit(
+            vectorizer.transform(queries[start:start + BATCH_SIZE]),
+            intents[start:start + BATCH_SIZE],
+            classes=CLASSES,
+        )
+    state["samples"] += len(queries)
+    state["updates"] += 1
+
+
+def publish(state, models_dir, check_queries):
+    """
+    Compile the model for the service, then save the state.
+
+    A crash in between folds the same feedback again on the next run, it never loses any.
+    """
+    compiled_path = export_compiled_model(state["classifier"], make_vectorizer(),
+                                          os.path.join(models_dir, COMPILED_NAME))
+    verify_compiled_model(state["classifier"], make_vectorizer(), compiled_path, check_queries)
+    save_state(state, os.path.join(models_dir, STATE_NAME))
+    return compiled_path
+
+
+def bootstrap(csv_path, models_dir=MODELS_DIR, epochs=1, chunk_size=100_000):
+    # Start (or extend) the model from a labeled corpus, read chunk by chunk
+    state = load_state(os.path.join(models_dir, STATE_NAME))
+    check_queries = []
+    for _ in range(epochs):
+        for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+            partial_update(state, chunk["query"].tolist(), chunk["intent"].tolist())
+            check_queries = chunk["query"].head(1000).tolist()
+    return publish(state, models_dir, check_queries)
+
+
+def update_from_feedback(feedback_path=FEEDBACK_PATH, models_dir=MODELS_DIR):
+    """
+    Fold the new lines of the feedback log into the model.
+
+    Returns:
+        int: Number of labeled queries folded in.
+    """
+    state = load_state(os.path.join(models_dir, STATE_NAME))
+    queries, intents, offset = read_feedback(feedback_path, state["feedback_offset"])
+    if not queries:
+        if offset != state["feedback_offset"]:
+            state["feedback_offset"] = offset
+            save_state(state, os.path.join(models_dir, STATE_NAME))
+        return 0
+    if not state["samples"]:
+        raise ValueError("The online model has no data yet, run it with --bootstrap first")
+
+    partial_update(state, queries, intents)
+    state["feedback_offset"] = offset
+    publish(state, models_dir, queries)
+    return len(queries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Update the online intent model")
+    parser.add_argument("--bootstrap", help="Labeled CSV (query, intent) to start the model from")
+    parser.add_argument("--epochs", type=int, default=1)
+    parser.add_argument("--feedback", default=FEEDBACK_PATH, help="jsonl log of labeled queries")
+    parser.add_argument("--watch", type=float, default=0, help="Check the log again every N seconds")
+    args = parser.parse_args()
+
+    if args.bootstrap:
+        start = time.perf_counter()
+        path = bootstrap(args.bootstrap, epochs=args.epochs)
+        print(f"Bootstrapped {path} in {time.perf_counter() - start:.2f} s")
+
+    while True:
+        start = time.perf_counter()
+        folded = update_from_feedback(args.feedback)
+        if folded:
+            print(f"Folded {folded} labeled queries in {time.perf_counter() - start:.2f} s")
+        if not args.watch:
+            break
+        time.sleep(args.watch)
@@ -1,12 +1,18 @@
 import os
-import joblib
+
+from compiled_model import load_compiled_model
 
 MODELS_DIR = "../models"
 MODEL_PATH = os.path.join(MODELS_DIR, "clf_folded.joblib")
 VECTORIZER_PATH = os.path.join(MODELS_DIR, "vectorizer_folded.joblib")
+COMPILED_MODEL_PATH = os.path.join(MODELS_DIR, "intent_model_folded.npz")
 
-clf = joblib.load(MODEL_PATH)
-vectorizer = joblib.load(VECTORIZER_PATH)
+if os.path.exists(COMPILED_MODEL_PATH):
+    clf, vectorizer = load_compiled_model(COMPILED_MODEL_PATH)
+else:
+    import joblib
+    clf = joblib.load(MODEL_PATH)
+    vectorizer = joblib.load(VECTORIZER_PATH)
 
 def predict_intent(query: str) -> str:
     query_vec = vectorizer.transform([query])
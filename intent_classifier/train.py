@@ -8,45 +8,113 @@ from sklearn.metrics import classification_report
 import joblib
 from sklearn.model_selection import StratifiedKFold
 import numpy as np
+import argparse
+import itertools
+import time
+from joblib import Memory, Parallel, delayed
+
+from compiled_model import export_compiled_model, verify_compiled_model
 
 # Paths for data and saved models
 DATA_PATH = "../Data/intent_dataset.csv"
 MODELS_DIR = "../models"
+# Fold features are cached on disk and reused by every classifier setting and later runs
+FEATURE_CACHE_DIR = "../Data/.cache/features"
+
+# Settings tried by the k-fold search, every combination of the two grids
+VECTORIZER_GRID = {"ngram_range": [(1, 1), (1, 2)], "sublinear_tf": [False, True]}
+CLASSIFIER_GRID = {"C": [0.1, 1.0, 10.0]}
+
+
+def expand_grid(grid):
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def featurize(X_train, X_test, vectorizer_params):
+    vectorizer = TfidfVectorizer(**vectorizer_params)
+    return vectorizer.fit_transform(X_train), vectorizer.transform(X_test)
+
+
+def evaluate_fold(featurize_cached, X, y, train_index, test_index, vectorizer_params, classifier_grid):
+    """
+    Score every classifier setting on one fold, all from one featurization of the fold.
+
+    Returns:
+        tuple: (vectorizer params, [(classifier params, macro F1)], featurize seconds, fit seconds)
+    """
+    start = time.perf_counter()
+    X_train, X_test = featurize_cached(X[train_index], X[test_index], vectorizer_params)
+    featurize_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scores = []
+    for classifier_params in classifier_grid:
+        clf = LogisticRegression(random_state=42, max_iter=500, **classifier_params)
+        clf.fit(X_train, y[train_index])
+        report = classification_report(y[test_index], clf.predict(X_test), output_dict=True, zero_division=0)
+        scores.append((classifier_params, report["macro avg"]["f1-score"]))
+    return vectorizer_params, scores, featurize_seconds, time.perf_counter() - start
+
+
+def grid_search(X, y, n_splits, n_jobs=-1):
+    """
+    Run every (vectorizer setting, fold) pair in parallel.
 
-def train(use_k_fold = False, n_splits = 0):
+    Returns:
+        tuple: ({(vectorizer params, classifier params): [macro F1 per fold]}, stage timings)
+    """
+    folds = list(StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=42).split(X, y))
+    featurize_cached = Memory(FEATURE_CACHE_DIR, verbose=0).cache(featurize)
+    classifier_grid = expand_grid(CLASSIFIER_GRID)
+
+    start = time.perf_counter()
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(evaluate_fold)(featurize_cached, X, y, train_index, test_index, vectorizer_params, classifier_grid)
+        for vectorizer_params in expand_grid(VECTORIZER_GRID)
+        for train_index, test_index in folds
+    )
+    timings = {"grid search (wall)": time.perf_counter() - start}
+
+    scores = {}
+    for vectorizer_params, fold_scores, _, _ in results:
+        for classifier_params, f1 in fold_scores:
+            key = (tuple(sorted(vectorizer_params.items())), tuple(sorted(classifier_params.items())))
+            scores.setdefault(key, []).append(f1)
+    timings["featurize (summed over workers)"] = sum(result[2] for result in results)
+    timings["fit + score (summed over workers)"] = sum(result[3] for result in results)
+    return scores, timings
+
+def train(use_k_fold = False, n_splits = 0, n_jobs = -1):
+    timings = {}
+    start = time.perf_counter()
     # Load dataset containing text queries and their intent labels
     df = pd.read_csv(DATA_PATH)
     df = df.drop_duplicates(subset=["query", "intent"])
     X, y = df["query"], df["intent"]
+    timings["load"] = time.perf_counter() - start
 
     if use_k_fold and n_splits > 0:
         X, y = X.to_numpy(), y.to_numpy()
-        skf = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=42)
-        fold = 1
-        reports = []
-        for train_index, test_index in skf.split(X, y):
-            print(f"\n Fold {fold}")
-            X_train, X_test = X[train_index], X[test_index]
-            y_train, y_test = y[train_index], y[test_index]
-
-            vectorizer = TfidfVectorizer()
-            X_train = vectorizer.fit_transform(X_train)
-            X_test = vectorizer.transform(X_test)
-
-            clf = LogisticRegression(random_state=42, max_iter=500)
-            clf.fit(X_train, y_train)
-            y_pred = clf.predict(X_test)
-
-            report = classification_report(y_test, y_pred, output_dict=True)
-            reports.append(report)
-            print(classification_report(y_test, y_pred))
-
-            fold += 1
-
-        macro_f1s = [rep["macro avg"]["f1-score"] for rep in reports]
-        print(f"\n✅ Average Macro F1-Score over {n_splits} folds: {np.mean(macro_f1s):.4f}")
+        scores, stage_timings = grid_search(X, y, n_splits, n_jobs)
+        timings.update(stage_timings)
+
+        print(f"\nMacro F1-Score over {n_splits} folds")
+        ranked = sorted(scores.items(), key=lambda item: np.mean(item[1]), reverse=True)
+        for (vectorizer_params, classifier_params), f1s in ranked:
+            print(f"  {np.mean(f1s):.4f} +/- {np.std(f1s):.4f}  {dict(vectorizer_params)} {dict(classifier_params)}")
+        (vectorizer_params, classifier_params), best_f1s = ranked[0]
+        print(f"\n✅ Average Macro F1-Score over {n_splits} folds: {np.mean(best_f1s):.4f}")
+
+        # The best setting is refit on all the data
+        start = time.perf_counter()
+        vectorizer = TfidfVectorizer(**dict(vectorizer_params))
+        clf = LogisticRegression(random_state=42, max_iter=500, **dict(classifier_params))
+        clf.fit(vectorizer.fit_transform(X), y)
+        timings["refit best"] = time.perf_counter() - start
         model_name = "clf_folded.joblib"
         vector_name = 'vectorizer_folded.joblib'
+        compiled_name = "intent_model_folded.npz"
 
     else:
         # Split data into training and testing sets (80% train, 20% test)
@@ -71,12 +139,44 @@ def train(use_k_fold = False, n_splits = 0):
         # Save the model and vectorizer for later use
         model_name = "clf.joblib"
         vector_name = 'vectorizer.joblib'
+        compiled_name = "intent_model.npz"
 
+    start = time.perf_counter()
     os.makedirs(MODELS_DIR, exist_ok=True)
     joblib.dump(clf, os.path.join(MODELS_DIR, model_name))
     # joblib.dump(random_forest, os.path.join(MODELS_DIR, "random_forest.joblib"))
     joblib.dump(vectorizer, os.path.join(MODELS_DIR, vector_name))
-print(f"Saved model and vectorizer to {MODELS_DIR}")
+    # NumPy only copy of the same model, used for serving
+    compiled_path = export_compiled_model(clf, vectorizer, os.path.join(MODELS_DIR, compiled_name))
+    verify_compiled_model(clf, vectorizer, compiled_path, df["query"])
+    timings["save + compile"] = time.perf_counter() - start
+    print(f"Saved model and vectorizer to {MODELS_DIR}")
+
+    print("\nWall time per stage")
+    for stage, seconds in timings.items():
+        print(f"  {stage:<36} {seconds:8.2f} s")
+    return timings
+
+
+def compile_existing(model_name="clf_folded.joblib", vector_name="vectorizer_folded.joblib",
+                     compiled_name="intent_model_folded.npz"):
+    # Compile an already trained model without training again
+    clf = joblib.load(os.path.join(MODELS_DIR, model_name))
+    vectorizer = joblib.load(os.path.join(MODELS_DIR, vector_name))
+    compiled_path = export_compiled_model(clf, vectorizer, os.path.join(MODELS_DIR, compiled_name))
+    verify_compiled_model(clf, vectorizer, compiled_path, pd.read_csv(DATA_PATH)["query"])
+    print(f"Compiled {model_name} + {vector_name} to {compiled_path}")
+
 
 if __name__ == "__main__":
-    train(n_splits=10, use_k_fold=True)
+    parser = argparse.ArgumentParser(description="Train the intent classifier")
+    parser.add_argument("--compile-only", action="store_true",
+                        help="Compile the saved k-fold model to NumPy instead of training")
+    parser.add_argument("--folds", type=int, default=10)
+    parser.add_argument("--jobs", type=int, default=-1, help="Parallel workers of the k-fold search, -1 = all cores")
+    args = parser.parse_args()
+
+    if args.compile_only:
+        compile_existing()
+    else:
+        train(n_splits=args.folds, use_k_fold=True, n_jobs=args.jobs)
@@ -0,0 +1,306 @@
+"""
+    Headless HTTP/JSON query server, the same answers as app.py for other services.
+
+    Endpoints:
+        POST /query   {"query": "..."}          -> answer of one question
+        POST /batch   {"queries": ["...", ...]} -> one answer per question
+        POST /feedback {"query": "...", "intent": "..."} -> labeled query for the online model
+        GET  /health                            -> 200 once the data set and model are loaded
+        GET  /stats                             -> request counters, result cache and latency stats
+        GET  /metrics                           -> stage latency histograms, Prometheus text format
+
+    The data set, indexes and model come from the resource registry and are shared
+    read-only by all requests. The pandas work runs on a bounded thread pool, or with
+    --processes on worker processes attached to a shared memory copy of the data set; once
+    SERVER_MAX_PENDING requests are accepted, new ones get 503 right away, and a
+    request taking longer than SERVER_REQUEST_TIMEOUT_S gets 504.
+
+    Feedback lines are appended to FEEDBACK_LOG_PATH; intent_classifier/online_model.py
+    folds them into the model and the registry swaps the new model in.
+
+    Run from the project root:
+        python server.py --port 8080
+        python server.py --profile-slow     # sample the stacks of slow questions
+"""
+import argparse
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from http import HTTPStatus
+
+import pandas as pd
+
+import constants
+from Services.metrics_services import metrics
+from Services.resource_registry import registry
+from Services.shared_memory_services import SharedWorkerPool
+from Usecases.query_processing import QueryProcessingUseCase
+from Usecases.resources import build_nlp_services, register_resources, warm_up
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def to_json_value(result, max_rows):
+    # Tables are cut to max_rows, the full row count is sent along
+    if isinstance(result, pd.Series):
+        result = result.to_frame()
+    if isinstance(result, pd.DataFrame):
+        return {
+            "row_count": len(result),
+            "columns": [str(column) for column in result.columns],
+            "rows": json.loads(result.head(max_rows).to_json(orient="values", date_format="iso")),
+        }
+    if hasattr(result, "item"):
+        return result.item()
+    return result
+
+
+class QueryServer:
+    def __init__(self, file_path, zip_file_name, csv_file_name, workers=None, max_pending=None,
+                 request_timeout=None, resource_registry=registry, processes=0):
+        self.file_path = file_path
+        self.zip_file_name = zip_file_name
+        self.csv_file_name = csv_file_name
+        self.resource_registry = resource_registry
+        self.max_pending = max_pending or constants.SERVER_MAX_PENDING
+        self.request_timeout = request_timeout or constants.SERVER_REQUEST_TIMEOUT_S
+        self.executor = ThreadPoolExecutor(max_workers=workers or constants.SERVER_WORKERS,
+                                           thread_name_prefix="query")
+        # With processes > 0 the intents run on worker processes sharing the data set
+        self.processes = processes
+        self.worker_pool = None
+        self.ready = False
+        # Only touched from the event loop thread, no lock needed
+        self.pending = 0
+        self.served = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.feedback = 0
+
+    async def start(self, host, port):
+        loop = asyncio.get_running_loop()
+        register_resources(
+            file_path=self.file_path,
+            zip_file_name=self.zip_file_name,
+            csv_file_name=self.csv_file_name,
+            resource_registry=self.resource_registry,
+        )
+        # Loaded before the first request is accepted, not by it
+        await loop.run_in_executor(self.executor, warm_up, self.resource_registry)
+        if self.processes:
+            resources = self.resource_registry
+            self.worker_pool = await loop.run_in_executor(
+                self.executor, SharedWorkerPool, resources.get("dataset"), self.processes,
+                resources.get("stats_index"), resources.get("filter_index"))
+        self.ready = True
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    def answer(self, queries):
+        """
+        Answer the questions, runs on a worker thread.
+        """
+        resources = self.resource_registry
+        use_case = QueryProcessingUseCase(
+            nlp_service=build_nlp_services(resources),
+            dataframe=resources.get("dataset"),
+            stats_index=resources.get("stats_index"),
+            filter_index=resources.get("filter_index"),
+            groupby_service=resources.get("groupby_service"),
+            result_cache=resources.get("result_cache"),
+            worker_pool=self.worker_pool,
+        )
+        answers = []
+        for answer in use_case.execute_many(queries):
+            intent = dict(answer["intent"])
+            intent["filters"] = str(intent["filters"]) if intent.get("filters") is not None else None
+            answers.append({
+                "query": answer["query"],
+                "intent": intent,
+                "result": to_json_value(answer["result"], constants.SERVER_RESULT_ROWS),
+                "error": answer["error"],
+            })
+        return answers
+
+    def _release(self, _future):
+        self.pending -= 1
+
+    async def run_in_worker(self, func, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "Server is busy, retry later")
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, func, *args)
+        # A timed out request keeps its slot until its thread is really done
+        self.pending += 1
+        future.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.request_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise HTTPError(HTTPStatus.GATEWAY_TIMEOUT, f"Query took longer than {self.request_timeout}s")
+
+    def record_feedback(self, payload):
+        query, intent = payload.get("query"), payload.get("intent")
+        if not isinstance(query, str) or not query.strip() or intent not in constants.INTENT_KEYWORDS:
+            raise HTTPError(HTTPStatus.BAD_REQUEST,
+                            f"Expected a 'query' string and an 'intent' in {list(constants.INTENT_KEYWORDS)}")
+        # One write per line, appends from several servers do not interleave
+        line = json.dumps({"query": query, "intent": intent}) + "\n"
+        with open(constants.FEEDBACK_LOG_PATH, "a", encoding="utf-8") as log:
+            log.write(line)
+        self.feedback += 1
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "pending": self.pending,
+            "served": self.served,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "feedback": self.feedback,
+            "result_cache": self.resource_registry.get("result_cache").stats() if self.ready else None,
+            "latency": metrics.to_dict(),
+        }
+
+    async def dispatch(self, method, path, body):
+        """
+        Route one request.
+
+        Returns:
+            tuple: (HTTPStatus, JSON payload)
+        """
+        try:
+            if path == "/health":
+                return (HTTPStatus.OK, {"status": "ok"}) if self.ready else \
+                    (HTTPStatus.SERVICE_UNAVAILABLE, {"status": "loading"})
+            if path == "/stats":
+                return HTTPStatus.OK, self.stats()
+            if path == "/metrics":
+                return HTTPStatus.OK, metrics.to_prometheus()
+            if path not in ("/query", "/batch", "/feedback"):
+                raise HTTPError(HTTPStatus.NOT_FOUND, f"Unknown path '{path}'")
+            if method != "POST":
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, f"Use POST for {path}")
+            if not self.ready:
+                raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "Data set is still loading")
+
+            try:
+                payload = json.loads(body or b"{}")
+            except ValueError:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Body must be JSON")
+            if not isinstance(payload, dict):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Body must be a JSON object")
+            if path == "/feedback":
+                self.record_feedback(payload)
+                return HTTPStatus.ACCEPTED, {"status": "recorded"}
+            queries = [payload.get("query")] if path == "/query" else payload.get("queries")
+            if not isinstance(queries, list) or not queries or \
+                    not all(isinstance(query, str) and query.strip() for query in queries):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Expected a non empty 'query' string or 'queries' list")
+
+            answers = await self.run_in_worker(self.answer, queries)
+            self.served += 1
+            return HTTPStatus.OK, answers[0] if path == "/query" else answers
+        except HTTPError as e:
+            return e.status, {"error": str(e)}
+        except Exception as e:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"{type(e).__name__}: {e}"}
+
+    async def handle_connection(self, reader, writer):
+        # HTTP/1.1 with keep-alive, one request at a time per connection
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), constants.SERVER_IDLE_TIMEOUT_S)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+                    break
+
+                request_line, *header_lines = head.decode("latin-1").rstrip("\r\n").split("\r\n")
+                try:
+                    method, target, version = request_line.split(" ", 2)
+                    headers = {}
+                    for line in header_lines:
+                        name, _, value = line.partition(":")
+                        headers[name.strip().lower()] = value.strip()
+                    length = int(headers.get("content-length", 0))
+                except ValueError:
+                    await self.write_response(writer, HTTPStatus.BAD_REQUEST, {"error": "Malformed request"}, False)
+                    break
+                if length > constants.SERVER_MAX_BODY_BYTES:
+                    await self.write_response(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                              {"error": "Request body is too large"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, payload = await self.dispatch(method.upper(), target.split("?", 1)[0], body)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self.write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+            with suppress(ConnectionError):
+                await writer.wait_closed()
+
+    @staticmethod
+    async def write_response(writer, status, payload, keep_alive):
+        # Text payloads (/metrics) are sent as they are, the rest as JSON
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(payload, default=str).encode(), "application/json"
+        head = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        )
+        if status == HTTPStatus.SERVICE_UNAVAILABLE:
+            head += "Retry-After: 1\r\n"
+        writer.write(head.encode() + b"\r\n" + body)
+        await writer.drain()
+
+
+async def main(host, port, workers, processes=0, profile_slow=False):
+    if profile_slow:
+        metrics.enable_profiler()
+    query_server = QueryServer(
+        file_path="./Data",
+        zip_file_name="bank+marketing.zip",
+        csv_file_name="bank-full.csv",
+        workers=workers,
+        processes=processes,
+    )
+    server = await query_server.start(host, port)
+    print(f"Serving on http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        query_server.executor.shutdown(wait=False, cancel_futures=True)
+        if query_server.worker_pool is not None:
+            query_server.worker_pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default=constants.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=constants.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=constants.SERVER_WORKERS)
+    parser.add_argument("--processes", type=int, default=0,
+                        help="Worker processes sharing the data set through shared memory, 0 to run in threads")
+    parser.add_argument("--profile-slow", action="store_true",
+                        help=f"Sample the stacks of questions slower than {constants.SLOW_QUERY_MS} ms")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    with suppress(KeyboardInterrupt):
+        asyncio.run(main(args.host, args.port, args.workers, args.processes, args.profile_slow))